@@ -0,0 +1,305 @@
+#################################
+# Author: Po-Hsun Lin
+#################################
+import sys
+import os
+import json
+import random
+import selectors
+import signal
+import socket
+import subprocess
+import time
+import types
+from auc_protocol import *
+
+def percentile(samples, p) -> float:
+    ###########################
+    # p-th percentile (nearest rank) of a list of samples, None if empty
+    ###########################
+    if not samples:
+        return None
+    samples = sorted(samples)
+    return samples[min(len(samples) - 1, max(0, int(round(p / 100 * len(samples))) - 1))]
+
+def proc_status(pid) -> tuple:
+    ###########################
+    # (peak rss in KiB, thread count) of a process and its child processes (workers) from /proc,
+    # (None, None) if not available
+    ###########################
+    try:
+        with open(f"/proc/{pid}/task/{pid}/children") as f:
+            pids = [pid] + [int(child) for child in f.read().split()]
+        rss, threads = 0, 0
+        for p in pids:
+            with open(f"/proc/{p}/status") as f:
+                fields = dict(line.split(":", 1) for line in f if ":" in line)
+            rss += int(fields["VmHWM"].split()[0])
+            threads += int(fields["Threads"])
+        return rss, threads
+    except (OSError, KeyError, ValueError):
+        return None, None
+
+class LoadGenerator():
+    def __init__(self, host, port, auctions=50, buyers=3, concurrency=10, auction_type=2, seed=1, burst=200, timeout=60):
+        ###########################
+        # scripted sellers and buyers driven by one selectors loop (non-blocking sockets)
+        # every auction: a seller opens "<auction_type> 1 <buyers> item<i>", then <buyers> buyers
+        # join it by item name and bid a seeded random price
+        # before the auctions, <burst> probes connect at once and leave after the greeting (accept rate)
+        # variables
+        # auctions:             number of auctions to run
+        # buyers:               buyers per auction (1-9)
+        # concurrency:          auctions in flight at the same time
+        # burst:                connections opened at once to measure the accept rate
+        # probes:               probes still connected
+        # accepted:             probes that got the greeting
+        # accept_span:          seconds from opening the burst to the last probe's greeting
+        # rand:                 seeded random generator, same bids for the same seed
+        # started/finished:     auctions started / finished so far
+        # connect_times:        seconds from connect to the server's greeting, per connection
+        # bid_latencies:        seconds from sending a bid to "Bid recieved", per bid
+        # completion_times:     seconds from "Auction start" to "Auction Finished!", per auction
+        # errors:               connections closed before their script finished
+        # timeout:              seconds allowed for the burst and for the auctions,
+        #                       connections still open afterwards count as errors
+        ############################
+        self.addr = (host, port)
+        self.auctions = auctions
+        self.buyers = buyers
+        self.concurrency = concurrency
+        self.burst = burst
+        self.probes = 0
+        self.accepted = 0
+        self.burst_start = None
+        self.accept_span = None
+        self.auction_type = auction_type
+        self.rand = random.Random(seed)
+        self.sel = selectors.DefaultSelector()
+        self.started = 0
+        self.finished = 0
+        self.connect_times = []
+        self.bid_latencies = []
+        self.completion_times = []
+        self.errors = 0
+        self.timeout = timeout
+
+    def connect(self, role, auction):
+        ###########################
+        # open a non-blocking connection of a scripted participant
+        ###########################
+        sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        sock.setblocking(False)
+        sock.connect_ex(self.addr)
+        now = time.time()
+        data = types.SimpleNamespace(role = role, auction = auction, inb = MessageBuffer(), prompts = 0,
+                                     connect_time = now, bid_time = None, open_time = None, done = False)
+        self.sel.register(sock, selectors.EVENT_READ, data = data)
+
+    def start_auction(self):
+        self.connect("seller", self.started)
+        self.started += 1
+
+    def run(self, monitor=None) -> float:
+        ###########################
+        # run every auction, monitor() is called about every 50 ms (e.g. to sample the server)
+        # return the elapsed time in seconds
+        ###########################
+        bgn = self.burst_start = time.time()
+        for i in range(self.burst):
+            self.connect("probe", -1)
+        self.probes = self.burst
+        deadline = bgn + self.timeout
+        while self.probes > 0 and time.time() < deadline:
+            for key, mask in self.sel.select(timeout = 0.05):
+                self.service_connection(key)
+            if monitor is not None:
+                monitor()
+        self.abort()
+        while self.started < min(self.concurrency, self.auctions):
+            self.start_auction()
+        deadline = time.time() + self.timeout
+        # after the last seller is done its buyers still have to get their goodbye
+        while (self.finished < self.auctions or self.sel.get_map()) and time.time() < deadline:
+            for key, mask in self.sel.select(timeout = 0.05):
+                self.service_connection(key)
+            if monitor is not None:
+                monitor()
+        self.abort()
+        self.sel.close()
+        return time.time() - bgn
+
+    def abort(self):
+        ###########################
+        # close every connection still open after a timeout (errors)
+        ###########################
+        for key in list(self.sel.get_map().values()):
+            self.close(key.fileobj, key.data, error = True, restart = False)
+
+    def service_connection(self, key):
+        ###########################
+        # handle every message of a read and answer prompts with the script
+        ###########################
+        sock, data = key.fileobj, key.data
+        try:
+            recv_data = sock.recv(4096)
+        except (BlockingIOError, InterruptedError):
+            return
+        except OSError:
+            recv_data = b""
+        if not recv_data:
+            self.close(sock, data, error = not data.done)
+            return
+        now = time.time()
+        for type, text in data.inb.feed(recv_data):
+            if type == MSG_PROMPT:
+                data.prompts += 1
+                if data.prompts == 1:
+                    self.connect_times.append(now - data.connect_time)
+                    if data.role == "probe":
+                        self.accepted += 1
+                        self.accept_span = now - self.burst_start
+                        data.done = True
+                        self.close(sock, data)
+                        return
+                    self.send(sock, self.request(data))
+                elif data.role == "buyer" and "submit your bid" in text:
+                    data.bid_time = now
+                    self.send(sock, str(self.rand.randint(1, 1000)))
+            elif data.role == "seller" and text.startswith("Your Role is: [Seller]"):
+                data.open_time = now
+                for i in range(self.buyers):
+                    self.connect("buyer", data.auction)
+            elif data.role == "buyer" and text.startswith("Server: Bid recieved") and data.bid_time is not None:
+                self.bid_latencies.append(now - data.bid_time)
+            elif data.role == "seller" and text == "Auction Finished!":
+                self.completion_times.append(now - data.open_time)
+            elif type == MSG_BYE:
+                data.done = True
+                self.close(sock, data)
+                return
+
+    def request(self, data) -> str:
+        ###########################
+        # first answer of a participant: action request (seller) or join request (buyer)
+        ###########################
+        if data.role == "seller":
+            return f"{self.auction_type} 1 {self.buyers} item{data.auction}"
+        return f"join item{data.auction}"
+
+    def send(self, sock, text):
+        try:
+            sock.sendall(pack_msg(MSG_REQUEST, text))
+        except OSError:
+            pass
+
+    def close(self, sock, data, error=False, restart=True):
+        ###########################
+        # close a participant, a finished seller lets the next auction start (restart)
+        ###########################
+        self.sel.unregister(sock)
+        sock.close()
+        self.errors += 1 if error else 0
+        if data.role == "probe":
+            self.probes -= 1
+        elif data.role == "seller":
+            self.finished += 1
+            if restart and self.started < self.auctions:
+                self.start_auction()
+
+    def report(self, elapsed) -> dict:
+        ###########################
+        # summary of the run
+        ###########################
+        ms = lambda x: None if x is None else round(x * 1000, 3)
+        return {
+            "auctions": self.auctions, "buyers": self.buyers, "concurrency": self.concurrency,
+            "elapsed_s": round(elapsed, 3),
+            "connections": len(self.connect_times),
+            "burst": self.burst,
+            "accepted": self.accepted,
+            "accept_rate_per_s": round(self.accepted / self.accept_span, 1) if self.accept_span else None,
+            "connect_ms": {p: ms(percentile(self.connect_times, p)) for p in (50, 90, 99)},
+            "bids": len(self.bid_latencies),
+            "bid_ack_ms": {p: ms(percentile(self.bid_latencies, p)) for p in (50, 90, 99, 100)},
+            "auction_completion_ms": {p: ms(percentile(self.completion_times, p)) for p in (50, 90, 99, 100)},
+            "errors": self.errors,
+        }
+
+def parse_options(argv) -> tuple:
+    ###########################
+    # split command line into positional arguments and --key=value options
+    # options:
+    #   --engine=threaded|selectors     engine of the server under test
+    #   --workers=N                     worker processes of the server under test (N > 1: sharded selectors engine)
+    #   --journal=PATH                  the server under test journals the auctions to PATH (removed first)
+    #   --auctions=N                    number of auctions
+    #   --buyers=N                      buyers per auction (1-9)
+    #   --concurrency=N                 auctions in flight at the same time
+    #   --type=1|2                      auction type
+    #   --seed=N                        seed of the bids
+    #   --burst=N                       connections opened at once to measure the accept rate
+    #   --timeout=SEC                   time allowed for the burst and for the auctions
+    #   --json=PATH                     also write the report to PATH
+    ###########################
+    args, opts = [], {"engine": "threaded", "workers": "1", "journal": "", "auctions": "50", "buyers": "3", "concurrency": "10", "type": "2",
+                      "seed": "1", "burst": "200", "timeout": "60", "json": ""}
+    for arg in argv:
+        if arg.startswith("--") and "=" in arg:
+            key, value = arg[2:].split("=", 1)
+            opts[key.replace("-", "_")] = value
+        else:
+            args.append(arg)
+    return args, opts
+
+if __name__ == "__main__":
+    args, opts = parse_options(sys.argv[1:])
+    # check input format
+    if len(args) != 1 or not args[0].isdigit() or opts["engine"] not in ("threaded", "selectors") or not opts["workers"].isdigit() \
+            or not opts["buyers"].isdigit() or not 1 <= int(opts["buyers"]) <= 9:
+        print(f"Usage: {sys.argv[0]} <port>")
+        print("Options: --engine=threaded|selectors --workers=<N> --journal=<path> --auctions=<N> --buyers=<1-9> --concurrency=<N> --type=1|2 --seed=<N> --burst=<N> --timeout=<sec> --json=<path>")
+        sys.exit(1)
+    port = int(args[0])
+    # start a local server instance, with an empty journal
+    server_args = [f"--engine={opts['engine']}", f"--workers={opts['workers']}"]
+    if opts["journal"]:
+        for name in os.listdir(os.path.dirname(os.path.abspath(opts["journal"]))):
+            if name.startswith(os.path.basename(opts["journal"]) + "."):
+                os.remove(os.path.join(os.path.dirname(os.path.abspath(opts["journal"])), name))
+        if os.path.exists(opts["journal"]):
+            os.remove(opts["journal"])
+        server_args.append(f"--journal={opts['journal']}")
+    # the server gets a process group of its own, so its worker processes are stopped with it
+    server = subprocess.Popen([sys.executable, os.path.join(os.path.dirname(os.path.abspath(__file__)), "auc_server_rdt.py"),
+                               "127.0.0.1", str(port)] + server_args, stdout = subprocess.DEVNULL, start_new_session = True)
+    time.sleep(0.5)
+    peak = {"rss_kib": None, "threads": None}
+    def monitor():
+        rss, threads = proc_status(server.pid)
+        if rss is not None:
+            peak["rss_kib"] = max(peak["rss_kib"] or 0, rss)
+            peak["threads"] = max(peak["threads"] or 0, threads)
+    try:
+        generator = LoadGenerator("127.0.0.1", port, int(opts["auctions"]), int(opts["buyers"]), int(opts["concurrency"]),
+                                  int(opts["type"]), int(opts["seed"]), int(opts["burst"]), float(opts["timeout"]))
+        elapsed = generator.run(monitor)
+        monitor()
+    finally:
+        os.killpg(server.pid, signal.SIGTERM)
+        server.wait()
+    report = generator.report(elapsed)
+    # more than one worker always runs the sharded selectors engine
+    report["engine"] = opts["engine"] if int(opts["workers"]) <= 1 else "selectors"
+    report["workers"] = int(opts["workers"])
+    report["server_peak_rss_kib"] = peak["rss_kib"]
+    report["server_peak_threads"] = peak["threads"]
+    print(f"Engine: {report['engine']} x {report['workers']} workers, {report['auctions']} auctions x {report['buyers']} buyers, concurrency {report['concurrency']}")
+    print(f"Finished in {report['elapsed_s']} s, {report['errors']} errors")
+    print(f"Accept rate: {report['accept_rate_per_s']} conn/s ({report['accepted']} of {report['burst']} opened at once), connect latency (ms) over {report['connections']} connections {report['connect_ms']}")
+    print(f"Bid-to-ack latency (ms) over {report['bids']} bids: {report['bid_ack_ms']}")
+    print(f"Auction completion (ms): {report['auction_completion_ms']}")
+    print(f"Server peak RSS: {report['server_peak_rss_kib']} KiB, peak threads: {report['server_peak_threads']}")
+    if opts["json"]:
+        with open(opts["json"], "w") as f:
+            json.dump(report, f, indent = 2)
@@ -2,11 +2,83 @@
 # Author: Po-Hsun Lin
 #################################
 import sys
+import os
+import mmap
 import socket
 import selectors
+import asyncio
+import inspect
 import types
 import random
+import multiprocessing
+import fcntl
+from collections import deque
+import struct
 import time
+import zlib
+import lzma
+import hashlib
+import copy
+import heapq
+import threading
+import json
+from auc_protocol import *
+
+###########################
+# rdt packet header (network byte order, 18 bytes)
+# version:      header version (RDT_VERSION)
+# type:         0 control message, 1 file content, 2 ack
+# seq:          sequence number (32 bit)
+# ack:          ack number (32 bit), cumulative ack in gbn/sr
+# window:       receive window in packets (acks only)
+# length:       payload length in byte
+# checksum:     CRC-32 of the header fields above and the payload
+###########################
+RDT_VERSION = 2
+TYPE_CTRL, TYPE_DATA, TYPE_ACK = 0, 1, 2
+HEADER = struct.Struct("!BBIIHHI")
+CHECKED = struct.Struct("!BBIIHH")
+
+def pack_header(type, seq, payload, ack, window) -> bytes:
+    ###########################
+    # pack the header of a packet, checksum covers the other header fields and payload
+    ###########################
+    fields = CHECKED.pack(RDT_VERSION, type, seq, ack, window, len(payload))
+    return fields + struct.pack("!I", zlib.crc32(payload, zlib.crc32(fields)))
+
+def make_pkt(type, seq, payload=b"", ack=0, window=0) -> bytes:
+    ###########################
+    # build a packet: binary header followed by payload
+    ###########################
+    return pack_header(type, seq, payload, ack, window) + payload
+
+def send_pkt(sock, addr, type, seq, payload=b"", ack=0, window=0):
+    ###########################
+    # send a packet without copying payload into a new buffer
+    # header and payload (e.g. memoryview of the mapped file) go out as scatter-gather buffers
+    ###########################
+    header = pack_header(type, seq, payload, ack, window)
+    if hasattr(sock, "sendmsg"):
+        sock.sendmsg([header, payload], [], 0, addr)
+    else:
+        sock.sendto(header + payload, addr)
+
+def unpack_pkt(datagram) -> tuple:
+    ###########################
+    # parse a packet into (type, seq, ack, window, payload)
+    # payload is a memoryview into datagram (no copy)
+    # raise HeaderError if the packet is truncated or has another version
+    # raise ChecksumError if the packet was corrupted
+    ###########################
+    if len(datagram) < HEADER.size:
+        raise HeaderError
+    version, type, seq, ack, window, length, checksum = HEADER.unpack_from(datagram)
+    if version != RDT_VERSION or len(datagram) < HEADER.size + length:
+        raise HeaderError
+    payload = memoryview(datagram)[HEADER.size:HEADER.size + length]
+    if zlib.crc32(payload, zlib.crc32(memoryview(datagram)[:CHECKED.size])) != checksum:
+        raise ChecksumError
+    return type, seq, ack, window, payload
 
 class Error(Exception):
     # base class for custom exception
@@ -24,30 +96,61 @@ class IPMisMatch(Error):
     # raise when IP is not matched
     pass
 
+class HeaderError(Error):
+    # raise when packet header is malformed
+    pass
+
+class ChecksumError(Error):
+    # raise when packet checksum is not matched
+    pass
+
 class Client():
-    def __init__(self, host, port):
+    def __init__(self, host, port, answer=None, sel=None, echo=True, upload_kwargs=None):
         ###########################
         # host : server ip address
         # port : server port
         # state: 0->pass 1:->Seller(UDP Client) 2:->Server(UDP Server) 3:->auction finished
+        # answer: answer(prompt) -> str called for every prompt (e.g. scripted(), or keyboard() for the user's input),
+        #         None (or an answer of None) means the answer is given later with reply()
+        # sel:   selector shared by many clients (run_clients), the client has its own otherwise
+        # echo:  print the server's messages
+        # upload_kwargs: UDPClient options of the item upload when the Auctioneer relays the item (no packet loss by default)
+        # uploader: thread of the item upload, None if there is none
+        # sock:  tcp socket, None once closed
+        # outb:  framed requests waiting for the socket to become writable
+        # transcript: every (message type, text) received
+        # prompts: prompts waiting for reply(), oldest first
         ###########################
         self.host = host
         self.port = port
-        self.sel = selectors.DefaultSelector()
+        self.sel = sel if sel is not None else selectors.DefaultSelector()
         self.state = 0
         self.udp_addr = None
+        self.answer = answer
+        self.echo = echo
+        self.upload_kwargs = upload_kwargs if upload_kwargs is not None else {"prob": 0}
+        self.uploader = None
+        self.sock = None
+        self.outb = b""
+        self.transcript = []
+        self.prompts = deque()
+
+    def connect(self):
+        ###########################
+        # open a non-blocking connection and register it with the selector
+        ###########################
+        server_addr = (self.host, self.port)
+        self.sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        self.sock.setblocking(False)
+        self.sock.connect_ex(server_addr)
+        data = types.SimpleNamespace(inb = MessageBuffer(), client = self)
+        self.sel.register(self.sock, selectors.EVENT_READ, data = data)
 
     def start_connections(self):
         ###########################
         # connect to server
         ###########################
-        server_addr = (self.host, self.port)
-        sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-        sock.setblocking(False)
-        sock.connect_ex(server_addr)
-        events = selectors.EVENT_READ | selectors.EVENT_WRITE
-        data = types.SimpleNamespace(outb = b"")
-        self.sel.register(sock, events, data = data)
+        self.connect()
         try:
             while True:
                 events = self.sel.select(timeout = None)
@@ -55,7 +158,7 @@ class Client():
                     self.service_connection(key, mask)
                 if self.state != 0:
                     break
-        except ConnectionResetError:
+        except (ConnectionResetError, FrameError):
             print("Server has closed the connection")
         except KeyboardInterrupt:
             print("Caught keyboard interrupt, exiting")
@@ -64,91 +167,1106 @@ class Client():
     
     def service_connection(self, key, mask):
         ###########################
-        # listen to server
-        # when recieve submit message from server, send message to server
+        # listen to server, every framed message of a read is handled (a partial one waits for the rest)
+        # queued requests are sent once the socket is writable
         ###########################
         sock = key.fileobj
         data = key.data
         if mask & selectors.EVENT_READ:
-            recv_data = sock.recv(1024)
-            if recv_data:
-                show_text = recv_data.decode()
-                print(show_text)
-                if "submit" in show_text:
-                    send_text = input()
-                    sock.send(send_text.encode())
-                elif "Seller IP: " in show_text:
-                    self.udp_addr = show_text.split(' ')[-1]
-                    self.state = 2
-                elif "Buyer IP: " in show_text:
-                    self.udp_addr = show_text.split(' ')[-1]
-                    self.state = 1
-                elif "Auction is over" in show_text:
-                    self.state = 3
+            try:
+                recv_data = sock.recv(1024)
+            except (BlockingIOError, InterruptedError):
+                return
+            if not recv_data:
+                raise ConnectionResetError
+            for type, show_text in data.inb.feed(recv_data):
+                send_text = self.handle(type, show_text)
+                if send_text is not None:
+                    self.reply(send_text)
+                if self.state != 0:
+                    return
+        if mask & selectors.EVENT_WRITE and self.outb:
+            sent = sock.send(self.outb)
+            self.outb = self.outb[sent:]
+            if not self.outb:
+                self.sel.modify(sock, selectors.EVENT_READ, data = data)
+
+    def handle(self, type, show_text):
+        ###########################
+        # handle one server message, return the answer to send or None
+        #       MSG_PROMPT:     the answer of answer(), None queues the prompt for reply()
+        #       MSG_PEER:       "seller <ip>": won, receive the file from ip (UDP server)
+        #                       "buyer <ip>":  sold, send the file to ip (UDP client)
+        #                       "relay":       the Auctioneer relays items, answer with the item's hash and size
+        #                       "upload <port>": the Auctioneer does not have the item yet, send it to its UDP port
+        #       MSG_BYE:        auction finished
+        ###########################
+        self.transcript.append((type, show_text))
+        if type == MSG_PEER:
+            role, _, arg = show_text.partition(' ')
+            if role == "relay":
+                return self.offer()
+            if role == "upload":
+                self.uploader = threading.Thread(target = self.upload, args = (int(arg),))
+                self.uploader.start()
+                return None
+            self.udp_addr = arg
+            self.state = 2 if role == "seller" else 1
+            return None
+        if self.echo:
+            print(show_text)
+        if type == MSG_PROMPT:
+            send_text = self.answer(show_text) if self.answer is not None else None
+            if send_text is None:
+                self.prompts.append(show_text)
+            elif isinstance(send_text, str) and self.echo and self.answer is not keyboard:
+                print(send_text)
+            return send_text
+        elif type == MSG_BYE:
+            self.state = 3
+        return None
+
+    def offer(self):
+        ###########################
+        # "item <hash> <size>" of tosend.file, the Auctioneer only asks for the upload if it does not have it
+        ###########################
+        if not os.path.exists("tosend.file"):
+            return None
+        return "item {} {}".format(content_hash("tosend.file"), os.path.getsize("tosend.file"))
+
+    def upload(self, port):
+        ###########################
+        # upload thread: send tosend.file to the Auctioneer's UDP port, it delivers the item to the winner
+        # the protocol goes on meanwhile, so a selector or event loop shared with other clients
+        # (run_clients, run_clients_async) is never held up by the transfer
+        ###########################
+        if self.echo:
+            print("Uploading the item to the Auctioneer...")
+        try:
+            UDPClient(self.host, port, **self.upload_kwargs).send()
+        except OSError as e:
+            if self.echo:
+                print(f"Upload of the item failed ({e})")
+
+    def reply(self, send_text):
+        ###########################
+        # queue a request, it is sent when the socket is writable (never blocks)
+        # it answers the oldest prompt waiting for reply(), if any
+        ###########################
+        if self.prompts:
+            self.prompts.popleft()
+        self.outb += pack_msg(MSG_REQUEST, send_text)
+        key = self.sel.get_key(self.sock)
+        self.sel.modify(self.sock, selectors.EVENT_READ | selectors.EVENT_WRITE, data = key.data)
+
+    def close(self):
+        ###########################
+        # unregister and close the connection (run_clients)
+        ###########################
+        if self.sock is not None:
+            self.sel.unregister(self.sock)
+            self.sock.close()
+            self.sock = None
+
+    async def run_async(self):
+        ###########################
+        # asyncio version of start_connections, answer() may also be a coroutine function
+        # return the final state
+        ###########################
+        reader, writer = await asyncio.open_connection(self.host, self.port)
+        inb = MessageBuffer()
+        try:
+            while self.state == 0:
+                recv_data = await reader.read(1024)
+                if not recv_data:
+                    raise ConnectionResetError
+                for type, show_text in inb.feed(recv_data):
+                    send_text = self.handle(type, show_text)
+                    if inspect.isawaitable(send_text):
+                        send_text = await send_text
+                    if send_text is not None:
+                        writer.write(pack_msg(MSG_REQUEST, send_text))
+                        await writer.drain()
+                    if self.state != 0:
+                        break
+        finally:
+            writer.close()
+        return self.state
+
+def keyboard(prompt):
+    ###########################
+    # answer callback for Client: the user's input (interactive client)
+    ###########################
+    return input()
+
+def scripted(answers):
+    ###########################
+    # answer callback for Client: answers prompts with answers (list of str) in order
+    # e.g. ["2 100 3 WatchItem"] for a seller, ["join WatchItem", "250"] for a buyer
+    # returns None once the answers are used up
+    ###########################
+    answers = deque(answers)
+    return lambda prompt: answers.popleft() if answers else None
+
+def answers_from_file(path):
+    ###########################
+    # answer callback for Client: one answer per line of a file (blank lines are skipped)
+    ###########################
+    with open(path) as f:
+        return scripted([line.strip() for line in f if line.strip()])
+
+def run_clients(clients, timeout=None) -> list:
+    ###########################
+    # drive many clients in one process on one selector (non-blocking, no threads)
+    # every client must be created with the same selector, e.g.
+    #       sel = selectors.DefaultSelector()
+    #       run_clients([Client(host, port, scripted([...]), sel, echo=False) for i in range(100)])
+    # a client is done once its state is set or the server closed its connection,
+    # clients of an earlier call that are still connected keep being served
+    # return the clients that are still connected after timeout seconds (None: wait forever)
+    ###########################
+    if not clients:
+        return []
+    sel = clients[0].sel
+    for client in clients:
+        client.connect()
+    deadline = None if timeout is None else time.time() + timeout
+    running = set(clients)
+    while running and (deadline is None or time.time() < deadline):
+        for key, mask in sel.select(timeout = 0.1 if deadline is not None else None):
+            client = key.data.client
+            try:
+                client.service_connection(key, mask)
+            except (ConnectionResetError, FrameError, OSError):
+                client.close()
+            if client.state != 0:
+                client.close()
+            if client.sock is None:
+                running.discard(client)
+    return list(running)
+
+async def run_clients_async(clients) -> list:
+    ###########################
+    # asyncio version of run_clients, return the final state of every client
+    ###########################
+    return await asyncio.gather(*(client.run_async() for client in clients), return_exceptions = True)
+
+class RTTEstimator():
+    
+    def __init__(self, min_rto=0.05, max_rto=2, init_rto=1):
+        ###########################
+        # RFC 6298 retransmission timer
+        # srtt:                 smoothed round trip time
+        # rttvar:               round trip time variation
+        # rto:                  current retransmission timeout (including backoff)
+        # base_rto:             rto computed from the last sample (without backoff)
+        # min_rto/max_rto:      bounds of rto
+        # samples:              number of rtt samples taken
+        # min_rtt/max_rtt:      smallest and largest rtt sample
+        # timeouts:             number of timer expirations (backoffs)
+        ############################
+        self.srtt = None
+        self.rttvar = None
+        self.min_rto = min_rto
+        self.max_rto = max_rto
+        self.rto = min(max(init_rto, min_rto), max_rto)
+        self.base_rto = self.rto
+        self.samples = 0
+        self.min_rtt = None
+        self.max_rtt = None
+        self.timeouts = 0
+
+    def sample(self, rtt):
+        ###########################
+        # update srtt/rttvar with a new rtt measurement (alpha = 1/8, beta = 1/4, K = 4)
+        # only call it for packets that were not retransmitted (Karn's algorithm)
+        ###########################
+        if self.srtt is None:
+            self.srtt = rtt
+            self.rttvar = rtt / 2
+        else:
+            self.rttvar = 0.75 * self.rttvar + 0.25 * abs(self.srtt - rtt)
+            self.srtt = 0.875 * self.srtt + 0.125 * rtt
+        self.rto = min(max(self.srtt + max(0.001, 4 * self.rttvar), self.min_rto), self.max_rto)
+        self.base_rto = self.rto
+        self.samples += 1
+        self.min_rtt = rtt if self.min_rtt is None else min(self.min_rtt, rtt)
+        self.max_rtt = rtt if self.max_rtt is None else max(self.max_rtt, rtt)
+
+    def backoff(self):
+        ###########################
+        # timer expired: double rto (exponential backoff)
+        ###########################
+        self.timeouts += 1
+        self.rto = min(self.rto * 2, self.max_rto)
+
+    def reset_backoff(self):
+        ###########################
+        # new data was acked: drop the backoff even without a valid sample
+        # (with pipelining most acks after a loss cover retransmitted packets)
+        ###########################
+        self.rto = self.base_rto
+
+    def stats(self) -> str:
+        ###########################
+        # return rtt statistics in ms for output
+        ###########################
+        if self.samples == 0:
+            return "RTT: no samples, rto {:.3f} ms, {} timeouts".format(self.rto * 1000, self.timeouts)
+        return "RTT: {} samples, srtt {:.3f} ms, rttvar {:.3f} ms, min {:.3f} ms, max {:.3f} ms, rto {:.3f} ms, {} timeouts".format(
+            self.samples, self.srtt * 1000, self.rttvar * 1000, self.min_rtt * 1000, self.max_rtt * 1000, self.rto * 1000, self.timeouts)
+
+class Impairment():
+
+    def __init__(self, seed=None, loss=0.0, burst_p=0.0, burst_r=1.0, burst_loss=1.0, delay=0.0, jitter=0.0,
+                 reorder=0.0, reorder_delay=0.005, duplicate=0.0, corrupt=0.0):
+        ###########################
+        # network conditions applied by ImpairedSocket to every datagram it sends
+        # rand:                 seeded random generator, the same seed gives the same impairments
+        # loss:                 drop probability (in the good state when burst loss is on)
+        # burst_p/burst_r:      Gilbert-Elliott burst loss, probability per packet to go from the good to
+        #                       the bad state (burst_p, 0: off) and back (burst_r)
+        # burst_loss:           drop probability in the bad state
+        # bad:                  whether the channel is in the bad state
+        # delay/jitter:         seconds added to every datagram, uniform in [delay - jitter, delay + jitter]
+        #                       (jitter alone reorders datagrams too)
+        # reorder:              probability a datagram is held back another reorder_delay seconds,
+        #                       so the following ones overtake it
+        # duplicate:            probability a datagram is sent twice
+        # corrupt:              probability one byte of a datagram is flipped
+        # counts:               impairments applied so far
+        ############################
+        self.seed = seed
+        self.rand = random.Random(seed)
+        self.loss = loss
+        self.burst_p = burst_p
+        self.burst_r = burst_r
+        self.burst_loss = burst_loss
+        self.bad = False
+        self.delay = delay
+        self.jitter = jitter
+        self.reorder = reorder
+        self.reorder_delay = reorder_delay
+        self.duplicate = duplicate
+        self.corrupt = corrupt
+        self.counts = {"sent": 0, "dropped": 0, "delayed": 0, "reordered": 0, "duplicated": 0, "corrupted": 0}
+
+    def is_lost(self) -> bool:
+        ###########################
+        # independent loss, or Gilbert-Elliott when burst_p > 0
+        ###########################
+        if self.burst_p > 0:
+            if self.bad and self.rand.random() < self.burst_r:
+                self.bad = False
+            elif not self.bad and self.rand.random() < self.burst_p:
+                self.bad = True
+        return self.rand.random() < (self.burst_loss if self.bad else self.loss)
+
+    def apply(self, datagram) -> list:
+        ###########################
+        # return [(delay in seconds, datagram), ...] to send instead of datagram (empty when lost)
+        ###########################
+        self.counts["sent"] += 1
+        if self.is_lost():
+            self.counts["dropped"] += 1
+            return []
+        if self.corrupt and self.rand.random() < self.corrupt and datagram:
+            datagram = bytearray(datagram)
+            datagram[self.rand.randrange(len(datagram))] ^= 1 << self.rand.randrange(8)
+            self.counts["corrupted"] += 1
+        copies = 2 if self.duplicate and self.rand.random() < self.duplicate else 1
+        if copies == 2:
+            self.counts["duplicated"] += 1
+        out = []
+        for i in range(copies):
+            delay = max(self.delay + self.rand.uniform(-self.jitter, self.jitter), 0) if self.delay or self.jitter else 0
+            if self.reorder and self.rand.random() < self.reorder:
+                delay += self.reorder_delay
+                self.counts["reordered"] += 1
+            if delay > 0:
+                self.counts["delayed"] += 1
+            out.append((delay, datagram))
+        return out
+
+    def fork(self, offset):
+        ###########################
+        # copy with its own random sequence (seed + offset), e.g. for every stream of a striped transfer
+        ###########################
+        other = copy.copy(self)
+        other.seed = None if self.seed is None else self.seed + offset
+        other.rand = random.Random(other.seed)
+        other.bad = False
+        other.counts = dict.fromkeys(self.counts, 0)
+        return other
+
+    def stats(self) -> str:
+        return "Impairment: " + ", ".join("{} {}".format(count, name) for name, count in self.counts.items())
+
+class ImpairedSocket():
+
+    def __init__(self, sock, impairment):
+        ###########################
+        # UDP socket wrapper that sends every datagram through an Impairment
+        # datagrams without delay go out right away, delayed ones are sent by a
+        # background thread at their due time; everything else is the wrapped socket
+        # sock:                 wrapped udp socket
+        # impairment:           Impairment applied to outgoing datagrams
+        # queue:                heap of (due time, order, datagram, address) waiting to be sent
+        # cond:                 guards queue, wakes the delay thread
+        # thread:               delay thread, started with the first delayed datagram
+        ############################
+        self.sock = sock
+        self.impairment = impairment
+        self.queue = []
+        self.order = 0
+        self.cond = threading.Condition()
+        self.thread = None
+        self.closed = False
+
+    def __getattr__(self, name):
+        return getattr(self.sock, name)
+
+    def fileno(self):
+        return self.sock.fileno()
+
+    def sendto(self, data, addr):
+        self.impaired_send(data, addr)
+        return len(data)
+
+    def sendmsg(self, buffers, ancdata=(), flags=0, addr=None):
+        data = b"".join(buffers)
+        self.impaired_send(data, addr)
+        return len(data)
+
+    def impaired_send(self, data, addr):
+        for delay, datagram in self.impairment.apply(data):
+            if delay <= 0:
+                self.send_now(datagram, addr)
+                continue
+            with self.cond:
+                heapq.heappush(self.queue, (time.time() + delay, self.order, bytes(datagram), addr))
+                self.order += 1
+                if self.thread is None:
+                    self.thread = threading.Thread(target = self.deliver, daemon = True)
+                    self.thread.start()
+                self.cond.notify()
+
+    def send_now(self, datagram, addr):
+        ###########################
+        # send on the wrapped socket, a full send buffer drops the datagram (like a router queue)
+        ###########################
+        try:
+            self.sock.sendto(datagram, addr)
+        except (BlockingIOError, InterruptedError):
+            pass
+
+    def deliver(self):
+        ###########################
+        # delay thread: send every queued datagram at its due time
+        ###########################
+        with self.cond:
+            while not self.closed:
+                if not self.queue:
+                    self.cond.wait()
+                    continue
+                wait = self.queue[0][0] - time.time()
+                if wait > 0:
+                    self.cond.wait(wait)
+                    continue
+                _, _, datagram, addr = heapq.heappop(self.queue)
+                try:
+                    self.send_now(datagram, addr)
+                except OSError:
+                    # socket closed meanwhile
+                    return
+
+    def close(self):
+        with self.cond:
+            self.closed = True
+            self.cond.notify()
+        self.sock.close()
+
+class DatagramIO():
+    
+    def __init__(self, sock, batch=64, buffer_size=3000):
+        ###########################
+        # batched datagram I/O for the gbn/sr data path
+        # sock:                 udp socket (set to non-blocking while batching)
+        # batch:                max datagrams queued before a flush / drained per wakeup
+        #                       batching needs socket.sendmsg, otherwise (or batch <= 1)
+        #                       every packet is sent and received with a blocking call
+        # sel:                  selector waiting for the socket to become readable/writable
+        # bufs:                 preallocated receive buffers, one per datagram of a batch
+        # pending:              queued ([header, payload], addr) waiting for flush
+        # wakeups/datagrams:    number of receive wakeups and datagrams received
+        ############################
+        self.sock = sock
+        self.batch = batch if hasattr(sock, "sendmsg") else 1
+        self.bufs = [memoryview(bytearray(buffer_size)) for i in range(max(self.batch, 1))]
+        self.pending = []
+        self.sel = None
+        self.wakeups = 0
+        self.datagrams = 0
+        if self.batch > 1:
+            self.sock.setblocking(False)
+            self.sel = selectors.DefaultSelector()
+            self.sel.register(self.sock, selectors.EVENT_READ)
+
+    def send_pkt(self, addr, type, seq, payload=b"", ack=0, window=0):
+        ###########################
+        # queue a packet, header and payload stay separate buffers (scatter-gather)
+        ###########################
+        if self.batch <= 1:
+            send_pkt(self.sock, addr, type, seq, payload, ack, window)
+            return
+        header = pack_header(type, seq, payload, ack, window)
+        self.pending.append(([header, payload], addr))
+        if len(self.pending) >= self.batch:
+            self.flush()
+
+    def flush(self):
+        ###########################
+        # send every queued packet with sendmsg
+        # when the socket send buffer is full, wait until it is writable again
+        ###########################
+        i = 0
+        while i < len(self.pending):
+            try:
+                self.sock.sendmsg(self.pending[i][0], [], 0, self.pending[i][1])
+                i += 1
+            except BlockingIOError:
+                self.sel.modify(self.sock, selectors.EVENT_WRITE)
+                self.sel.select()
+                self.sel.modify(self.sock, selectors.EVENT_READ)
+        self.pending.clear()
+
+    def recv(self, timeout) -> list:
+        ###########################
+        # flush queued packets, then wait up to timeout for datagrams
+        # return list of (datagram view, address), views are valid until the next call
+        # raise socket.timeout if nothing arrived
+        ###########################
+        if self.batch <= 1:
+            self.sock.settimeout(timeout)
+            nbytes, addr = self.sock.recvfrom_into(self.bufs[0])
+            self.wakeups += 1
+            self.datagrams += 1
+            return [(self.bufs[0][:nbytes], addr)]
+        self.flush()
+        datagrams = []
+        while len(datagrams) < self.batch:
+            buf = self.bufs[len(datagrams)]
+            try:
+                nbytes, addr = self.sock.recvfrom_into(buf)
+            except BlockingIOError:
+                if datagrams:
+                    break
+                if not self.sel.select(timeout):
+                    raise socket.timeout
+                continue
+            datagrams.append((buf[:nbytes], addr))
+        self.wakeups += 1
+        self.datagrams += len(datagrams)
+        return datagrams
+
+    def close(self):
+        ###########################
+        # flush and give the socket back in blocking mode
+        ###########################
+        if self.batch > 1:
+            self.flush()
+            self.sel.close()
+            self.sock.setblocking(True)
+
+    def stats(self) -> str:
+        return "Batched I/O: {} datagrams received in {} wakeups (batch {})".format(self.datagrams, self.wakeups, self.batch)
+
+class FileDigest():
+
+    def __init__(self, num_chunks):
+        ###########################
+        # whole-file digest that is updated chunk by chunk in any order
+        # digests:              blake2b digest (16 bytes) of every chunk, in chunk order
+        # the file digest is blake2b over the chunk digests, so chunks are hashed
+        # once when sent / written and never read again
+        ############################
+        self.digests = bytearray(16 * num_chunks)
+
+    def update(self, idx, data):
+        self.digests[16 * idx:16 * idx + 16] = hashlib.blake2b(data, digest_size=16).digest()
+
+    def hexdigest(self) -> str:
+        return hashlib.blake2b(self.digests, digest_size=32).hexdigest()
+
+def content_hash(path) -> str:
+    ###########################
+    # blake2b of a whole file, the key of an item in the Auctioneer's item cache
+    # (unlike FileDigest it does not depend on the chunk size)
+    ###########################
+    digest = hashlib.blake2b(digest_size=32)
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+###########################
+# chunk compression (negotiated with "codec=<name>:<level>" in the start message)
+# every data payload starts with one flag byte:
+# CHUNK_RAW:            the chunk follows as is (it did not get smaller)
+# CHUNK_PACKED:         the chunk follows compressed
+###########################
+CODECS = ("none", "zlib", "lzma")
+CHUNK_RAW, CHUNK_PACKED = 0, 1
+
+class ChunkCodec():
+
+    def __init__(self, name="zlib", level=6):
+        ###########################
+        # compress every chunk on its own, so chunks can still be lost, re-sent, reordered,
+        # resumed and striped independently, and neither side holds more than one chunk
+        # name:                 "zlib" (deflate) or "lzma" (raw LZMA2, no container header)
+        # level:                zlib level 0-9 or lzma preset 0-9
+        # raw_bytes:            bytes of the chunks encoded / decoded so far
+        # coded_bytes:          bytes of their payloads (flag byte included)
+        ############################
+        self.name = name
+        self.level = level
+        self.filters = [{"id": lzma.FILTER_LZMA2, "preset": level}]
+        self.raw_bytes = 0
+        self.coded_bytes = 0
+
+    @classmethod
+    def from_spec(cls, spec):
+        ###########################
+        # "zlib", "zlib:9" or "lzma:1" to a ChunkCodec, None for "none" (raise ValueError if malformed)
+        ###########################
+        name, _, level = spec.partition(":")
+        if name not in CODECS or level and not (level.isdigit() and 0 <= int(level) <= 9):
+            raise ValueError(spec)
+        if name == "none":
+            return None
+        return cls(name, int(level) if level else 6)
+
+    def spec(self) -> str:
+        return "{}:{}".format(self.name, self.level)
+
+    def encode(self, chunk) -> bytes:
+        ###########################
+        # payload of chunk (bytes or memoryview): flag byte followed by the compressed or the raw chunk
+        ###########################
+        if self.name == "zlib":
+            packed = zlib.compress(chunk, self.level)
+        else:
+            packed = lzma.compress(chunk, format = lzma.FORMAT_RAW, filters = self.filters)
+        payload = bytes([CHUNK_PACKED]) + packed if len(packed) < len(chunk) else bytes([CHUNK_RAW]) + chunk
+        self.raw_bytes += len(chunk)
+        self.coded_bytes += len(payload)
+        return payload
+
+    def decode(self, payload) -> bytes:
+        ###########################
+        # chunk of a payload made by encode
+        ###########################
+        if payload[0] == CHUNK_RAW:
+            chunk = payload[1:]
+        elif self.name == "zlib":
+            chunk = zlib.decompress(payload[1:])
+        else:
+            chunk = lzma.decompress(payload[1:], format = lzma.FORMAT_RAW, filters = self.filters)
+        self.raw_bytes += len(chunk)
+        self.coded_bytes += len(payload)
+        return chunk
+
+    def ratio(self) -> float:
+        return self.raw_bytes / self.coded_bytes if self.coded_bytes else 1.0
+
+    def stats(self) -> str:
+        return "Compression {}: {} bytes in {} bytes of payload, ratio {:.2f}".format(
+            self.spec(), self.raw_bytes, self.coded_bytes, self.ratio())
+
+class Checkpoint():
+    
+    def __init__(self, file_adr, total_length, chunk_size, file_id, first_chunk, num_chunks, flush_every=64):
+        ###########################
+        # on-disk progress of a transfer, kept next to the recv file as <file_adr>.part
+        # header (HEADER): magic, total_length, chunk_size, file_id (sender's file mtime)
+        # followed by one bit per chunk of the whole file
+        # a receiver only touches the bitmap bytes of its own chunk range
+        # [first_chunk, first_chunk + num_chunks), striped ranges are aligned to 8 chunks
+        # bitmap:               in-memory bitmap bytes of the range
+        # dirty:                [lo, hi) bitmap bytes changed since the last flush
+        # flush_every:          flush after this many newly marked chunks
+        ############################
+        self.path = file_adr + ".part"
+        self.total_length = total_length
+        self.chunk_size = chunk_size
+        self.file_id = file_id
+        self.first_chunk = first_chunk
+        self.num_chunks = num_chunks
+        self.flush_every = flush_every
+        self.first_byte = first_chunk // 8
+        self.bitmap = bytearray((first_chunk + num_chunks + 7) // 8 - self.first_byte)
+        self.dirty = None
+        self.marked = 0
+        self.fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o644)
+
+    HEADER = struct.Struct("!4sQIQ")
+
+    def load(self, file_size) -> set:
+        ###########################
+        # return chunk indices (relative to the range) already received
+        # progress of another file / chunk size, or a recv file of wrong size, is discarded
+        ###########################
+        # locked: the streams of a striped transfer share the progress file
+        fcntl.flock(self.fd, fcntl.LOCK_EX)
+        try:
+            header = os.pread(self.fd, self.HEADER.size, 0)
+            expect = self.HEADER.pack(b"RDTP", self.total_length, self.chunk_size, self.file_id)
+            if header != expect or not self.file_id:
+                # start over: clear the whole bitmap, then write the new header
+                os.ftruncate(self.fd, 0)
+                os.pwrite(self.fd, expect, 0)
+                return set()
+            if file_size != self.total_length:
+                os.pwrite(self.fd, bytes(len(self.bitmap)), self.HEADER.size + self.first_byte)
+                return set()
+            self.bitmap[:] = os.pread(self.fd, len(self.bitmap), self.HEADER.size + self.first_byte).ljust(len(self.bitmap), b"\0")
+        finally:
+            fcntl.flock(self.fd, fcntl.LOCK_UN)
+        present = set()
+        for idx in range(self.num_chunks):
+            g = self.first_chunk + idx
+            if self.bitmap[g // 8 - self.first_byte] >> (g % 8) & 1:
+                present.add(idx)
+        return present
+
+    def mark(self, idx):
+        ###########################
+        # chunk idx of the range has been written to the recv file
+        ###########################
+        g = self.first_chunk + idx
+        b = g // 8 - self.first_byte
+        self.bitmap[b] |= 1 << (g % 8)
+        self.dirty = (b, b + 1) if self.dirty is None else (min(self.dirty[0], b), max(self.dirty[1], b + 1))
+        self.marked += 1
+        if self.marked % self.flush_every == 0:
+            self.flush()
+
+    def flush(self):
+        ###########################
+        # write the changed bitmap bytes
+        ###########################
+        if self.dirty is not None:
+            lo, hi = self.dirty
+            os.pwrite(self.fd, self.bitmap[lo:hi], self.HEADER.size + self.first_byte + lo)
+            self.dirty = None
+
+    def close(self, remove=False):
+        ###########################
+        # flush and close, remove the progress file once the transfer is complete
+        ###########################
+        self.flush()
+        os.close(self.fd)
+        if remove and os.path.exists(self.path):
+            os.remove(self.path)
+
+def missing_ranges(present, num_chunks, max_ranges=100) -> list:
+    ###########################
+    # convert present chunk indices into [a, b) ranges of missing chunks
+    # beyond max_ranges the last range runs to the end (re-sending present chunks is harmless),
+    # so the list always fits in the payload of the start ack
+    ###########################
+    ranges = []
+    idx = 0
+    while idx < num_chunks:
+        if idx in present:
+            idx += 1
+            continue
+        bgn = idx
+        while idx < num_chunks and idx not in present:
+            idx += 1
+        if len(ranges) == max_ranges - 1:
+            ranges.append((bgn, num_chunks))
+            break
+        ranges.append((bgn, idx))
+    return ranges
+
+###########################
+# transfer log verbosity
+# SILENT:       nothing at all (transfers run by the Auctioneer's item relay)
+# QUIET:        final result only (throughput and file digest)
+# PROGRESS:     also connection events, a progress line every interval and the final statistics
+# PACKETS:      also one line per packet event (sent, received, re-sent, dropped, ...)
+###########################
+SILENT, QUIET, PROGRESS, PACKETS = -1, 0, 1, 2
+
+class TransferLog():
+
+    def __init__(self, verbosity=PROGRESS, interval=1.0, counters=(), prefix=""):
+        ###########################
+        # rate-limited output of a transfer endpoint
+        # lines are formatted only if their level is enabled, so the per-packet
+        # calls cost one attribute check when packet lines are off
+        # verbosity:            SILENT, QUIET, PROGRESS or PACKETS
+        # interval:             seconds between progress lines
+        # counters:             names of the counters passed to progress() (e.g. retransmits, dropped)
+        # prefix:               put before every line (stream of a striped transfer)
+        # bgn:                  time and byte count of the first progress() call
+        # last/last_bytes:      time and byte count of the last progress line
+        ############################
+        self.verbosity = verbosity
+        self.interval = interval
+        self.counters = counters
+        self.prefix = prefix
+        self.packets = verbosity >= PACKETS
+        self.bgn = None
+        self.last = None
+        self.last_bytes = 0
+
+    def result(self, fmt, *args):
+        # final result, shown unless SILENT
+        if self.verbosity > SILENT:
+            print(self.prefix + fmt.format(*args))
+
+    def info(self, fmt, *args):
+        # event or statistics, shown from PROGRESS
+        if self.verbosity >= PROGRESS:
+            print(self.prefix + fmt.format(*args))
+
+    def packet(self, fmt, *args):
+        # per-packet event, shown at PACKETS
+        if self.packets:
+            print(self.prefix + fmt.format(*args))
+
+    def progress(self, done, total, *counts):
+        ###########################
+        # called for every delivered chunk, shows at most one line per interval:
+        # bytes done, rate since the last line and the counters
+        ###########################
+        if self.verbosity < PROGRESS:
+            return
+        now = time.time()
+        if self.bgn is None:
+            self.bgn = self.last = now
+            self.last_bytes = done
+            return
+        if now - self.last < self.interval:
+            return
+        rate = (done - self.last_bytes) / (now - self.last)
+        counters = "".join(", {} {}".format(count, name) for name, count in zip(self.counters, counts))
+        print("{}Progress: {} / {} bytes ({:.1f}%), {:.1f} bytes/s{}".format(self.prefix, done, total, 100 * done / max(total, 1),
+                                                                          rate, counters))
+        self.last = now
+        self.last_bytes = done
+
+class TransferMetrics():
+
+    def __init__(self, role, rtt):
+        ###########################
+        # counters of one transfer endpoint, updated by UDPClient/UDPServer
+        # to_dict() can be polled from another thread during the transfer, to_json() exports it
+        # variables
+        # role:                 "sender" or "receiver"
+        # rtt:                  RTTEstimator of the endpoint
+        # packets_sent/packets_received:
+        #                       datagrams of every type (control, data, ack)
+        # bytes_sent/bytes_received:
+        #                       datagram bytes including headers
+        # data_packets:         data packets sent (sender) or received (receiver), copies included
+        # data_bytes:           payload bytes of data_packets
+        # useful_bytes:         payload bytes that were new: first sends (sender), chunks written (receiver)
+        # retransmits:          re-sent packets by cause (data packets on the sender, acks on the receiver)
+        #                       timeout:    retransmission timer expired
+        #                       drop:       the loss simulation dropped the answer
+        #                       mismatch:   answer with the wrong seq
+        #                       corrupt:    answer with a bad checksum
+        #                       dup_ack:    fast retransmit on duplicate acks (gbn/sr sender)
+        # dropped:              packets dropped by the loss simulation
+        # corrupted:            packets discarded because of a bad checksum
+        # duplicates:           data packets received more than once (receiver)
+        # phases:               [begin, end] time of "start", "data" and "fin"
+        # phase_name:           current phase, None before the first and after the last
+        ############################
+        self.role = role
+        self.rtt = rtt
+        self.packets_sent = 0
+        self.packets_received = 0
+        self.bytes_sent = 0
+        self.bytes_received = 0
+        self.data_packets = 0
+        self.data_bytes = 0
+        self.useful_bytes = 0
+        self.retransmits = {"timeout": 0, "drop": 0, "mismatch": 0, "corrupt": 0, "dup_ack": 0}
+        self.dropped = 0
+        self.corrupted = 0
+        self.duplicates = 0
+        self.phases = {}
+        self.phase_name = None
+
+    def phase(self, name):
+        ###########################
+        # end the current phase and begin phase name (None: transfer finished)
+        ###########################
+        now = time.time()
+        if self.phase_name is not None:
+            self.phases[self.phase_name][1] = now
+        if name is not None:
+            self.phases[name] = [now, None]
+        self.phase_name = name
+
+    def sent(self, nbytes):
+        self.packets_sent += 1
+        self.bytes_sent += nbytes
+
+    def received(self, nbytes):
+        self.packets_received += 1
+        self.bytes_received += nbytes
+
+    def data(self, nbytes, useful=True):
+        # data packet sent (sender) or received (receiver)
+        self.data_packets += 1
+        self.data_bytes += nbytes
+        if useful:
+            self.useful_bytes += nbytes
+
+    def retransmit(self, cause):
+        self.retransmits[cause] += 1
+
+    def total_retransmits(self) -> int:
+        return sum(self.retransmits.values())
+
+    def duration(self, name) -> float:
+        ###########################
+        # seconds spent in phase name so far, 0 if it has not begun
+        ###########################
+        if name not in self.phases:
+            return 0.0
+        bgn, end = self.phases[name]
+        return (end if end is not None else time.time()) - bgn
+
+    def to_dict(self) -> dict:
+        ###########################
+        # snapshot of every counter, rates are bytes per second over the data phase so far
+        # throughput counts every data byte (copies included), goodput only the useful ones
+        ###########################
+        ms = lambda x: None if x is None else round(x * 1000, 3)
+        data_time = self.duration("data")
+        return {
+            "role": self.role,
+            "phase": self.phase_name,
+            "phase_s": {name: round(self.duration(name), 6) for name in self.phases},
+            "packets_sent": self.packets_sent, "packets_received": self.packets_received,
+            "bytes_sent": self.bytes_sent, "bytes_received": self.bytes_received,
+            "data_packets": self.data_packets, "data_bytes": self.data_bytes, "useful_bytes": self.useful_bytes,
+            "throughput_bytes_per_s": round(self.data_bytes / data_time, 1) if data_time > 0 else None,
+            "goodput_bytes_per_s": round(self.useful_bytes / data_time, 1) if data_time > 0 else None,
+            "retransmits": self.total_retransmits(), "retransmits_by_cause": dict(self.retransmits),
+            "dropped": self.dropped, "corrupted": self.corrupted, "duplicates": self.duplicates,
+            "rtt": {"samples": self.rtt.samples, "srtt_ms": ms(self.rtt.srtt), "rttvar_ms": ms(self.rtt.rttvar),
+                    "min_ms": ms(self.rtt.min_rtt), "max_ms": ms(self.rtt.max_rtt), "rto_ms": ms(self.rtt.rto),
+                    "timeouts": self.rtt.timeouts},
+        }
+
+    def to_json(self) -> str:
+        return json.dumps(self.to_dict(), indent = 2)
+
+    def save(self, path):
+        with open(path, "w") as f:
+            f.write(self.to_json())
+
+    def stats(self) -> str:
+        ###########################
+        # return a one-line summary for output
+        ###########################
+        d = self.to_dict()
+        return "Metrics: {} packets sent, {} received, {} retransmits ({}), goodput {} of throughput {} bytes/s".format(
+            d["packets_sent"], d["packets_received"], d["retransmits"],
+            ", ".join("{} {}".format(count, cause) for cause, count in d["retransmits_by_cause"].items() if count) or "none",
+            d["goodput_bytes_per_s"], d["throughput_bytes_per_s"])
 
 class UDPServer():
     
-    def __init__(self, host, port, prob=0.1):
+    def __init__(self, host, port, prob=0.1, mode="sw", window=1, min_rto=0.05, max_rto=2, fsync_bytes=0, batch=64,
+                 striped=False, verbosity=PROGRESS, progress_interval=1.0, metrics_path=None, impairment=None, seed=None):
         ###########################
         # variables
         # file_addr:            receive file local address
+        # fd:                   descriptor of the recv file, kept open during the transfer
+        # fsync_bytes:          fsync the recv file every fsync_bytes written (0: never)
+        # unsynced:             bytes written since the last fsync
+        # striped:              one stream of a striped transfer (progress file is removed by recv_striped)
+        # checkpoint:           on-disk progress (Checkpoint) used to resume an interrupted transfer
+        # present:              chunk indices already received before this transfer (resume)
+        # pending:              chunk indices still expected in stop-and-wait order
+        # start_reply:          payload of the start ack, "missing a-b,c-d" when resuming
+        # digest:               FileDigest of the received range
+        # fin_digest:           digest announced by the client in "fin <digest>"
+        # verified:             whether the received range matches fin_digest
+        # offset:               where the received range starts in the file (striped transfer)
+        # total_length:         length of the whole file (preallocated size)
         # chunk_size:           maximum chunk size per packet
+        # codec:                ChunkCodec announced in the start message, None: chunks are sent raw
         # file_length:          file length in byte
         # bgn:                  begin index when slicing bytes_to_send
         # end:                  end index when slicing bytes_to_send
-        # sock:                 udp socket
+        # sock:                 udp socket, an ImpairedSocket when impairment is given
+        # impairment:           Impairment applied to the acks sent (None: send as is)
         # server_addr:          UDP server address (this machine)
         # buffer_size:          socket buffer size
         # type:                 data type (0 or 1) when sending file
         # ack:                  ack num used in relaibel transfer
         # prob:                 packet loss probability
+        # rand:                 random generator of the packet loss, seeded with seed (None: unseeded)
         # connected             check if it is the first time client connect with the server
         # client_addr:          UDP client's address
         # start_time:           when receive the first package
         # end_time:             when receive the last package
+        # mode:                 "sw" stop-and-wait, "gbn" go-back-n, "sr" selective repeat
+        # window:               receive window in packets (negotiated in start message)
+        # expect_seq:           next in-order data seq (gbn/sr)
+        # recv_buffer:          length of out-of-order packets already written, by seq (sr)
+        # recv_buf:             preallocated datagram buffer filled by recvfrom_into
+        # rcv_capacity:         packets the socket receive buffer can hold (flow control)
+        # batch:                datagrams per DatagramIO wakeup (gbn/sr), <= 1 disables batching
+        # io:                   DatagramIO of the gbn/sr data path
+        # rtt:                  retransmission timer for re-sending acks
+        # ack_time:             when the last new ack was sent (rtt sample in sw)
+        # fin_ack:              ack of fin, re-sent while lingering
+        # linger:               seconds to keep answering fin after the transfer (its ack may be lost)
+        # metrics:              TransferMetrics of the receiver
+        # metrics_path:         write the metrics as json to this file at the end (None: don't)
+        # log:                  TransferLog of the receiver (verbosity, a progress line every progress_interval seconds)
         ############################
+        self.log = TransferLog(verbosity, progress_interval, ("dropped",), "[{}] ".format(port) if striped else "")
         # file setup
         self.file_adr = "recved.file"
+        self.fd = None
+        self.fsync_bytes = fsync_bytes
+        self.unsynced = 0
+        self.striped = striped
+        self.checkpoint = None
+        self.present = set()
+        self.pending = deque()
+        self.start_reply = b""
+        self.digest = None
+        self.fin_digest = None
+        self.verified = False
+        self.offset = 0
+        self.total_length = None
         self.chunk_size = 2000
+        self.codec = None
         self.file_length = None
         self.end = 0
         self.data = None
         # udp socket setup
         self.sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self.impairment = impairment
+        if impairment is not None:
+            self.sock = ImpairedSocket(self.sock, impairment)
         self.server_addr = (host, port)
         self.buffer_size = 3000
+        self.recv_buf = memoryview(bytearray(self.buffer_size))
         self.type = None
         self.ack = None
         self.pre_ack = 1
         self.prob = prob
+        self.rand = random.Random(seed)
         self.connected = False
         self.client_addr = None
         self.start_time = None
         self.end_time = None
+        # sliding window setup
+        self.mode = mode
+        self.window = window
+        self.expect_seq = 1
+        self.recv_buffer = {}
+        # kernel accounts roughly twice the datagram size per queued packet
+        self.rcv_capacity = self.sock.getsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF) // (2 * self.buffer_size)
+        self.batch = batch
+        self.io = None
+        # retransmission timer setup
+        self.rtt = RTTEstimator(min_rto, max_rto)
+        self.ack_time = None
+        self.fin_ack = None
+        self.linger = 0.5
+        # instrumentation
+        self.metrics = TransferMetrics("receiver", self.rtt)
+        self.metrics_path = metrics_path
         # output UDP socket opened msg
-        print("UDP socket openned for RDT.")
+        self.log.info("UDP socket openned for RDT.")
 
     def recv(self):
         ###########################
-        # 1. open or create recved.file, clear the file, and close
+        # 1. open or create recved.file (kept open for the transfer, kept content is resumed)
         # 2. bind IP address with the socket and strat listening
         # 3. send initial data (start file_length) to server(winner buyer)
         # 4. generate rand list 
         # 4. start to receive data form client
         # 5. when trasmission finished, calcuate required performance data
         ###########################
-        # create and clean recv file
-        open(self.file_adr, "w").close()
-        # bind to address the IP and listen
-        self.sock.bind(self.server_addr)
-        print("UDP socket openned for RDT.")
-        print("Start receiving file.")
-        # Receiving data
-        self.recv_file()
+        # create recv file, it is only cleared if there is no progress to resume
+        self.fd = os.open(self.file_adr, os.O_RDWR | os.O_CREAT, 0o644)
+        # bind to address the IP and listen (unless bound already, e.g. to an ephemeral port announced beforehand)
+        if self.sock.getsockname()[1] == 0:
+            self.sock.bind(self.server_addr)
+        self.log.info("UDP socket openned for RDT.")
+        self.log.info("Start receiving file.")
+        self.metrics.phase("start")
+        # Receiving data, progress is saved if interrupted
+        complete = False
+        try:
+            self.recv_file()
+            self.verified = self.digest.hexdigest() == self.fin_digest
+            complete = True
+        finally:
+            self.metrics.phase(None)
+            if self.fsync_bytes:
+                os.fsync(self.fd)
+            if self.checkpoint is not None:
+                self.checkpoint.close(remove = complete and not self.striped)
+            os.close(self.fd)
         tct = self.end_time - self.start_time
         at = self.file_length / tct
-        print("Transmission finished: {} bytes / {:.6f} seconds = {:.6f} bps".format(self.file_length, tct, at))
-        
+        if self.codec is None:
+            self.log.result("Transmission finished: {} bytes / {:.6f} seconds = {:.6f} bytes/s", self.file_length, tct, at)
+        else:
+            # goodput counts the file bytes, the wire carried coded_bytes of payload for them
+            self.log.result("Transmission finished: {} bytes / {:.6f} seconds = {:.6f} bytes/s goodput, {} ratio {:.2f} ({} bytes of payload, {:.6f} bytes/s)",
+                            self.file_length, tct, at, self.codec.spec(), self.codec.ratio(), self.codec.coded_bytes,
+                            self.codec.coded_bytes / tct)
+        if self.verified:
+            self.log.result("File digest verified: {}", self.fin_digest)
+        else:
+            self.log.result("File digest mismatch: expected {}, received file has {}", self.fin_digest, self.digest.hexdigest())
+        self.log.info(self.rtt.stats())
+        self.log.info(self.metrics.stats())
+        if self.io is not None:
+            self.log.info(self.io.stats())
+        if self.impairment is not None:
+            self.log.info(self.impairment.stats())
+        if self.metrics_path is not None:
+            self.metrics.save(self.metrics_path)
+        self.linger_fin()
+
+    def linger_fin(self):
+        ###########################
+        # answer re-sent fin messages until none arrived for linger seconds
+        # (the client re-sends fin when its ack was lost, and would otherwise wait until it gives up)
+        ###########################
+        deadline = time.time() + self.linger
+        while self.fin_ack is not None and time.time() < deadline:
+            self.sock.settimeout(max(deadline - time.time(), 0.001))
+            try:
+                datagram, addr = self.sock.recvfrom(self.buffer_size)
+                type, _, _, _, payload = unpack_pkt(datagram)
+            except socket.timeout:
+                break
+            except (HeaderError, ChecksumError):
+                continue
+            if addr == self.client_addr and type == TYPE_CTRL and bytes(payload[:3]) == b"fin":
+                self.sock.sendto(self.fin_ack, addr)
+                deadline = time.time() + self.linger
+
     def recv_file(self):
         ###########################
         # try: 
@@ -165,13 +1283,12 @@ class UDPServer():
         ###########################
         while True:
             try:
-                if self.connected:  self.sock.settimeout(2)
+                if self.connected:  self.sock.settimeout(self.rtt.rto)
                 else: self.start_time = time.time()
-                recv_msg = self.sock.recvfrom(self.buffer_size)
-                msg = recv_msg[0].decode()
-                self.ack, self.type, self.data = msg[0], msg[1], msg[2:]
+                recv_msg = self.recv_into()
+                self.type, self.ack, _, _, self.data = unpack_pkt(recv_msg[0])
                 expect_ack = 1 if self.pre_ack == 0 else 1 
-                if self.pre_ack ^ int(self.ack) == 0:
+                if self.pre_ack ^ self.ack == 0:
                     raise AckMisMatchError
                 if self.is_packet_dropped():
                     raise PacketLossError
@@ -179,127 +1296,599 @@ class UDPServer():
                     self.client_addr = tuple(recv_msg[1])
                 elif self.client_addr != recv_msg[1]:
                     raise IPMisMatch
-                self.sock.sendto(self.ack.encode(), self.client_addr)
-                if not self.parse_pkt():
-                    print("All data received! Exiting...") 
+                if self.ack_time is not None and self.pre_ack != self.ack:
+                    self.rtt.sample(time.time() - self.ack_time)
+                more = self.parse_pkt()
+                self.send_ack(self.ack, self.client_addr)
+                self.ack_time = time.time()
+                if not more:
+                    self.fin_ack = make_pkt(TYPE_ACK, self.ack, ack=self.ack)
+                    self.log.info("All data received! Exiting...")
+                    break
+                if self.connected and self.mode != "sw":
+                    self.recv_window()
                     break
             except socket.timeout:
-                print("Ack re-sent: {}".format(self.pre_ack))
-                self.sock.sendto(str(self.pre_ack).encode(), recv_msg[1])
+                self.rtt.backoff()
+                self.ack_time = None
+                self.log.packet("Ack re-sent: {}", self.pre_ack)
+                self.metrics.retransmit("timeout")
+                self.send_ack(self.pre_ack, recv_msg[1])
             except PacketLossError:
-                print("Pkt dropped: {}".format(expect_ack))
-                print("Ack re-sent: {}".format(self.pre_ack))
-                self.sock.sendto(str(self.pre_ack).encode(), recv_msg[1])
+                self.metrics.dropped += 1
+                self.log.packet("Pkt dropped: {}", expect_ack)
+                self.log.packet("Ack re-sent: {}", self.pre_ack)
+                self.metrics.retransmit("drop")
+                self.send_ack(self.pre_ack, recv_msg[1])
             except AckMisMatchError:
-                print("Msg received with mismatched sequence number {}. Expecting {}".format(self.ack, expect_ack))
-                print("Ack re-sent: {}".format(self.pre_ack))
-                self.sock.sendto(str(self.pre_ack).encode(), recv_msg[1])
-            except IPMisMatch:
+                if self.type == TYPE_DATA:
+                    self.metrics.duplicates += 1
+                    self.metrics.data(len(self.data), useful = False)
+                self.log.packet("Msg received with mismatched sequence number {}. Expecting {}", self.ack, expect_ack)
+                self.log.packet("Ack re-sent: {}", self.pre_ack)
+                self.metrics.retransmit("mismatch")
+                self.send_ack(self.pre_ack, recv_msg[1])
+            except ChecksumError:
+                self.metrics.corrupted += 1
+                self.log.packet("Corrupted msg discarded")
+                if self.client_addr is not None:
+                    self.log.packet("Ack re-sent: {}", self.pre_ack)
+                    self.metrics.retransmit("corrupt")
+                    self.send_ack(self.pre_ack, self.client_addr)
+            except (IPMisMatch, HeaderError):
                 pass
                 
     def parse_pkt(self) -> bool:
         ###########################
-        # if type == "0" and "start" in message:
+        # if type == TYPE_CTRL and "start" in message:
         #       connected = True tells that server has connected to the client
-        # if type == "0" and "fin" in message:
+        # if type == TYPE_CTRL and "fin" in message:
         #       received all data
-        # if type == "1":
+        # if type == TYPE_DATA:
         #       write recv data into file 
         ###########################
-        self.pre_ack = int(self.ack)
-        print("Msg received: {}".format(self.ack))
-        print("Ack sent: {}".format(self.ack))
-        if self.type == "0":
-            if "start" in self.data:
-                self.file_length = int(self.data.split(" ")[1])
+        self.pre_ack = self.ack
+        self.log.packet("Msg received: {}", self.ack)
+        self.log.packet("Ack sent: {}", self.ack)
+        if self.type == TYPE_CTRL:
+            ctrl = bytes(self.data).decode()
+            if "start" in ctrl:
+                file_id = 0
+                splt = ctrl.split(" ")
+                self.file_length = int(splt[1])
+                self.total_length = self.file_length
+                for opt in splt[2:]:
+                    key, value = opt.split("=")
+                    if key == "mode":
+                        self.mode = value
+                    elif key == "window":
+                        self.window = int(value)
+                    elif key == "chunk":
+                        self.chunk_size = int(value)
+                    elif key == "codec":
+                        self.codec = ChunkCodec.from_spec(value)
+                    elif key == "offset":
+                        self.offset = int(value)
+                    elif key == "total":
+                        self.total_length = int(value)
+                    elif key == "id":
+                        file_id = int(value)
+                # encoded chunks carry a flag byte and may not shrink
+                self.resize_buffer(self.chunk_size + HEADER.size + (1 if self.codec is not None else 0))
+                self.digest = FileDigest(-(-self.file_length // self.chunk_size))
+                self.resume(file_id)
+                self.preallocate()
                 self.connected = True
+                self.metrics.phase("data")
                 return True
-            elif "fin" in self.data:
+            elif "fin" in ctrl:
+                self.metrics.phase("fin")
                 self.end_time = time.time()
+                self.fin_digest = ctrl[4:]
                 return False
-        elif self.type == "1":
-             f = open(self.file_adr, "a")
-             f.write(self.data)
-             f.close()
-             self.end += len(self.data)
-             print("Received data seq {}: {} / {}".format(self.ack, self.end, self.file_length))
+        elif self.type == TYPE_DATA:
+             self.start_reply = b""
+             if self.pending:
+                 self.end += self.write_chunk(self.data, self.pending.popleft() * self.chunk_size)
+             self.log.packet("Received data seq {}: {} / {}", self.ack, self.end, self.file_length)
+             self.log.progress(self.end, self.file_length, self.metrics.dropped)
              return True
 
+    def recv_window(self):
+        ###########################
+        # receive data with go-back-n or selective repeat
+        # every data packet is acked with an ack packet:
+        #       ack:        highest seq delivered in-order (cumulative ack)
+        #       seq:        seq of the packet that triggered the ack (selective ack)
+        #       window:     free receive buffer in packets (rwnd)
+        # gbn:  only the expected seq is accepted, others are discarded
+        # sr:   packets inside [expect_seq, expect_seq + window) are buffered
+        #       and delivered once the gap before them is filled
+        # fin is accepted only after all data has been delivered in-order
+        # all datagrams queued on the socket are drained per wakeup and their
+        # acks are flushed together (DatagramIO)
+        ###########################
+        self.io = DatagramIO(self.sock, self.batch, self.buffer_size)
+        done = False
+        while not done:
+            try:
+                datagrams = self.io.recv(self.rtt.rto)
+            except socket.timeout:
+                self.rtt.backoff()
+                self.log.packet("Ack re-sent: {}", self.expect_seq - 1)
+                self.metrics.retransmit("timeout")
+                self.send_window_ack(self.expect_seq - 1)
+                continue
+            for datagram, addr in datagrams:
+                self.metrics.received(len(datagram))
+                if self.handle_window_pkt(datagram, addr):
+                    done = True
+                    break
+        self.io.close()
+
+    def handle_window_pkt(self, datagram, addr) -> bool:
+        ###########################
+        # process one gbn/sr datagram and queue its ack
+        # return True when fin has been received
+        ###########################
+        try:
+            if self.is_packet_dropped():
+                raise PacketLossError
+            if self.client_addr != addr:
+                raise IPMisMatch
+            self.type, seq, _, _, self.data = unpack_pkt(datagram)
+        except PacketLossError:
+            # duplicate ack like stop-and-wait, the client fast-retransmits the missing chunk
+            self.metrics.dropped += 1
+            self.log.packet("Pkt dropped")
+            if self.client_addr == addr:
+                self.log.packet("Ack re-sent: {}", self.expect_seq - 1)
+                self.metrics.retransmit("drop")
+                self.send_window_ack(self.expect_seq - 1)
+            return False
+        except ChecksumError:
+            # duplicate ack, the client fast-retransmits the missing chunk
+            self.metrics.corrupted += 1
+            self.log.packet("Corrupted msg discarded")
+            self.metrics.retransmit("corrupt")
+            self.send_window_ack(self.expect_seq - 1)
+            return False
+        except (IPMisMatch, HeaderError):
+            return False
+        if self.type == TYPE_CTRL:
+            if seq == 0:
+                # start message re-sent because its ack was lost
+                self.metrics.sent(HEADER.size + len(self.start_reply))
+                self.io.send_pkt(self.client_addr, TYPE_ACK, 0, self.start_reply)
+            elif bytes(self.data[:3]) == b"fin" and seq == self.expect_seq:
+                self.metrics.phase("fin")
+                self.end_time = time.time()
+                self.fin_digest = bytes(self.data[4:]).decode()
+                self.expect_seq += 1
+                self.send_window_ack(seq)
+                self.fin_ack = make_pkt(TYPE_ACK, seq, ack=seq)
+                self.log.packet("Msg received: {}", seq)
+                self.log.info("All data received! Exiting...")
+                return True
+            else:
+                self.send_window_ack(seq)
+            return False
+        if seq < self.expect_seq:
+            self.metrics.duplicates += 1
+            self.metrics.data(len(self.data), useful = False)
+            self.log.packet("Duplicate data seq {}", seq)
+        elif seq == self.expect_seq:
+            self.end += self.write_chunk(self.data, (seq - 1) * self.chunk_size)
+            self.expect_seq += 1
+            while self.expect_seq in self.recv_buffer or self.expect_seq - 1 in self.present:
+                if self.expect_seq in self.recv_buffer:
+                    self.end += self.recv_buffer.pop(self.expect_seq)
+                self.expect_seq += 1
+            self.log.packet("Received data seq {}: {} / {}", seq, self.end, self.file_length)
+            self.log.progress(self.end, self.file_length, self.metrics.dropped)
+        elif self.mode == "sr" and seq < self.expect_seq + self.window:
+            # out-of-order chunk goes straight to its offset, only its length is kept
+            if seq not in self.recv_buffer and seq - 1 not in self.present:
+                self.recv_buffer[seq] = self.write_chunk(self.data, (seq - 1) * self.chunk_size)
+            else:
+                self.metrics.duplicates += 1
+                self.metrics.data(len(self.data), useful = False)
+            self.log.packet("Buffered data seq {}. Expecting {}", seq, self.expect_seq)
+        else:
+            self.metrics.data(len(self.data), useful = False)
+            self.log.packet("Msg received with out-of-window sequence number {}. Expecting {}", seq, self.expect_seq)
+        self.send_window_ack(seq)
+        return False
+
+    def send_window_ack(self, sack):
+        ###########################
+        # send cumulative ack with the selective ack seq and receive window appended
+        # rwnd: free packet slots left in the socket buffer and the reorder buffer
+        ###########################
+        rwnd = max(min(self.window, self.rcv_capacity) - len(self.recv_buffer), 0)
+        self.metrics.sent(HEADER.size)
+        self.io.send_pkt(self.client_addr, TYPE_ACK, sack, ack=self.expect_seq - 1, window=min(rwnd, 0xffff))
+
+    def resize_buffer(self, size):
+        ###########################
+        # grow the datagram buffer when the announced chunks do not fit in it
+        ###########################
+        if size <= self.buffer_size:
+            return
+        self.buffer_size = size
+        self.recv_buf = memoryview(bytearray(self.buffer_size))
+        self.rcv_capacity = self.sock.getsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF) // (2 * self.buffer_size)
+
+    def recv_into(self) -> tuple:
+        ###########################
+        # receive a datagram into recv_buf
+        # return (datagram view, address), the view is only valid until the next call
+        ###########################
+        nbytes, addr = self.sock.recvfrom_into(self.recv_buf)
+        self.metrics.received(nbytes)
+        return self.recv_buf[:nbytes], addr
+
+    def send_ack(self, ack, addr):
+        ###########################
+        # send stop-and-wait ack (seq and ack both set to the acked seq)
+        # acks of the start message carry start_reply
+        ###########################
+        pkt = make_pkt(TYPE_ACK, ack, self.start_reply if ack == 0 else b"", ack=ack)
+        self.metrics.sent(len(pkt))
+        self.sock.sendto(pkt, addr)
+
+    def resume(self, file_id):
+        ###########################
+        # load the progress of an earlier, interrupted transfer of the same file
+        # present chunks are skipped: start_reply tells the client which chunks are missing
+        # present chunks are read back once to add them to the file digest
+        ###########################
+        num_chunks = -(-self.file_length // self.chunk_size)
+        self.checkpoint = Checkpoint(self.file_adr, self.total_length, self.chunk_size, file_id,
+                                     self.offset // self.chunk_size, num_chunks)
+        self.present = self.checkpoint.load(os.fstat(self.fd).st_size)
+        if os.fstat(self.fd).st_size > self.total_length:
+            os.ftruncate(self.fd, self.total_length)
+        missing = missing_ranges(self.present, num_chunks)
+        self.pending = deque(idx for bgn, end in missing for idx in range(bgn, end))
+        self.present = set(range(num_chunks)) - set(self.pending)
+        if self.present:
+            self.start_reply = ("missing " + ",".join("{}-{}".format(bgn, end) for bgn, end in missing)).encode()
+            self.end = sum(min(self.chunk_size, self.file_length - idx * self.chunk_size) for idx in self.present)
+            for idx in self.present:
+                self.digest.update(idx, os.pread(self.fd, self.chunk_size, self.offset + idx * self.chunk_size)[:self.file_length - idx * self.chunk_size])
+            self.log.info("Resuming transfer: {} / {} bytes already received", self.end, self.file_length)
+        # window modes: skip present chunks at the beginning
+        while self.expect_seq - 1 in self.present:
+            self.expect_seq += 1
+
+    def preallocate(self):
+        ###########################
+        # reserve total_length bytes for the recv file once the start message arrives
+        # so every chunk can be written at its offset
+        ###########################
+        if self.total_length == 0:
+            return
+        try:
+            os.posix_fallocate(self.fd, 0, self.total_length)
+        except (AttributeError, OSError):
+            # not supported by the platform or file system
+            if os.fstat(self.fd).st_size < self.total_length:
+                os.ftruncate(self.fd, self.total_length)
+
+    def write_chunk(self, data, offset) -> int:
+        ###########################
+        # write data (bytes or memoryview, decoded first when compressed) at offset of the received range
+        # fsync every fsync_bytes if enabled, then add the chunk to the digest and mark it in the checkpoint
+        # return the length of the chunk written
+        ###########################
+        self.metrics.data(len(data))
+        if self.codec is not None:
+            data = self.codec.decode(data)
+        os.pwrite(self.fd, data, self.offset + offset)
+        if self.fsync_bytes:
+            self.unsynced += len(data)
+            if self.unsynced >= self.fsync_bytes:
+                os.fsync(self.fd)
+                self.unsynced = 0
+        self.digest.update(offset // self.chunk_size, data)
+        if self.checkpoint is not None:
+            self.checkpoint.mark(offset // self.chunk_size)
+        return len(data)
+
     def is_packet_dropped(self):
         ###########################
         # return if packet will drop
         ###########################
-        return True if self.prob > random.random() else False
+        return True if self.prob > self.rand.random() else False
+
+class CongestionControl():
+    
+    def __init__(self):
+        ###########################
+        # base class of sender rate controllers used by UDPClient.send_window
+        # window():         congestion window in packets
+        # send_delay(now):  seconds to wait before the next packet may be sent
+        # on_send(now):     a data packet was sent
+        # on_ack(n, flight):        n packets were newly acked
+        # on_partial_ack(n, flight):    n packets were newly acked during recovery, but not all sent before it began
+        # on_dup_ack(n, flight):    n-th duplicate ack, return True to fast retransmit
+        # on_timeout(flight):       retransmission timer expired
+        ############################
+        self.name = "none"
+
+    def window(self) -> float:
+        return float("inf")
+
+    def send_delay(self, now) -> float:
+        return 0
+
+    def on_send(self, now):
+        pass
+
+    def on_ack(self, acked, flight):
+        pass
+
+    def on_partial_ack(self, acked, flight):
+        pass
+
+    def on_dup_ack(self, dup_acks, flight) -> bool:
+        return dup_acks == 3
+
+    def on_timeout(self, flight):
+        pass
+
+    def stats(self) -> str:
+        return "Congestion control: {}".format(self.name)
+
+class RenoControl(CongestionControl):
+    
+    def __init__(self, init_cwnd=4):
+        ###########################
+        # TCP Reno like controller (in packets)
+        # cwnd:                 congestion window
+        # ssthresh:             slow start threshold
+        # recovery:             in fast recovery after fast retransmit
+        ############################
+        self.name = "reno"
+        self.cwnd = init_cwnd
+        self.ssthresh = float("inf")
+        self.recovery = False
+        self.max_cwnd = init_cwnd
+
+    def window(self) -> float:
+        return self.cwnd
+
+    def on_ack(self, acked, flight):
+        ###########################
+        # leave fast recovery, otherwise slow start or additive increase
+        ###########################
+        if self.recovery:
+            self.recovery = False
+            self.cwnd = self.ssthresh
+        elif self.cwnd < self.ssthresh:
+            self.cwnd += acked
+        else:
+            self.cwnd += acked / self.cwnd
+        self.max_cwnd = max(self.max_cwnd, self.cwnd)
+
+    def on_partial_ack(self, acked, flight):
+        ###########################
+        # NewReno: stay in fast recovery, deflate the window by the packets acked and allow one new packet
+        ###########################
+        self.cwnd = max(self.cwnd - acked + 1, 1)
+
+    def on_dup_ack(self, dup_acks, flight) -> bool:
+        ###########################
+        # 3rd duplicate ack: halve window and enter fast recovery
+        # further duplicate acks inflate the window during recovery
+        ###########################
+        if dup_acks == 3 and not self.recovery:
+            self.ssthresh = max(flight / 2, 2)
+            self.cwnd = self.ssthresh + 3
+            self.recovery = True
+            return True
+        if self.recovery:
+            self.cwnd += 1
+        return False
+
+    def on_timeout(self, flight):
+        ###########################
+        # multiplicative decrease and restart slow start
+        ###########################
+        self.ssthresh = max(flight / 2, 2)
+        self.cwnd = 1
+        self.recovery = False
+
+    def stats(self) -> str:
+        return "Congestion control: reno, cwnd {:.1f}, ssthresh {:.1f}, max cwnd {:.1f}".format(self.cwnd, self.ssthresh, self.max_cwnd)
+
+class FixedRateControl(CongestionControl):
+    
+    def __init__(self, rate=5000):
+        ###########################
+        # paces data packets at a fixed rate, no congestion window
+        # rate:                 packets per second
+        # next_time:            earliest time the next packet may be sent
+        ############################
+        self.name = "fixed"
+        self.rate = rate
+        self.next_time = 0
+
+    def send_delay(self, now) -> float:
+        return max(self.next_time - now, 0)
+
+    def on_send(self, now):
+        self.next_time = max(self.next_time, now) + 1 / self.rate
+
+    def stats(self) -> str:
+        return "Congestion control: fixed, {} packets/s".format(self.rate)
 
 class UDPClient():
     
-    def __init__(self, host, port, prob=0.1):
+    def __init__(self, host, port, prob=0.1, mode="sw", window=1, min_rto=0.05, max_rto=2, cc=None, batch=64,
+                 offset=0, length=None, chunk_size=2000, verbosity=PROGRESS, progress_interval=1.0, metrics_path=None,
+                 impairment=None, seed=None, codec=None, data=None):
         ###########################
         # variables
         # file_addr:            send file local address
-        # bytes_to_send:        file content in byte form
-        # file_length:          file length in byte
-        # chunk_size:           maximum chunk size per packet
+        # data:                 bytes (or mmap) to send instead of the file (items relayed by the Auctioneer)
+        # bytes_to_send:        memoryview of the memory-mapped file (range [offset, offset + length))
+        # file_length:          length in byte of the range to send
+        # offset:               start of the range in the file (striped transfer)
+        # length:               length of the range, None for the rest of the file
+        # total_length:         file length in byte
+        # chunk_size:           maximum chunk size per packet (announced in the start message)
+        # codec:                ChunkCodec compressing every chunk (announced in the start message, None: raw)
+        # encoded:              payloads of the encoded chunks in flight, by chunk index (kept for retransmission)
         # bgn:                  begin index when slicing bytes_to_send
         # end:                  end index when slicing bytes_to_send
-        # sock:                 udp socket
+        # sock:                 udp socket, an ImpairedSocket when impairment is given
+        # impairment:           Impairment applied to the packets sent (None: send as is)
         # server_addr:          UDP server address that client want to connect
         # buffer_size:          socket buffer size
         # seq:                  seq num used in relaible transfer
         # type:                 data type (0 or 1) when sending file
         # ack:                  ack num used in relaibel transfer
         # prob:                 packet loss probability
+        # rand:                 random generator of the packet loss, seeded with seed (None: unseeded)
+        # mode:                 "sw" stop-and-wait, "gbn" go-back-n, "sr" selective repeat
+        # window:               max number of outstanding data packets (gbn/sr)
+        # rtt:                  adaptive retransmission timer
+        # cc:                   congestion controller (gbn/sr), RenoControl by default
+        # rwnd:                 receive window advertised by the server
+        # batch:                datagrams per DatagramIO flush/wakeup (gbn/sr), <= 1 disables batching
+        # io:                   DatagramIO of the gbn/sr data path
+        # file_id:              identity of the file version (mtime in ns), lets the server resume
+        # present:              chunk indices the server already has (resumed transfer)
+        # digest:               FileDigest of the range, sent in "fin <digest>"
+        # fin_tries:            tries of fin before giving up
+        # metrics:              TransferMetrics of the sender (retransmits by cause, drops, phases, ...)
+        # metrics_path:         write the metrics as json to this file at the end (None: don't)
+        # log:                  TransferLog of the sender (verbosity, a progress line every progress_interval seconds)
         ############################
+        self.log = TransferLog(verbosity, progress_interval, ("retransmits", "dropped"),
+                               "[{}] ".format(port) if length is not None else "")
         # file setup
         self.file_adr = "tosend.file"
+        self.data = data
         self.bytes_to_send = None
         self.file_length = None
-        self.chunk_size = 2000
+        self.offset = offset
+        self.length = length
+        self.total_length = None
+        self.chunk_size = chunk_size
+        self.codec = codec
+        self.encoded = {}
         self.bgn = 0
         self.end = self.bgn + self.chunk_size
+        self.file_id = 0
+        self.present = set()
+        self.digest = None
         # udp socket setup
         self.sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self.impairment = impairment
+        if impairment is not None:
+            self.sock = ImpairedSocket(self.sock, impairment)
         self.server_addr = (host, port)
         self.buffer_size = 3000
         self.seq = 0
         self.type = 0
         self.ack = None
+        self.fin_tries = 10
         self.prob = prob
+        self.rand = random.Random(seed)
+        # sliding window setup
+        self.mode = mode
+        self.window = window if mode != "sw" else 1
+        # retransmission timer setup
+        self.rtt = RTTEstimator(min_rto, max_rto)
+        # congestion and flow control setup
+        self.cc = cc if cc is not None else RenoControl()
+        self.rwnd = self.window
+        self.batch = batch
+        self.io = None
+        # instrumentation
+        self.metrics = TransferMetrics("sender", self.rtt)
+        self.metrics_path = metrics_path
         # output UDP socket opened msg
-        print("UDP socket openned for RDT.")
+        self.log.info("UDP socket openned for RDT.")
     
     def send(self):
         ###########################
-        # 1. open tosend.file, store file content in bytes_to_send, and calculate total byte length
+        # 1. open tosend.file in binary mode, map the range to send into bytes_to_send, and get its byte length
         # 2. generate rand list 
-        # 3. send initial data (start file_length) to server(winner buyer)
-        # 4. start to send file content to server
+        # 3. send initial data (start file_length) to server(winner buyer),
+        #    the server answers with the chunks still missing when resuming
+        # 4. start to send file content (missing chunks only) to server
         # 5. send fin to server indicate end of transfer
         ###########################
-        # read file and get file length in byte
-        f = open(self.file_adr, "r")
-        self.bytes_to_send = f.read()
-        f.close()
-        self.file_length = len(self.bytes_to_send.encode())
+        # map file and get file length in byte (chunks are sliced without copying)
+        f, mm = None, None
+        if self.data is not None:
+            self.total_length = len(self.data)
+            file_view = memoryview(self.data)
+        else:
+            f = open(self.file_adr, "rb")
+            self.total_length = os.fstat(f.fileno()).st_size
+            self.file_id = os.fstat(f.fileno()).st_mtime_ns
+            mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) if self.total_length > 0 else None
+            file_view = memoryview(mm) if mm is not None else memoryview(b"")
+        end = self.total_length if self.length is None else min(self.offset + self.length, self.total_length)
+        self.bytes_to_send = file_view[self.offset:end]
+        self.file_length = len(self.bytes_to_send)
+        self.digest = FileDigest(-(-self.file_length // self.chunk_size))
         # send initial
-        print("Start sending file.")
-        print("Sending control seq {}: start {}".format(str(self.seq), str(self.file_length)))
+        self.log.info("Start sending file.")
+        self.log.info("Sending control seq {}: start {}", self.seq, self.file_length)
+        self.metrics.phase("start")
         self.send_start()
         # send data
+        self.metrics.phase("data")
         self.seq, self.type = 1, 1
+        if self.mode != "sw":
+            self.send_window()
         while self.bgn <= self.file_length:
-            print("Sending data seq {}: {} / {}".format(self.seq, self.end, self.file_length))
+            if self.bgn < self.file_length:
+                self.digest.update(self.bgn // self.chunk_size, self.bytes_to_send[self.bgn:self.end])
+            if self.bgn // self.chunk_size in self.present:
+                # already received before the interruption
+                self.bgn += self.chunk_size
+                self.end = min(self.end + self.chunk_size, self.file_length)
+                continue
+            self.log.packet("Sending data seq {}: {} / {}", self.seq, self.end, self.file_length)
             self.send_data()
         # send signal fin
         self.type = 0
-        print("Sending control seq {}: fin".format(str(self.seq)))
+        self.log.info("Sending control seq {}: fin", self.seq)
+        self.metrics.phase("fin")
         self.send_fin()
+        self.metrics.phase(None)
+        # unmap file
+        self.bytes_to_send.release()
+        file_view.release()
+        if mm is not None:
+            mm.close()
+        if f is not None:
+            f.close()
+        self.log.info(self.rtt.stats())
+        self.log.info(self.metrics.stats())
+        if self.mode != "sw":
+            self.log.info(self.cc.stats())
+            self.log.info(self.io.stats())
+        if self.impairment is not None:
+            self.log.info(self.impairment.stats())
+        if self.codec is not None:
+            self.log.info(self.codec.stats())
+        if self.metrics_path is not None:
+            self.metrics.save(self.metrics_path)
 
     def send_start(self):
         ###########################
         # try: 
         #       send start message to server
         #       wait for server response with timeout mechanism
+        #       an ack with payload "missing a-b,c-d" resumes an interrupted transfer
         # except socket.timeout:
         #       retransmit
         # except IPMisMatch:
@@ -309,32 +1898,68 @@ class UDPClient():
         # except PacketLossError:
         #       if packet loss: retransmit
         ###########################
+        tries = 0
         while True:
             try:
-                send_msg = str(self.seq) + str(self.type) + "start " + str(self.file_length)
-                self.sock.sendto(send_msg.encode(), self.server_addr)
-                self.sock.settimeout(2)
+                send_msg = "start " + str(self.file_length)
+                if self.mode != "sw":
+                    send_msg += " mode={} window={}".format(self.mode, self.window)
+                send_msg += " chunk={}".format(self.chunk_size)
+                if self.codec is not None:
+                    send_msg += " codec={}".format(self.codec.spec())
+                if self.file_length != self.total_length:
+                    send_msg += " offset={} total={}".format(self.offset, self.total_length)
+                send_msg += " id={}".format(self.file_id)
+                pkt = make_pkt(self.type, self.seq, send_msg.encode())
+                self.metrics.sent(len(pkt))
+                self.sock.sendto(pkt, self.server_addr)
+                sent_at = time.time()
+                tries += 1
+                self.sock.settimeout(self.rtt.rto)
                 msg_recv = self.sock.recvfrom(self.buffer_size)
-                self.ack = msg_recv[0].decode()[0]
+                self.metrics.received(len(msg_recv[0]))
+                _, _, self.ack, _, reply = unpack_pkt(msg_recv[0])
                 if msg_recv[1] != self.server_addr:
                     raise IPMisMatch
-                if self.ack != str(self.seq):
+                if self.ack != self.seq:
                     raise AckMisMatchError
                 if self.is_packet_dropped():
                     raise PacketLossError
             except socket.timeout:
-                print("Msg re-sent: {}".format(str(self.seq)))
+                self.rtt.backoff()
+                self.log.packet("Msg re-sent: {}", self.seq)
             except PacketLossError:
-                print("Ack dropped: {}".format(self.seq))
-                print("Msg re-sent: {}".format(str(self.seq)))
+                self.metrics.dropped += 1
+                self.log.packet("Ack dropped: {}", self.seq)
+                self.log.packet("Msg re-sent: {}", self.seq)
             except AckMisMatchError:
-                print("Ack received with mismatched sequence number {}. Expecting {}".format(self.ack, self.seq))
-                print("Msg re-sent: {}".format(str(self.seq)))
-            except IPMisMatch:
+                self.log.packet("Ack received with mismatched sequence number {}. Expecting {}", self.ack, self.seq)
+                self.log.packet("Msg re-sent: {}", self.seq)
+            except ChecksumError:
+                self.metrics.corrupted += 1
+                self.log.packet("Corrupted ack discarded")
+                self.log.packet("Msg re-sent: {}", self.seq)
+            except (IPMisMatch, HeaderError):
                 pass
             else:
-                print("Ack received: {}".format(self.ack))
+                if tries == 1:
+                    self.rtt.sample(time.time() - sent_at)
+                self.log.packet("Ack received: {}", self.ack)
+                self.parse_reply(bytes(reply).decode())
                 break
+
+    def parse_reply(self, reply):
+        ###########################
+        # "missing a-b,c-d": the server already has every chunk outside [a, b), [c, d)
+        ###########################
+        if not reply.startswith("missing "):
+            return
+        num_chunks = -(-self.file_length // self.chunk_size)
+        self.present = set(range(num_chunks))
+        for rng in filter(None, reply.split(" ")[1].split(",")):
+            bgn, end = rng.split("-")
+            self.present.difference_update(range(int(bgn), int(end)))
+        self.log.info("Resuming transfer: {} / {} chunks already received", len(self.present), num_chunks)
     
     def send_data(self):
         ###########################
@@ -350,41 +1975,299 @@ class UDPClient():
         # except PacketLossError:
         #       if packet loss: retransmit
         ###########################
+        tries = 0
+        cause = None
+        payload = self.chunk_payload(self.bgn // self.chunk_size)
         while True:
             try:
-                send_msg = str(self.seq) + str(self.type) + str(self.bytes_to_send[self.bgn:self.end])
-                self.sock.sendto(send_msg.encode(), self.server_addr)
-                self.sock.settimeout(2)
+                if cause is not None:
+                    self.metrics.retransmit(cause)
+                self.metrics.sent(HEADER.size + len(payload))
+                self.metrics.data(len(payload), useful = tries == 0)
+                send_pkt(self.sock, self.server_addr, self.type, self.seq, payload)
+                sent_at = time.time()
+                tries += 1
+                self.sock.settimeout(self.rtt.rto)
                 msg_recv = self.sock.recvfrom(self.buffer_size)
-                self.ack = msg_recv[0].decode()[0]
+                self.metrics.received(len(msg_recv[0]))
+                self.ack = unpack_pkt(msg_recv[0])[2]
                 if msg_recv[1] != self.server_addr:
                     raise IPMisMatch
-                if self.ack != str(self.seq):
+                if self.ack != self.seq:
                     raise AckMisMatchError 
                 if self.is_packet_dropped():
                     raise PacketLossError
             except socket.timeout:
-                print("Msg re-sent: {}".format(str(self.seq)))
+                cause = "timeout"
+                self.rtt.backoff()
+                self.log.packet("Msg re-sent: {}", self.seq)
             except PacketLossError:
-                print("Ack dropped: {}".format(self.seq))
-                print("Msg re-sent: {}".format(str(self.seq)))
+                cause = "drop"
+                self.metrics.dropped += 1
+                self.log.packet("Ack dropped: {}", self.seq)
+                self.log.packet("Msg re-sent: {}", self.seq)
             except AckMisMatchError:
-                print("Ack received with mismatched sequence number {}. Expecting {}".format(self.ack, self.seq))
-                print("Msg re-sent: {}".format(str(self.seq)))
-            except IPMisMatch:
-                pass
+                cause = "mismatch"
+                self.log.packet("Ack received with mismatched sequence number {}. Expecting {}", self.ack, self.seq)
+                self.log.packet("Msg re-sent: {}", self.seq)
+            except ChecksumError:
+                cause = "corrupt"
+                self.metrics.corrupted += 1
+                self.log.packet("Corrupted ack discarded")
+                self.log.packet("Msg re-sent: {}", self.seq)
+            except (IPMisMatch, HeaderError):
+                cause = "mismatch"
             else:
+                if tries == 1:
+                    self.rtt.sample(time.time() - sent_at)
                 self.seq = 1 if self.seq == 0 else 0
+                self.encoded.pop(self.bgn // self.chunk_size, None)
                 self.bgn += self.chunk_size
                 self.end += self.chunk_size
                 self.end = self.file_length if self.end > self.file_length else self.end
-                print("Ack received: {}".format(self.ack))
+                self.log.packet("Ack received: {}", self.ack)
+                self.log.progress(min(self.bgn, self.file_length), self.file_length, self.metrics.total_retransmits(),
+                                  self.metrics.dropped)
                 break
     
+    def send_window(self):
+        ###########################
+        # send file content with go-back-n or selective repeat
+        # data packet seq runs from 1 to num_chunks
+        # ack packet: ack = cumulative ack, seq = selective ack, window = rwnd
+        # packets in flight are limited by min(window, cwnd, rwnd):
+        #       window:     configured max window
+        #       cwnd:       congestion window of the congestion controller
+        #       rwnd:       free buffer advertised by the receiver
+        # packets are queued on DatagramIO and flushed together before waiting,
+        # all acks that arrived meanwhile are drained in one wakeup
+        # 3 duplicate acks trigger fast retransmit of base,
+        # sr resends every hole below the highest selectively acked packet at once,
+        # and a hole with 3 selectively acked packets above it as soon as that is known
+        # (flight - 1 of them when fewer than 4 packets are in flight)
+        # recovery (NewReno) lasts until every packet sent before the fast retransmit is acked,
+        # a partial ack meanwhile means the next hole is lost too, it is resent right away,
+        # a resent packet is lost again once packets sent after its retransmission are acked:
+        #       gbn:  base is resent after 3 duplicate acks during recovery
+        #       sr:   any hole is resent on the first selective ack of such a packet
+        # on timeout:
+        #       gbn:  go back to base and resend everything from there
+        #       sr:   only the expired packets are resent
+        # chunks already present at the server (resume) are never sent
+        # afterward seq is set to num_chunks + 1 for fin
+        ###########################
+        num_chunks = -(-self.file_length // self.chunk_size)
+        self.io = DatagramIO(self.sock, self.batch, self.buffer_size)
+        base, next_seq, highest_sent = 1, 1, 0
+        send_time = {}
+        resent = set()
+        # chunks the server already has count as acked (resumed transfer)
+        acked = set(idx + 1 for idx in self.present)
+        for seq in acked:
+            self.update_digest(seq)
+        while base in acked:
+            base += 1
+        next_seq = base
+        dup_acks = 0
+        # highest seq selectively acked (sr), the packets below it that are not acked are holes
+        # holes below lost_mark have been resent already
+        highest_sack, lost_mark = 0, 1
+        # highest seq sent when fast recovery began, 0 while not recovering
+        # lost_again: duplicate acks during recovery for packets sent after base was last sent (gbn)
+        recover, lost_again = 0, 0
+        # transmission number of the last send of every packet (sr)
+        self.tx_order, self.tx_count = {}, 0
+        # why packets below highest_sent are sent again after going back (gbn)
+        resend_cause = "timeout"
+        while base <= num_chunks:
+            now = time.time()
+            while next_seq <= num_chunks and self.cc.send_delay(now) == 0:
+                flight = next_seq - base
+                if flight >= min(self.window, self.cc.window(), self.rwnd) and flight > 0:
+                    break
+                if next_seq in acked:
+                    next_seq += 1
+                    continue
+                cause = None
+                if next_seq <= highest_sent:
+                    resent.add(next_seq)
+                    cause = resend_cause
+                    self.log.packet("Msg re-sent: {}", next_seq)
+                else:
+                    self.update_digest(next_seq)
+                self.send_window_pkt(next_seq, num_chunks, cause)
+                self.cc.on_send(now)
+                send_time[next_seq] = now
+                highest_sent = max(highest_sent, next_seq)
+                next_seq += 1
+            # wait for the earliest retransmission deadline or the next paced send
+            timeouts = []
+            if next_seq > base:
+                timeouts.append(min(send_time[s] for s in range(base, next_seq) if s not in acked) + self.rtt.rto - now)
+            if next_seq <= num_chunks and self.cc.send_delay(now) > 0:
+                timeouts.append(self.cc.send_delay(now))
+            try:
+                datagrams = self.io.recv(max(min(timeouts), 0.0001) if timeouts else self.rtt.rto)
+            except socket.timeout:
+                now = time.time()
+                if next_seq == base or now - min(send_time[s] for s in range(base, next_seq) if s not in acked) < self.rtt.rto:
+                    # woken up for pacing or zero window
+                    continue
+                rto = self.rtt.rto
+                self.rtt.backoff()
+                self.cc.on_timeout(next_seq - base)
+                dup_acks, recover, lost_again = 0, 0, 0
+                if self.mode == "gbn":
+                    next_seq = base
+                    resend_cause = "timeout"
+                    continue
+                for s in range(base, next_seq):
+                    if s not in acked and now - send_time[s] >= rto:
+                        self.log.packet("Msg re-sent: {}", s)
+                        self.send_window_pkt(s, num_chunks, "timeout")
+                        send_time[s] = now
+                        resent.add(s)
+                continue
+            # every ack drained in this wakeup is processed before sending again
+            for datagram, addr in datagrams:
+                self.metrics.received(len(datagram))
+                try:
+                    if addr != self.server_addr:
+                        raise IPMisMatch
+                    if self.is_packet_dropped():
+                        raise PacketLossError
+                    _, sack, cum_ack, self.rwnd, _ = unpack_pkt(datagram)
+                    if sack == 0:
+                        # late ack of start message
+                        continue
+                except PacketLossError:
+                    self.metrics.dropped += 1
+                    self.log.packet("Ack dropped")
+                    continue
+                except ChecksumError:
+                    self.metrics.corrupted += 1
+                    continue
+                except (IPMisMatch, HeaderError):
+                    continue
+                self.log.packet("Ack received: {} (sack {}, rwnd {})", cum_ack, sack, self.rwnd)
+                now = time.time()
+                if self.mode == "sr" and base <= sack < next_seq and sack not in acked:
+                    acked.add(sack)
+                    highest_sack = max(highest_sack, sack)
+                    if sack not in resent:
+                        self.rtt.sample(now - send_time[sack])
+                    # fewer than 4 packets in flight can not bring 3 selective acks above a hole (early retransmit)
+                    dupthresh = min(3, max(next_seq - base - 1, 1))
+                    for s in range(max(lost_mark, base), sack + 1 - dupthresh):
+                        if s not in acked and s not in resent:
+                            self.log.packet("Hole resent: {}", s)
+                            self.send_window_pkt(s, num_chunks, "dup_ack")
+                            send_time[s] = now
+                            resent.add(s)
+                    lost_mark = max(lost_mark, sack + 1 - dupthresh)
+                    # a resent hole is lost again once a packet sent after its retransmission is acked
+                    for s in sorted(resent):
+                        if base <= s < sack and s not in acked and self.tx_order[s] < self.tx_order[sack]:
+                            self.log.packet("Retransmission lost, re-sent: {}", s)
+                            self.send_window_pkt(s, num_chunks, "dup_ack")
+                            send_time[s] = now
+                if cum_ack >= base:
+                    self.rtt.reset_backoff()
+                    if cum_ack < next_seq and cum_ack not in resent and cum_ack not in acked:
+                        self.rtt.sample(now - send_time[cum_ack])
+                    newly_acked = cum_ack + 1 - base
+                    base = cum_ack + 1
+                    while base in acked:
+                        base += 1
+                        newly_acked += 1
+                    next_seq = max(next_seq, base)
+                    acked = set(s for s in acked if s >= base)
+                    resent = set(s for s in resent if s >= base)
+                    if self.encoded:
+                        self.encoded = {idx: payload for idx, payload in self.encoded.items() if idx >= base - 1}
+                    dup_acks, lost_again = 0, 0
+                    if recover and base <= recover:
+                        self.cc.on_partial_ack(newly_acked, next_seq - base)
+                        # base sent before the packet just acked is lost (again), sent later (or in the same
+                        # burst) it may still arrive
+                        if base < next_seq and send_time[base] < send_time.get(cum_ack, now):
+                            self.log.packet("Partial ack, re-sent: {}", base)
+                            if self.mode == "gbn":
+                                next_seq = base
+                                resend_cause = "dup_ack"
+                            else:
+                                self.send_window_pkt(base, num_chunks, "dup_ack")
+                                send_time[base] = now
+                                resent.add(base)
+                    else:
+                        recover = 0
+                        self.cc.on_ack(newly_acked, next_seq - base)
+                    self.log.progress(min((base - 1) * self.chunk_size, self.file_length), self.file_length,
+                                      self.metrics.total_retransmits(), self.metrics.dropped)
+                elif cum_ack == base - 1 and next_seq > base:
+                    dup_acks += 1
+                    if self.cc.on_dup_ack(dup_acks, next_seq - base):
+                        self.log.packet("Fast retransmit: {}", base)
+                        recover = highest_sent
+                        if self.mode == "gbn":
+                            next_seq = base
+                            resend_cause = "dup_ack"
+                        else:
+                            for s in range(base, max(highest_sack, base + 1)):
+                                if s not in acked and (s == base or s not in resent):
+                                    self.send_window_pkt(s, num_chunks, "dup_ack")
+                                    send_time[s] = now
+                                    resent.add(s)
+                    elif self.mode == "gbn" and recover and base < sack < next_seq and send_time[sack] >= send_time[base]:
+                        lost_again += 1
+                        if lost_again == 3:
+                            lost_again = 0
+                            self.log.packet("Retransmission lost, re-sent: {}", base)
+                            next_seq = base
+                            resend_cause = "dup_ack"
+        self.io.close()
+        self.seq = num_chunks + 1
+        self.bgn = self.file_length + 1
+
+    def update_digest(self, seq):
+        ###########################
+        # add chunk seq to the file digest when it is sent the first time
+        ###########################
+        bgn = (seq - 1) * self.chunk_size
+        self.digest.update(seq - 1, self.bytes_to_send[bgn:bgn + self.chunk_size])
+
+    def chunk_payload(self, idx) -> bytes:
+        ###########################
+        # payload of chunk idx: a slice of bytes_to_send, or its encoding when compressing
+        # (encoded once, the cached payload is re-sent until the chunk is acked)
+        ###########################
+        bgn = idx * self.chunk_size
+        chunk = self.bytes_to_send[bgn:bgn + self.chunk_size]
+        if self.codec is None:
+            return chunk
+        if idx not in self.encoded:
+            self.encoded[idx] = self.codec.encode(chunk)
+        return self.encoded[idx]
+
+    def send_window_pkt(self, seq, num_chunks, cause=None):
+        ###########################
+        # send data packet of chunk seq, cause is the reason of a retransmission (None: first send)
+        ###########################
+        payload = self.chunk_payload(seq - 1)
+        self.log.packet("Sending data seq {}: {} / {}", seq, min(seq * self.chunk_size, self.file_length), self.file_length)
+        if cause is not None:
+            self.metrics.retransmit(cause)
+        self.metrics.sent(HEADER.size + len(payload))
+        self.metrics.data(len(payload), useful = cause is None)
+        # transmission order, packets of one burst share their send time
+        self.tx_count += 1
+        self.tx_order[seq] = self.tx_count
+        self.io.send_pkt(self.server_addr, self.type, seq, payload)
+
     def send_fin(self):
         ###########################
         # try: 
-        #       send fin message to server
+        #       send fin message ("fin <file digest>") to server
         #       wait for server response with timeout mechanism
         # except socket.timeout:
         #       retransmit
@@ -394,52 +2277,249 @@ class UDPClient():
         #       if ack not match with seq num, discard and retransmit
         # except PacketLossError:
         #       if packet loss: retransmit
+        # after fin_tries unanswered tries the server is assumed to be gone (its ack of fin was lost)
         ###########################
+        fin_pkt = make_pkt(self.type, self.seq, "fin {}".format(self.digest.hexdigest()).encode())
+        tries = 0
         while True:
+            if tries >= self.fin_tries:
+                self.log.info("No ack of fin after {} tries, giving up", tries)
+                break
             try:
-                send_msg = str(self.seq) + str(self.type) + "fin"
-                self.sock.sendto(send_msg.encode(), self.server_addr)
-                self.sock.settimeout(2)
+                self.metrics.sent(len(fin_pkt))
+                self.sock.sendto(fin_pkt, self.server_addr)
+                sent_at = time.time()
+                tries += 1
+                self.sock.settimeout(self.rtt.rto)
                 msg_recv = self.sock.recvfrom(self.buffer_size)
-                self.ack = msg_recv[0].decode()[0]
+                self.metrics.received(len(msg_recv[0]))
+                self.ack = unpack_pkt(msg_recv[0])[2]
                 if msg_recv[1] != self.server_addr:
                     raise IPMisMatch
-                if self.ack != str(self.seq):
+                if self.ack != self.seq:
                     raise AckMisMatchError 
             except socket.timeout:
-                print("Msg re-sent: {}".format(str(self.seq)))
+                self.rtt.backoff()
+                self.log.packet("Msg re-sent: {}", self.seq)
             except AckMisMatchError:
-                print("Ack received with mismatched sequence number {}. Expecting {}".format(self.ack, self.seq))
-                print("Msg re-sent: {}".format(str(self.seq)))
-            except IPMisMatch:
+                self.log.packet("Ack received with mismatched sequence number {}. Expecting {}", self.ack, self.seq)
+                self.log.packet("Msg re-sent: {}", self.seq)
+            except ChecksumError:
+                self.metrics.corrupted += 1
+                self.log.packet("Corrupted ack discarded")
+                self.log.packet("Msg re-sent: {}", self.seq)
+            except (IPMisMatch, HeaderError):
                 pass
             else:
-                print("Ack received: {}".format(self.ack))
+                if tries == 1:
+                    self.rtt.sample(time.time() - sent_at)
+                self.log.packet("Ack received: {}", self.ack)
                 break
 
     def is_packet_dropped(self):
         ###########################
         # return if packet will drop
         ###########################
-        return True if self.prob > random.random() else False
+        return True if self.prob > self.rand.random() else False
+
+def split_ranges(length, streams, chunk_size) -> list:
+    ###########################
+    # split [0, length) into streams (offset, length) ranges aligned to 8 chunks
+    # (so streams never share a byte of the checkpoint bitmap)
+    ###########################
+    num_chunks = -(-length // chunk_size)
+    per_stream = -(-num_chunks // streams)
+    per_stream = -(-per_stream // 8) * 8 * chunk_size
+    ranges = []
+    for i in range(streams):
+        bgn = min(i * per_stream, length)
+        ranges.append((bgn, min(bgn + per_stream, length) - bgn))
+    return ranges
+
+def stream_kwargs(kwargs, port) -> dict:
+    ###########################
+    # options of the stream on port: metrics go to <metrics_path>.<port>,
+    # the loss and impairment seeds are offset by the port so streams see different drops
+    ###########################
+    kwargs = dict(kwargs)
+    if kwargs.get("metrics_path"):
+        kwargs["metrics_path"] = "{}.{}".format(kwargs["metrics_path"], port)
+    if kwargs.get("seed") is not None:
+        kwargs["seed"] += port
+    if kwargs.get("impairment") is not None:
+        kwargs["impairment"] = kwargs["impairment"].fork(port)
+    return kwargs
+
+def send_stream(host, port, prob, offset, length, kwargs):
+    ###########################
+    # worker process: send one range of tosend.file
+    ###########################
+    kwargs = stream_kwargs(kwargs, port)
+    UDPClient(host, port, prob, offset=offset, length=length, **kwargs).send()
+
+def recv_stream(queue, host, port, prob, kwargs):
+    ###########################
+    # worker process: receive one range into recved.file and report its timing
+    ###########################
+    kwargs = stream_kwargs(kwargs, port)
+    server = UDPServer(host, port, prob, striped=True, **kwargs)
+    server.recv()
+    queue.put((port, server.file_length, server.start_time, server.end_time))
+
+def send_striped(host, port, prob, streams, kwargs):
+    ###########################
+    # striped transfer (seller): split tosend.file into streams byte ranges
+    # stream i is sent by its own process to UDP port + i
+    ###########################
+    ranges = split_ranges(os.path.getsize("tosend.file"), streams, kwargs.get("chunk_size", 2000))
+    workers = []
+    for i, (offset, length) in enumerate(ranges):
+        workers.append(multiprocessing.Process(target = send_stream, args = (host, port + i, prob, offset, length, kwargs)))
+        workers[-1].start()
+    for worker in workers:
+        worker.join()
+
+def recv_striped(host, port, prob, streams, kwargs):
+    ###########################
+    # striped transfer (winner buyer): receive stream i on UDP port + i in its
+    # own process, every process writes its range into the same preallocated file
+    # the shared progress file is removed once every stream has finished
+    # output per-stream and aggregate throughput
+    ###########################
+    queue = multiprocessing.Queue()
+    workers = []
+    for i in range(streams):
+        workers.append(multiprocessing.Process(target = recv_stream, args = (queue, host, port + i, prob, kwargs)))
+        workers[-1].start()
+    results = sorted(queue.get() for worker in workers)
+    for worker in workers:
+        worker.join()
+    if os.path.exists("recved.file.part"):
+        os.remove("recved.file.part")
+    for i, (stream_port, length, start_time, end_time) in enumerate(results):
+        tct = end_time - start_time
+        print("Stream {} (port {}): {} bytes / {:.6f} seconds = {:.6f} bytes/s".format(i, stream_port, length, tct, length / tct))
+    total = sum(r[1] for r in results)
+    tct = max(r[3] for r in results) - min(r[2] for r in results)
+    print("Transmission finished ({} streams): {} bytes / {:.6f} seconds = {:.6f} bytes/s".format(streams, total, tct, total / tct))
+
+def parse_impairment(opts):
+    ###########################
+    # Impairment from the --seed/--drop/--burst/--delay/--jitter/--reorder/--duplicate/--corrupt options,
+    # None if none of them impairs anything (raise ValueError on a malformed value)
+    ###########################
+    burst = [float(x) for x in opts["burst"].split(",")] if opts["burst"] else [0.0]
+    reorder = [float(x) for x in opts["reorder"].split(",")] if opts["reorder"] else [0.0]
+    impairment = Impairment(int(opts["seed"]) if opts["seed"] else None, float(opts["drop"]),
+                            burst[0], burst[1] if len(burst) > 1 else 1.0, burst[2] if len(burst) > 2 else 1.0,
+                            float(opts["delay"]) / 1000, float(opts["jitter"]) / 1000,
+                            reorder[0], reorder[1] / 1000 if len(reorder) > 1 else 0.005,
+                            float(opts["duplicate"]), float(opts["corrupt"]))
+    if not (impairment.loss or impairment.burst_p or impairment.delay or impairment.jitter or impairment.reorder
+            or impairment.duplicate or impairment.corrupt):
+        return None
+    return impairment
+
+def parse_options(argv) -> tuple:
+    ###########################
+    # split command line into positional arguments and --key=value options
+    # options:
+    #   --mode=sw|gbn|sr        rdt mode (stop-and-wait, go-back-n, selective repeat)
+    #   --window=N              sliding window size in packets (gbn/sr)
+    #   --min-rto=SEC           lower bound of retransmission timeout
+    #   --max-rto=SEC           upper bound of retransmission timeout
+    #   --cc=reno|fixed         congestion controller (gbn/sr)
+    #   --rate=N                packets per second of the fixed rate controller
+    #   --fsync=BYTES           receiver fsyncs the recv file every BYTES written (0: never)
+    #   --batch=N               datagrams per batched send/receive (gbn/sr), 1 disables batching
+    #   --streams=N             striped transfer over N processes on UDP ports rdt_port .. rdt_port + N - 1
+    #   --chunk=BYTES           payload bytes per data packet (seller, announced to the winner buyer)
+    #   --codec=NAME[:LEVEL]    compress every chunk with none, zlib or lzma at LEVEL 0-9 (seller, announced to the winner buyer)
+    #   --answers=A,B,...       answer the server's prompts with A, B, ... in order instead of asking the user
+    #   --script=PATH           answer the server's prompts with the lines of PATH in order
+    #   --verbose=0|1|2         transfer output: 0 result only, 1 progress every --progress seconds, 2 every packet
+    #   --progress=SEC          seconds between progress lines
+    #   --metrics=PATH          write the transfer metrics as json to PATH at the end (PATH.<port> per stream)
+    #   --seed=N                seed of the packet loss and the impairments (reproducible runs)
+    # impairments of the packets this side sends (see Impairment):
+    #   --drop=P                drop probability
+    #   --burst=P,R[,LOSS]      Gilbert-Elliott burst loss: good->bad P, bad->good R, drop probability LOSS when bad
+    #   --delay=MS              added delay
+    #   --jitter=MS             delay varies uniformly by +-MS
+    #   --reorder=P[,MS]        hold a packet back another MS (default 5) with probability P
+    #   --duplicate=P           send a packet twice with probability P
+    #   --corrupt=P             flip a bit of a packet with probability P
+    ###########################
+    args, opts = [], {"mode": "sw", "window": "32", "min_rto": "0.05", "max_rto": "2", "cc": "reno", "rate": "5000", "fsync": "0",
+                      "batch": "64", "streams": "1", "chunk": "2000", "codec": "none",
+                      "answers": "", "script": "", "verbose": "1", "progress": "1",
+                      "metrics": "", "seed": "", "drop": "0", "burst": "", "delay": "0", "jitter": "0", "reorder": "",
+                      "duplicate": "0", "corrupt": "0"}
+    for arg in argv:
+        if arg.startswith("--") and "=" in arg:
+            key, value = arg[2:].split("=", 1)
+            opts[key.replace("-", "_")] = value
+        else:
+            args.append(arg)
+    return args, opts
 
 if __name__ == '__main__':
+    args, opts = parse_options(sys.argv[1:])
+    try:
+        impairment = parse_impairment(opts)
+    except ValueError:
+        impairment = False
+    try:
+        codec = ChunkCodec.from_spec(opts["codec"])
+    except ValueError:
+        codec = False
     # check input format
-    if len(sys.argv) != 4 and len(sys.argv) != 5:
+    if len(args) != 3 and len(args) != 4 or opts["mode"] not in ("sw", "gbn", "sr") or not opts["window"].isdigit() or opts["cc"] not in ("reno", "fixed") \
+            or not opts["streams"].isdigit() or int(opts["streams"]) < 1 or not opts["chunk"].isdigit() \
+            or not 1 <= int(opts["chunk"]) <= 65507 - HEADER.size - (1 if codec else 0) or opts["verbose"] not in ("0", "1", "2") \
+            or impairment is False or codec is False:
         print(f"Usage: {sys.argv[0]} <host> <port> <rdt_port>")
         print(f"Usage: {sys.argv[0]} <host> <port> <rdt port> <packet loss rate>")
+        print("Options: --mode=sw|gbn|sr --window=<packets> --min-rto=<sec> --max-rto=<sec> --cc=reno|fixed --rate=<packets/s> --fsync=<bytes> --batch=<datagrams> --streams=<N> --chunk=<bytes> --codec=none|zlib|lzma[:level] --answers=<a,b,...> --script=<path> --verbose=0|1|2 --progress=<sec> --metrics=<path>")
+        print("Impairments: --seed=<N> --drop=<p> --burst=<p,r[,loss]> --delay=<ms> --jitter=<ms> --reorder=<p[,ms]> --duplicate=<p> --corrupt=<p>")
         sys.exit(1)
     # check input data integrity
     host, port, rdt_port, pkt_loss_rate = None, None, None, "0"
-    if len(sys.argv) == 4:
-        host, port, rdt_port = sys.argv[1:4]
-    elif len(sys.argv) == 5:
-        host, port, rdt_port, pkt_loss_rate = sys.argv[1:5]
-    # run client
-    client = Client(host, int(port))
+    if len(args) == 3:
+        host, port, rdt_port = args[0:3]
+    elif len(args) == 4:
+        host, port, rdt_port, pkt_loss_rate = args[0:4]
+    mode, window = opts["mode"], int(opts["window"])
+    min_rto, max_rto = float(opts["min_rto"]), float(opts["max_rto"])
+    cc = RenoControl() if opts["cc"] == "reno" else FixedRateControl(float(opts["rate"]))
+    streams = int(opts["streams"])
+    # the winner buyer's random sequences are offset by one from the seller's
+    seed = int(opts["seed"]) if opts["seed"] else None
+    send_kwargs = {"mode": mode, "window": window, "min_rto": min_rto, "max_rto": max_rto, "cc": cc, "batch": int(opts["batch"]),
+                   "chunk_size": int(opts["chunk"]), "verbosity": int(opts["verbose"]),
+                   "progress_interval": float(opts["progress"]), "metrics_path": opts["metrics"] or None,
+                   "impairment": impairment, "seed": seed, "codec": codec}
+    recv_kwargs = {"mode": mode, "window": window, "min_rto": min_rto, "max_rto": max_rto, "fsync_bytes": int(opts["fsync"]),
+                   "batch": int(opts["batch"]), "verbosity": int(opts["verbose"]),
+                   "progress_interval": float(opts["progress"]), "metrics_path": opts["metrics"] or None,
+                   "impairment": impairment.fork(1) if impairment else None, "seed": None if seed is None else seed + 1}
+    # run client, prompts are answered by the user unless answers are scripted
+    answer = keyboard
+    if opts["script"]:
+        answer = answers_from_file(opts["script"])
+    elif opts["answers"]:
+        answer = scripted(opts["answers"].split(","))
+    # an item upload to the Auctioneer (relay mode) uses the seller's transfer options
+    client = Client(host, int(port), answer, upload_kwargs = dict(send_kwargs, prob = float(pkt_loss_rate), metrics_path = None))
     client.start_connections()
     # run UDP server or client
     if client.state == 1: # seller (UDP client)
-        UDPClient(client.udp_addr, int(rdt_port), float(pkt_loss_rate)).send()
+        if streams > 1:
+            send_striped(client.udp_addr, int(rdt_port), float(pkt_loss_rate), streams, send_kwargs)
+        else:
+            UDPClient(client.udp_addr, int(rdt_port), float(pkt_loss_rate), **send_kwargs).send()
     elif client.state == 2: # client (UDP server)
-        UDPServer("0.0.0.0", int(rdt_port), float(pkt_loss_rate)).recv()
\ No newline at end of file
+        if streams > 1:
+            recv_striped("0.0.0.0", int(rdt_port), float(pkt_loss_rate), streams, recv_kwargs)
+        else:
+            UDPServer("0.0.0.0", int(rdt_port), float(pkt_loss_rate), **recv_kwargs).recv()
@@ -0,0 +1,64 @@
+#################################
+# Author: Po-Hsun Lin
+#################################
+import struct
+
+###########################
+# auction message frame (TCP, network byte order, 5 byte header)
+# type:         message type (MSG_*)
+# length:       length in byte of the utf-8 payload that follows
+###########################
+FRAME = struct.Struct("!BI")
+MAX_LENGTH = 1 << 20
+# server -> client
+MSG_INFO = 0        # text to show
+MSG_PROMPT = 1      # text to show, then the client answers with a MSG_REQUEST
+MSG_PEER = 2        # "seller <ip>" / "buyer <ip>": auction won / sold, peer of the file transfer
+                    # "relay" / "upload <port>": the Auctioneer relays the item, the seller offers it / uploads it
+MSG_BYE = 3         # text to show, the server closes the connection
+# client -> server
+MSG_REQUEST = 4     # action request, join request, bid, or "item <hash> <size>" (seller, relay mode)
+
+def pack_msg(type, text) -> bytes:
+    ###########################
+    # frame a message, text is str or utf-8 bytes
+    ###########################
+    payload = text.encode() if isinstance(text, str) else text
+    return FRAME.pack(type, len(payload)) + payload
+
+class FrameError(Exception):
+    # raise when a frame is too long or its payload is not utf-8
+    pass
+
+class MessageBuffer():
+
+    def __init__(self):
+        ###########################
+        # reassemble messages from a byte stream
+        # buf:                  received bytes not parsed yet (at most one partial frame)
+        ############################
+        self.buf = bytearray()
+
+    def feed(self, data) -> list:
+        ###########################
+        # add received bytes, return every complete message as (type, text)
+        # a partial frame stays in buf until the rest arrives
+        # a malformed frame raises FrameError
+        ###########################
+        self.buf += data
+        msgs = []
+        pos = 0
+        while len(self.buf) - pos >= FRAME.size:
+            type, length = FRAME.unpack_from(self.buf, pos)
+            if length > MAX_LENGTH:
+                raise FrameError
+            if len(self.buf) - pos - FRAME.size < length:
+                break
+            pos += FRAME.size
+            try:
+                msgs.append((type, self.buf[pos:pos + length].decode()))
+            except UnicodeDecodeError:
+                raise FrameError
+            pos += length
+        del self.buf[:pos]
+        return msgs
@@ -3,232 +3,1176 @@
 #################################
 from curses.ascii import isdigit
 import socket
+import select
+import selectors
 import threading
+import multiprocessing
+import itertools
+import math
+import mmap
+import types
+from collections import deque, OrderedDict
+import json
+import os
+import secrets
+import signal
 import sys
 import time
+from auc_protocol import *
+from auc_client_rdt import UDPClient, UDPServer, content_hash, SILENT
 
-class ThreadedServer():
-    def __init__(self, host, port):
-        ###########################
-        # variables
-        # status:               status state
-        # type:                 bid type
-        # lowest_price:         bid lowesr price
-        # num_of_bids:          numbers of bids
-        # cur_num_of_bids:      current numbers of bids (buyers)
-        # item_name:            bid item name
-        # seller:               seller's connection and address
-        # buyers:               store buyer's connection and addrress
-        # bids:                 buyers' bid value
-        # cur_num_bids_left:    num of buyers that has not bid yet
-        # final_price:          final prize for auction
-        ############################
-        self.status = -1
-        self.type = 0
-        self.lowest_price = 0
-        self.num_of_bids = 0
+def listener(host, port, reuse_port=False):
+    ###########################
+    # welcoming socket bound to (host, port), exit if the address can not be assigned
+    # reuse_port: several sockets (one per worker process) share the port, the kernel spreads connections over them
+    ###########################
+    sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    if reuse_port:
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEPORT, 1)
+    try:
+        sock.bind((host, port))
+    except OSError:
+        print(f'Can not assign address {host}. Please try again using other host.')
+        sys.exit(1)
+    return sock
+
+class Auction():
+    ###########################
+    # state of one auction
+    # id:                   auction id (key in the server's registry)
+    # status:               1 waiting for buyers, 2 bidding, 3 finished
+    # type:                 bid type
+    # lowest_price:         bid lowesr price
+    # num_of_bids:          numbers of bids
+    # cur_num_of_bids:      current numbers of bids (buyers)
+    # item_name:            bid item name
+    # seller:               seller's connection and address
+    # buyers:               store buyer's connection and addrress
+    # bids:                 buyers' bid value
+    # cur_num_bids_left:    num of buyers that has not bid yet
+    # final_price:          final prize for auction
+    # tickets:              resume ticket of the seller (first) and of every buyer (journal only)
+    # top/second:           serial of the buyer with the highest / second highest bid so far (None: no such bid)
+    # deadline:             timer of the current phase (TimerWheel): cancelling the auction while it waits for buyers,
+    #                       closing the bidding round, None once finished
+    # item:                 content hash of the item once the relay has it (ItemRelay), None: the seller sends it
+    ############################
+    __slots__ = ("id", "status", "type", "lowest_price", "num_of_bids", "cur_num_of_bids", "item_name",
+                 "seller", "buyers", "bids", "cur_num_bids_left", "final_price", "tickets", "top", "second", "deadline", "item")
+
+    def __init__(self, id, type, lowest_price, num_of_bids, item_name, seller):
+        self.id = id
+        self.status = 1
+        self.type = type
+        self.lowest_price = lowest_price
+        self.num_of_bids = num_of_bids
         self.cur_num_of_bids = 0
-        self.item_name = ''
-        self.seller = None
+        self.item_name = item_name
+        self.seller = seller
         self.buyers = []
         self.bids = []
         self.cur_num_bids_left = 0
         self.final_price = 0
+        self.tickets = []
+        self.top = None
+        self.second = None
+        self.deadline = None
+        self.item = None
 
-        # socket setup
-        self.sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-        self.sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    def rank(self, serial):
+        ###########################
+        # update top/second with the bid of buyer serial, O(1) per bid
+        # equal bids rank the later buyer higher
+        ###########################
+        key = (self.bids[serial], serial)
+        if self.top is None or key > (self.bids[self.top], self.top):
+            self.second, self.top = self.top, serial
+        elif self.second is None or key > (self.bids[self.second], self.second):
+            self.second = serial
+
+class AuctionJournal():
+    def __init__(self, path, commit_interval=0.005, compact_ratio=4, min_compact=1024):
+        ###########################
+        # write-ahead journal of auction events, one json line per event (see apply)
+        # append() writes the event right away (it survives a crash of the server process),
+        # a flusher thread fsyncs every event written during commit_interval at once (group commit),
+        # so bids never wait for the disk
+        # live keeps the state of every auction that is not finished; once the journal holds more than
+        # compact_ratio records per live auction, it is rewritten as one "state" record per live auction,
+        # so replaying it on startup takes time proportional to the live auctions, not to the history
+        # results of finished auctions are also appended to <path>.results, which is never compacted (audit trail)
+        # variables
+        # path:                 journal file
+        # fd/results_fd:        journal and results file descriptors (append)
+        # live:                 auction id -> state (dict) of every auction in the journal that is not finished
+        # records:              records in the journal file
+        # unsynced:             records written since the last fsync
+        # commits/synced:       fsyncs done and records they made durable (group commit statistics)
+        # lock:                 guards the files and live (append is called by every client thread)
+        # cond:                 wakes the flusher when records are written
+        ############################
+        self.path = path
+        self.commit_interval = commit_interval
+        self.compact_ratio = compact_ratio
+        self.min_compact = min_compact
+        self.live = {}
+        self.records = 0
+        self.unsynced = 0
+        self.commits = 0
+        self.synced = 0
+        self.closed = False
+        self.lock = threading.Lock()
+        self.cond = threading.Condition(self.lock)
+        self.replay()
+        self.fd = os.open(path, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+        self.results_fd = os.open(path + ".results", os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+        self.flusher = threading.Thread(target = self.flush_loop, daemon = True)
+        self.flusher.start()
+
+    def replay(self):
+        ###########################
+        # rebuild live from the journal, a torn last line (crash while writing it) is cut off
+        ###########################
+        if not os.path.exists(self.path):
+            return
+        good = 0
+        with open(self.path, "rb") as f:
+            for line in f:
+                try:
+                    event = json.loads(line)
+                except ValueError:
+                    break
+                if not line.endswith(b"\n"):
+                    break
+                self.apply(event)
+                self.records += 1
+                good += len(line)
+        if good < os.path.getsize(self.path):
+            os.truncate(self.path, good)
+
+    def apply(self, event):
+        ###########################
+        # update live with one event
+        # open:     new auction (type, lowest_price, num_of_bids, item, seller address, ticket)
+        # join:     buyer joined (address, ticket)
+        # bid:      bid of buyer serial
+        # resume:   participant serial (-1: seller) reconnected from a new address
+        # result:   auction finished, it is no longer live
+        # state:    whole state of a live auction (written by compaction)
+        ###########################
+        ev, id = event["ev"], event["id"]
+        if ev == "open":
+            self.live[id] = {"id": id, "type": event["type"], "lowest_price": event["lowest_price"],
+                             "num_of_bids": event["num_of_bids"], "item": event["item"], "seller": event["seller"],
+                             "tickets": [event["ticket"]], "buyers": [], "bids": {}}
+        elif ev == "state":
+            self.live[id] = event["auction"]
+        elif id not in self.live:
+            return
+        elif ev == "join":
+            self.live[id]["buyers"].append(event["buyer"])
+            self.live[id]["tickets"].append(event["ticket"])
+        elif ev == "bid":
+            self.live[id]["bids"][str(event["serial"])] = event["price"]
+        elif ev == "resume":
+            if event["serial"] < 0:
+                self.live[id]["seller"] = event["addr"]
+            else:
+                self.live[id]["buyers"][event["serial"]] = event["addr"]
+        elif ev == "result":
+            del self.live[id]
+
+    def append(self, event):
+        ###########################
+        # write an event (results also go to the audit trail), it is fsynced by the next group commit
+        ###########################
+        line = (json.dumps(event) + "\n").encode()
+        with self.lock:
+            os.write(self.fd, line)
+            if event["ev"] == "result":
+                os.write(self.results_fd, line)
+            self.apply(event)
+            self.records += 1
+            self.unsynced += 1
+            self.cond.notify()
+
+    def flush_loop(self):
+        ###########################
+        # flusher thread: wait for records, let more arrive for commit_interval, fsync them all at once
+        ###########################
+        while True:
+            with self.lock:
+                while not self.unsynced and not self.closed:
+                    self.cond.wait()
+                if self.closed and not self.unsynced:
+                    return
+            time.sleep(self.commit_interval)
+            with self.lock:
+                count, self.unsynced = self.unsynced, 0
+                fd, results_fd = self.fd, self.results_fd
+            os.fsync(fd)
+            os.fsync(results_fd)
+            self.commits += 1
+            self.synced += count
+            if self.records > max(self.min_compact, self.compact_ratio * len(self.live)):
+                self.compact()
+
+    def compact(self):
+        ###########################
+        # rewrite the journal as one state record per live auction (atomic rename, then fsync of the directory)
+        ###########################
+        with self.lock:
+            tmp = self.path + ".tmp"
+            with open(tmp, "wb") as f:
+                for state in self.live.values():
+                    f.write((json.dumps({"ev": "state", "id": state["id"], "auction": state}) + "\n").encode())
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(tmp, self.path)
+            dir_fd = os.open(os.path.dirname(os.path.abspath(self.path)), os.O_RDONLY)
+            os.fsync(dir_fd)
+            os.close(dir_fd)
+            os.close(self.fd)
+            self.fd = os.open(self.path, os.O_WRONLY | os.O_APPEND)
+            self.records = len(self.live)
+            self.unsynced = 0
+
+    def close(self):
+        ###########################
+        # fsync what is left and stop the flusher
+        ###########################
+        with self.lock:
+            self.closed = True
+            self.cond.notify()
+        self.flusher.join()
+        os.close(self.fd)
+        os.close(self.results_fd)
+
+    def stats(self) -> str:
+        return "Journal: {} live auctions, {} records, {} fsyncs for {} records".format(
+            len(self.live), self.records, self.commits, self.synced)
+
+class TimerWheel():
+    def __init__(self, tick=0.05, slots=512):
+        ###########################
+        # hashed timer wheel: a timer due in n ticks goes into slot (now + n) % slots, so adding and
+        # cancelling a timer is O(1) whatever the number of timers (one per connection and auction)
+        # advance() visits one slot per elapsed tick and runs the timers that are due, timers further
+        # away than one turn of the wheel stay in their slot until their tick comes
+        # variables
+        # tick:                 seconds per slot, timers fire up to one tick late
+        # slots:                timers of every slot, serial -> (tick due, callback)
+        # current:              last tick handled by advance()
+        # start:                time of tick 0
+        # pending:              number of timers not yet run or cancelled
+        # serials:              serial of the next timer
+        # lock:                 guards the slots (timers are added by every client thread of ThreadedServer)
+        ############################
+        self.tick = tick
+        self.slots = [{} for i in range(slots)]
+        self.current = 0
+        self.start = time.time()
+        self.pending = 0
+        self.serials = itertools.count()
+        self.lock = threading.Lock()
+
+    def add(self, delay, callback) -> tuple:
+        ###########################
+        # run callback (in advance) after delay seconds, return the timer to cancel it
+        ###########################
+        with self.lock:
+            due = max(self.current, int((time.time() - self.start) / self.tick)) + max(1, math.ceil(delay / self.tick))
+            timer = (due % len(self.slots), next(self.serials))
+            self.slots[timer[0]][timer[1]] = (due, callback)
+            self.pending += 1
+        return timer
+
+    def cancel(self, timer):
+        if timer is None:
+            return
+        with self.lock:
+            if self.slots[timer[0]].pop(timer[1], None) is not None:
+                self.pending -= 1
+
+    def advance(self, now):
+        ###########################
+        # run every timer due by now, the callbacks run outside the lock (they may add timers)
+        ###########################
+        due = []
+        with self.lock:
+            target = int((now - self.start) / self.tick)
+            while self.current < target and self.pending > len(due):
+                self.current += 1
+                slot = self.slots[self.current % len(self.slots)]
+                for serial in [serial for serial, (tick, callback) in slot.items() if tick <= self.current]:
+                    due.append(slot.pop(serial)[1])
+            self.current = max(self.current, target)
+            self.pending -= len(due)
+        for callback in due:
+            callback()
+
+    def timeout(self, now):
+        ###########################
+        # seconds until the next tick, None without timers (nothing to wake up for)
+        ###########################
+        if self.pending == 0:
+            return None
+        return max(self.start + (self.current + 1) * self.tick - now, 0)
+
+class ItemCache():
+    def __init__(self, directory, memory_bytes=64 << 20, disk_bytes=1 << 30):
+        ###########################
+        # items relayed by the Auctioneer, keyed by content hash (see content_hash), least recently used first
+        # once the items in memory take more than memory_bytes, the least recently used ones are spilled to
+        # <directory>/<hash>, once the spilled items take more than disk_bytes, the least recently used are removed
+        # spilled items are found again after a restart, unfinished uploads are removed
+        # variables
+        # entries:              hash -> item bytes (in memory) or None (on disk), least recently used first
+        # sizes:                hash -> item size
+        # memory/disk:          bytes of the items in memory / on disk
+        # hits/misses:          items found / not found by get()
+        # spills/evictions:     items moved to disk / removed
+        # lock:                 guards the entries (upload and relay threads)
+        ############################
+        self.directory = directory
+        self.memory_bytes = memory_bytes
+        self.disk_bytes = disk_bytes
+        self.entries = OrderedDict()
+        self.sizes = {}
+        self.memory = 0
+        self.disk = 0
+        self.hits = 0
+        self.misses = 0
+        self.spills = 0
+        self.evictions = 0
+        self.lock = threading.Lock()
+        os.makedirs(directory, exist_ok = True)
+        paths = [os.path.join(directory, name) for name in os.listdir(directory)]
+        for path in sorted(filter(os.path.isfile, paths), key = os.path.getmtime):
+            key = os.path.basename(path)
+            if len(key) == 64 and all(c in "0123456789abcdef" for c in key):
+                self.entries[key] = None
+                self.sizes[key] = os.path.getsize(path)
+                self.disk += self.sizes[key]
+            else:
+                os.remove(path)
+        with self.lock:
+            self.evict()
+
+    def __contains__(self, key) -> bool:
+        return key in self.entries
+
+    def path(self, key) -> str:
+        return os.path.join(self.directory, key)
+
+    def fits(self, size) -> bool:
+        # every item may end up on disk
+        return size <= self.disk_bytes
+
+    def get(self, key):
+        ###########################
+        # bytes (in memory) or a read-only mmap (on disk) of an item, None if it is not cached
+        # the file is mapped under the lock, so an eviction can not remove it first, the mapping stays
+        # readable after the file is removed, the caller closes it
+        ###########################
+        with self.lock:
+            if key not in self.entries:
+                self.misses += 1
+                return None
+            self.hits += 1
+            self.entries.move_to_end(key)
+            data = self.entries[key]
+            if data is not None or self.sizes[key] == 0:
+                return data or b""
+            with open(self.path(key), "rb") as f:
+                return mmap.mmap(f.fileno(), 0, access = mmap.ACCESS_READ)
+
+    def put(self, key, path) -> bool:
+        ###########################
+        # move the file at path into the cache as item key, False if it is too large
+        # an item that fits in memory is read into it, a larger one stays on disk
+        ###########################
+        size = os.path.getsize(path)
+        if not self.fits(size):
+            os.remove(path)
+            return False
+        with self.lock:
+            self.discard(key)
+            if size <= self.memory_bytes:
+                with open(path, "rb") as f:
+                    self.entries[key] = f.read()
+                os.remove(path)
+                self.memory += size
+            else:
+                os.replace(path, self.path(key))
+                self.entries[key] = None
+                self.disk += size
+            self.sizes[key] = size
+            self.evict()
+        return True
+
+    def discard(self, key):
+        ###########################
+        # remove an item (lock held)
+        ###########################
+        if key not in self.entries:
+            return
+        data, size = self.entries.pop(key), self.sizes.pop(key)
+        if data is not None:
+            self.memory -= size
+            return
+        self.disk -= size
         try:
-            self.sock.bind((host, port))
+            os.remove(self.path(key))
         except OSError:
-            print(f'Can not assign address {host}. Please try again using other host.')
-            sys.exit(1)
+            pass
+
+    def evict(self):
+        ###########################
+        # spill the least recently used items in memory, then remove the least recently used on disk (lock held)
+        # a file that is being relayed stays readable until the relay is done with it (get() maps it)
+        ###########################
+        for key in [key for key, data in self.entries.items() if data is not None]:
+            if self.memory <= self.memory_bytes:
+                break
+            with open(self.path(key), "wb") as f:
+                f.write(self.entries[key])
+            self.entries[key] = None
+            self.memory -= self.sizes[key]
+            self.disk += self.sizes[key]
+            self.spills += 1
+        for key in [key for key, data in self.entries.items() if data is None]:
+            if self.disk <= self.disk_bytes:
+                break
+            self.discard(key)
+            self.evictions += 1
+
+    def stats(self) -> str:
+        return "Item cache: {} items, {} bytes in memory, {} bytes on disk, {} hits, {} misses, {} spilled, {} evicted".format(
+            len(self.entries), self.memory, self.disk, self.hits, self.misses, self.spills, self.evictions)
+
+class ItemRelay():
+    def __init__(self, host, port, directory, memory_bytes=64 << 20, disk_bytes=1 << 30, mode="sr", window=32, upload_timeout=600):
+        ###########################
+        # relay mode: a seller uploads the item once to the Auctioneer, which keeps it in an ItemCache
+        # and sends it to the winner itself, so the seller does not have to stay online and an item
+        # that is sold again is not uploaded again
+        # every upload gets an RDT UDPServer on a port of its own, every delivery an RDT UDPClient (threads)
+        # variables
+        # host:                 address the upload ports are bound to
+        # port:                 UDP port the winners receive the item on (the clients' rdt_port)
+        # cache:                ItemCache of the items
+        # mode/window:          rdt mode and window of the deliveries
+        # upload_timeout:       seconds an upload may take, see abort()
+        # uploads:              hash -> callbacks waiting for the upload in progress of that item
+        # saved:                uploads skipped because the item was cached
+        # lock:                 guards uploads
+        ############################
+        self.host = host
+        self.port = port
+        self.cache = ItemCache(directory, memory_bytes, disk_bytes)
+        self.mode = mode
+        self.window = window
+        self.upload_timeout = upload_timeout
+        self.uploads = {}
+        self.saved = 0
+        self.lock = threading.Lock()
+
+    def upload(self, key, done):
+        ###########################
+        # receive item key from a seller, done() is called once it is cached
+        # return the UDPServer (its port is announced to the seller), or None if the item is
+        # uploaded by another seller already (done() is called when that upload is cached)
+        ###########################
+        with self.lock:
+            if key in self.uploads:
+                self.uploads[key].append(done)
+                return None
+            self.uploads[key] = [done]
+        server = UDPServer(self.host, 0, 0, verbosity = SILENT)
+        server.sock.bind((self.host, 0))
+        server.file_adr = os.path.join(self.cache.directory, "upload." + key)
+        threading.Thread(target = self.receive, args = (server, key), daemon = True).start()
+        return server
+
+    def receive(self, server, key):
+        ###########################
+        # upload thread: the item is cached if it arrived whole and matches its hash
+        ###########################
+        cached = False
+        try:
+            server.recv()
+            cached = server.verified and content_hash(server.file_adr) == key and self.cache.put(key, server.file_adr)
+        except Exception:
+            # aborted, or a broken upload
+            pass
+        finally:
+            server.sock.close()
+            for path in (server.file_adr, server.file_adr + ".part"):
+                if os.path.exists(path):
+                    os.remove(path)
+            with self.lock:
+                callbacks = self.uploads.pop(key)
+        print(f'Relay: item {key[:12]} {"cached" if cached else "upload failed"}. {self.cache.stats()}')
+        if cached:
+            for done in callbacks:
+                done()
+
+    def abort(self, server):
+        ###########################
+        # stop an upload that did not finish within upload_timeout (no-op once it finished)
+        # shutdown wakes up the upload thread, which then fails on the closed socket
+        ###########################
+        if server.sock.fileno() == -1:
+            return
+        try:
+            server.sock.shutdown(socket.SHUT_RDWR)
+        except OSError:
+            pass
+        server.sock.close()
+
+    def deliver(self, key, host) -> bool:
+        ###########################
+        # send item key to the winner at host (thread), False if it is no longer cached
+        ###########################
+        item = self.cache.get(key)
+        if item is None:
+            return False
+        threading.Thread(target = self.send, args = (key, item, host), daemon = True).start()
+        return True
+
+    def send(self, key, item, host):
+        client = UDPClient(host, self.port, 0, self.mode, self.window, verbosity = SILENT, data = item)
+        # same item, same id: the winner may resume an interrupted delivery
+        client.file_id = int(key[:15], 16)
+        try:
+            client.send()
+            print(f'Relay: item {key[:12]} delivered to {host}:{self.port}')
+        except OSError as e:
+            print(f'Relay: delivery of item {key[:12]} to {host}:{self.port} failed ({e})')
+        finally:
+            if isinstance(item, mmap.mmap):
+                item.close()
+
+class Outbox():
+    def __init__(self, conn):
+        ###########################
+        # frames waiting to be sent to one client of ThreadedServer
+        # put() sends what the socket takes right away without blocking, a writer thread of the connection
+        # sends the rest while the client is not reading, so no thread ever waits for a client holding a lock
+        # a client that does not read for the socket timeout (idle timeout) is disconnected
+        # variables
+        # conn:                 client connection (blocking, with the idle timeout)
+        # buf:                  framed bytes not sent yet
+        # writing:              the writer thread is running
+        # closing:              close the connection once buf is sent
+        # poll:                 tells whether conn is writable, a send on it never waits then
+        # lock:                 guards buf, writing and closing (any thread sends to any client)
+        ############################
+        self.conn = conn
+        self.buf = bytearray()
+        self.writing = False
+        self.closing = False
+        self.poll = select.poll()
+        self.poll.register(conn, select.POLLOUT)
+        self.lock = threading.Lock()
+
+    def put(self, data, close=False):
+        ###########################
+        # queue framed data and send as much of it as possible, close: close the connection afterwards
+        ###########################
+        with self.lock:
+            self.buf += data
+            self.closing = self.closing or close
+            if self.writing:
+                return
+            try:
+                if self.poll.poll(0):
+                    del self.buf[:self.conn.send(self.buf, socket.MSG_DONTWAIT)]
+            except BlockingIOError:
+                pass
+            except OSError:
+                # client already gone
+                self.buf.clear()
+            if self.buf:
+                self.writing = True
+                threading.Thread(target = self.drain, daemon = True).start()
+                return
+            close = self.closing
+        if close:
+            self.shutdown()
+
+    def drain(self):
+        ###########################
+        # writer thread: send buf until it is empty, the lock is not held while sending
+        ###########################
+        while True:
+            with self.lock:
+                data = bytes(self.buf)
+                self.buf.clear()
+                if not data:
+                    self.writing = False
+                    break
+            try:
+                self.conn.sendall(data)
+            except OSError:
+                # client gone or not reading, the rest of its frames can not be sent
+                with self.lock:
+                    self.buf.clear()
+                    self.writing = False
+                    self.closing = True
+                break
+        if self.closing:
+            self.shutdown()
+
+    def shutdown(self):
+        ###########################
+        # close the connection, shutdown wakes up the client's thread blocked in recv
+        ###########################
+        try:
+            self.conn.shutdown(socket.SHUT_RDWR)
+        except OSError:
+            pass
+        self.conn.close()
+
+class ThreadedServer():
+    def __init__(self, host, port, sock=None, journal=None, idle_timeout=60, bid_timeout=60, open_timeout=600, relay=None):
+        ###########################
+        # variables
+        # auctions:             registry of running auctions, auction id -> Auction
+        # next_id:              id of the next auction
+        # id_step:              next_id increment (number of workers sharing the id space)
+        # lock:                 guards the registry and the auctions (threads of all clients)
+        # outboxes:             Outbox of every connected client, conn -> Outbox (ThreadedServer only)
+        # sock:                 welcoming socket, bound here unless an already bound one is given
+        # journal:              AuctionJournal of the auction events, None: auctions are only kept in memory
+        # timers:               TimerWheel of the idle timeouts, bidding deadlines and teardowns
+        # idle_timeout:         seconds a client that is not in an auction may stay silent (0: forever)
+        # bid_timeout:          seconds the buyers have to bid once bidding started, then the round
+        #                       is closed with the bids received so far (0: wait for every bid)
+        # open_timeout:         seconds an auction may wait for its buyers, then it is cancelled (0: forever)
+        # relay:                ItemRelay delivering the items to the winners, None: sellers send them directly
+        ############################
+        self.auctions = {}
+        self.next_id = 1
+        self.id_step = 1
+        self.journal = journal
+        self.timers = TimerWheel()
+        self.idle_timeout = idle_timeout
+        self.bid_timeout = bid_timeout
+        self.open_timeout = open_timeout
+        self.relay = relay
+        self.lock = threading.Lock()
+        self.outboxes = {}
+
+        # socket setup
+        if sock is not None:
+            self.sock = sock
+            return
+        self.sock = listener(host, port)
         print('Auctioneer is ready for hosting acutions!')
-        
+
     def listen(self):
         ###########################
-        # status == -1: before seller connected to the server
-        # status ==  0: seller connected to the server and waiting seller to input
-        #               other connection request will be rejected (accept first and then reject immediately)
-        # status ==  1: auction start, waiting for buyers to connect
-        # status ==  2: all buyers has connected to the server, bidding starts
-        #               other connection request will be rejected (accept first and then reject immediately)
+        # every client gets its own thread
+        # the client either submits an action request (Seller of a new auction)
+        # or joins an auction that is waiting for buyers (Buyer)
+        # any number of auctions run in parallel
         ###########################
-        self.sock.listen(5)
-        while True:
-            conn, addr = self.sock.accept()
-            conn.settimeout(60)
-            conn.send(b'Connected to the Auctioneer server.\n')
-            if self.status == -1:
-                self.status = 0
-                self.seller = tuple((conn, addr))
-                threading.Thread(target = self.listenToSeller, args = (conn,)).start()
-                send_text = b"Your Role is: [Seller]\nPlease submit action request:"
-                show_text = f"Seller is connected from {addr[0]}:{addr[1]}\n>> New Seller Thread spawned"
-                conn.send(send_text)
-                print(show_text)
-            elif self.status == 1:
-                self.cur_num_of_bids += 1
-                threading.Thread(target = self.listenToBuyer, args = (conn, self.cur_num_of_bids - 1)).start()
-                self.buyers.append(tuple((conn,addr)))
-                send_text = b'Your Role is: [Buyer]'
-                show_text = f'Buyer {self.cur_num_of_bids} is connected from {addr[0]}:{addr[1]}'
-                if self.cur_num_of_bids < self.num_of_bids:
-                    send_text += b'\nThe Auctioneer is still wating for other Buyer to connect...'
-                else:
-                    self.status = 2
-                    threading.Thread(target = self.startBidding, args = ()).start()
-                    show_text += '\nRequest number of bidders arrived. Lets start bidding!'
-                    show_text += '\n>> New Bidding Thread spawned'
-                conn.send(send_text)
-                print(show_text)
-            elif self.status == 0 or self.status == 2:
-                send_text = b'Server is Busy. Try to connect again later.'
-                conn.send(send_text)
-                conn.close()
-    
-    def listenToSeller(self, conn):
+        threading.Thread(target = self.tick, daemon = True).start()
+        self.restore()
+        self.sock.listen(128)
+        try:
+            while True:
+                conn, addr = self.sock.accept()
+                conn.settimeout(self.idle_timeout or None)
+                data = types.SimpleNamespace(addr = addr, auction = None, serial = -1, inb = MessageBuffer(), last = time.time())
+                self.outboxes[conn] = Outbox(conn)
+                self.send(conn, b'Connected to the Auctioneer server.')
+                with self.lock:
+                    greeting = self.greeting()
+                self.send(conn, greeting, MSG_PROMPT)
+                self.watch(conn, data)
+                threading.Thread(target = self.listenToClient, args = (conn, data)).start()
+                print(f"Client is connected from {addr[0]}:{addr[1]}\n>> New Client Thread spawned")
+        finally:
+            if self.journal is not None:
+                self.journal.close()
+
+    def tick(self):
         ###########################
-        # new thread
-        # wait for seller (first client) to be connected to the server
-        # after connected, invalid input will be checked by function sellerInputValid
-        # if input is valid, server start waiting to buyer connection
+        # timer thread, runs the timers that are due every tick
         ###########################
         while True:
-            try:
-                data = conn.recv(1024)
-                if data:
-                    if self.sellerInputValid(data.decode()):
-                        self.status = 1
-                        send_text = b'Server: Auction start.'
-                        show_text = f'Action request recieved. Now wating for Buyer.'
-                        conn.send(send_text)
-                        print(show_text)
-                    else:
-                        send_text = b'Server: Invalid action request!\nPlease submit action request:' 
-                        conn.send(send_text)
-            except KeyboardInterrupt:
-                print("Caught keyboard interrupt, exiting")
-            except:
-                conn.close()
-                return False
+            time.sleep(self.timers.tick)
+            self.timers.advance(time.time())
+
+    def schedule(self, delay, callback) -> tuple:
+        ###########################
+        # run callback after delay seconds (on the timer thread, or in the event loop of EventLoopServer),
+        # return the timer (cancel with self.timers.cancel)
+        ###########################
+        return self.timers.add(delay, callback)
 
-    def listenToBuyer(self, conn, serial):
+    def watch(self, conn, data):
+        ###########################
+        # start the idle timeout of a new client, data.last is the time of its last request
+        ###########################
+        if self.idle_timeout:
+            self.schedule(self.idle_timeout, lambda: self.checkIdle(conn, data))
+
+    def checkIdle(self, conn, data):
+        ###########################
+        # idle timeout of a client: a client in an auction is left alone (the auction's deadline covers it),
+        # one that sent a request since is checked again idle_timeout after that request,
+        # otherwise it is disconnected
+        # the timer is not moved on every request, which keeps requests free of timer work
+        ###########################
+        if conn.fileno() == -1 or data.auction is not None:
+            return
+        idle = time.time() - data.last
+        if idle < self.idle_timeout:
+            self.schedule(self.idle_timeout - idle, lambda: self.checkIdle(conn, data))
+            return
+        print(f"Client {data.addr[0]}:{data.addr[1]} idle for {self.idle_timeout} s, disconnecting")
+        self.broadcast({conn: [pack_msg(MSG_BYE, b'Disconnecting from the Auctioneer server. Idle for too long!')]}, close = True)
+
+    def listenToClient(self, conn, data):
         ###########################
         # new thread
-        # wait for buyers to be connected to the server
-        # after connected, invalid input will be checked by function 
+        # read the framed requests of a client (several per read, or split over reads)
+        # and handle them one by one, see onRequest
+        # a receive timeout only wakes the thread up, the idle timeout is checkIdle's
         ###########################
         while True:
             try:
-                data = conn.recv(1024)
-                if data:
-                    if self.buyerInputValid(data.decode(), serial):
-                        self.cur_num_bids_left -= 1
-                        send_text = b'Server: Bid recieved. Please wait...'
-                        show_text = f'>> Buyer 1 bid ${self.bids[serial]}'
-                        conn.send(send_text)
-                        print(show_text)
-                        if self.cur_num_bids_left == 0:
-                            self.manifestWinner()
-                    else:
-                        send_text = b'Server: Invalid bid! Please submit a positve integer!\nPlease submit your bid:' 
-                        conn.send(send_text)
+                recv_data = conn.recv(1024)
+                if not recv_data:
+                    self.outboxes.pop(conn, None)
+                    conn.close()
+                    return False
+                data.last = time.time()
+                for type, text in data.inb.feed(recv_data):
+                    if type != MSG_REQUEST:
+                        continue
+                    with self.lock:
+                        finished = self.onRequest(conn, data, text)
+                    if finished is not None:
+                        self.manifestWinner(finished)
+            except socket.timeout:
+                continue
             except KeyboardInterrupt:
                 print("Caught keyboard interrupt, exiting")
             except:
+                self.outboxes.pop(conn, None)
                 conn.close()
                 return False
-    
-    def startBidding(self):
+
+    def onRequest(self, conn, data, text):
         ###########################
-        # new thread
-        # start the bidding 
+        # new client:   a valid action request opens an auction (seller), "join" makes it a buyer
+        # buyer:        bid
+        # seller:       "item <hash> <size>" in relay mode, otherwise nothing to do until the result
+        # return the auction once every buyer has bid, the caller announces the winner
+        ###########################
+        if data.auction is None:
+            if text.split(' ')[0] == 'join':
+                joined = self.joinAuction(conn, data.addr, text)
+            elif text.split(' ')[0] == 'resume' and self.journal is not None:
+                joined = self.resumeAuction(conn, data.addr, text)
+            else:
+                joined = self.openAuction(conn, data.addr, text)
+            if joined is not None:
+                data.auction, data.serial = joined
+        elif data.serial >= 0 and self.placeBid(conn, data.auction, data.serial, text):
+            return data.auction
+        elif data.serial < 0 and self.relay is not None and text.split(' ')[0] == 'item':
+            self.offerItem(conn, data.auction, text)
+        return None
+
+    def openAuctions(self) -> list:
+        ###########################
+        # (id, item name, buyers joined, buyers wanted) of every auction waiting for buyers
+        ###########################
+        return [(a.id, a.item_name, a.cur_num_of_bids, a.num_of_bids) for a in self.auctions.values() if a.status == 1]
+
+    def greeting(self) -> bytes:
+        ###########################
+        # list the auctions waiting for buyers and ask for a request
+        ###########################
+        open_auctions = [f'{id} {item} ({cur}/{num} buyers)' for id, item, cur, num in self.openAuctions()]
+        text = 'Open auctions: ' + ', '.join(open_auctions) if open_auctions else 'No open auctions.'
+        text += '\nPlease submit action request, or join <auction id|item name> to bid:'
+        return text.encode()
+
+    def openAuction(self, conn, addr, data):
+        ###########################
+        # action request of a new client
+        # valid:    register a new auction with the client as seller, return (auction, -1)
+        # invalid:  ask again, return None
+        ###########################
+        if not self.sellerInputValid(data):
+            self.send(conn, b'Server: Invalid action request!\nPlease submit action request:', MSG_PROMPT)
+            return None
+        splt = data.split(' ')
+        auction = Auction(self.next_id, int(splt[0]), int(splt[1]), int(splt[2]), splt[3], tuple((conn, addr)))
+        self.register(auction)
+        self.armExpiry(auction)
+        self.next_id += self.id_step
+        self.send(conn, f'Your Role is: [Seller]\nServer: Auction start. Auction id: {auction.id}'.encode())
+        if self.journal is not None:
+            auction.tickets.append(secrets.token_hex(4))
+            self.journal.append({"ev": "open", "id": auction.id, "type": auction.type, "lowest_price": auction.lowest_price,
+                                 "num_of_bids": auction.num_of_bids, "item": auction.item_name, "seller": list(addr),
+                                 "ticket": auction.tickets[0]})
+            self.sendTicket(conn, auction, -1)
+        if self.relay is not None:
+            self.send(conn, b'relay', MSG_PEER)
+        print(f'Auction {auction.id} ({auction.item_name}) opened by Seller {addr[0]}:{addr[1]}. Now wating for Buyer.')
+        return auction, -1
+
+    def offerItem(self, conn, auction, data):
+        ###########################
+        # relay mode: "item <hash> <size>" of the seller, ask for the upload unless the relay has the item already
+        # the hash names the cache files, so anything but 64 lowercase hex digits is ignored
+        # the upload runs in a thread of the relay and is aborted if it is not done in time
+        ###########################
+        splt = data.split(' ')
+        if len(splt) != 3 or len(splt[1]) != 64 or not all(c in '0123456789abcdef' for c in splt[1]) or not splt[2].isdigit() \
+                or auction.status == 3 or auction.item is not None:
+            return
+        key = splt[1]
+        def done():
+            auction.item = key
+        if key in self.relay.cache:
+            auction.item = key
+            self.relay.saved += 1
+            self.send(conn, b'Server: The Auctioneer has this item already, no upload needed.')
+        elif not self.relay.cache.fits(int(splt[2])):
+            self.send(conn, b'Server: The item is too large for the Auctioneer, send it to the winner yourself.')
+        else:
+            server = self.relay.upload(key, done)
+            if server is None:
+                self.send(conn, b'Server: The Auctioneer is receiving this item already, no upload needed.')
+                return
+            self.schedule(self.relay.upload_timeout, lambda: self.relay.abort(server))
+            self.send(conn, f'upload {server.sock.getsockname()[1]}', MSG_PEER)
+
+    def joinAuction(self, conn, addr, data):
+        ###########################
+        # "join":           join the oldest auction waiting for buyers
+        # "join <id>":      join auction id
+        # "join <item>":    join the auction selling item
+        # return (auction, buyer serial), or None if there is no such auction waiting for buyers
+        # bidding starts once the requested number of buyers joined
+        ###########################
+        splt = data.split(' ')
+        auction = None
+        for a in self.auctions.values():
+            if a.status == 1 and (len(splt) == 1 or splt[1] == str(a.id) or splt[1] == a.item_name):
+                auction = a
+                break
+        if auction is None:
+            self.send(conn, b'Server: No such auction is waiting for buyers.\n' + self.greeting(), MSG_PROMPT)
+            return None
+        auction.cur_num_of_bids += 1
+        auction.buyers.append(tuple((conn, addr)))
+        serial = auction.cur_num_of_bids - 1
+        if self.journal is not None:
+            auction.tickets.append(secrets.token_hex(4))
+            self.journal.append({"ev": "join", "id": auction.id, "buyer": list(addr), "ticket": auction.tickets[-1]})
+        send_text = f'Your Role is: [Buyer] in auction {auction.id} ({auction.item_name})'.encode()
+        show_text = f'Buyer {auction.cur_num_of_bids} of auction {auction.id} is connected from {addr[0]}:{addr[1]}'
+        if auction.cur_num_of_bids < auction.num_of_bids:
+            send_text += b'\nThe Auctioneer is still wating for other Buyer to connect...'
+            self.send(conn, send_text)
+            self.sendTicket(conn, auction, serial)
+        else:
+            self.send(conn, send_text)
+            self.sendTicket(conn, auction, serial)
+            show_text += '\nRequest number of bidders arrived. Lets start bidding!'
+            self.startBidding(auction)
+        print(show_text)
+        return auction, serial
+
+    def placeBid(self, conn, auction, serial, data) -> bool:
+        ###########################
+        # bid of a buyer, the first valid bid of each buyer counts
+        # return True when every buyer has bid (auction finished)
+        ###########################
+        if auction.status != 2 or auction.bids[serial] is not None:
+            return False
+        if not self.buyerInputValid(data, auction, serial):
+            self.send(conn, b'Server: Invalid bid! Please submit a positve integer!\nPlease submit your bid:', MSG_PROMPT)
+            return False
+        auction.cur_num_bids_left -= 1
+        auction.rank(serial)
+        if self.journal is not None:
+            self.journal.append({"ev": "bid", "id": auction.id, "serial": serial, "price": auction.bids[serial]})
+        self.send(conn, b'Server: Bid recieved. Please wait...')
+        print(f'>> Auction {auction.id}: Buyer {serial + 1} bid ${auction.bids[serial]}')
+        if auction.cur_num_bids_left == 0:
+            auction.status = 3
+            return True
+        return False
+
+    def startBidding(self, auction):
+        ###########################
+        # start the bidding, the round closes after bid_timeout seconds at the latest (closeRound)
+        ###########################
+        self.timers.cancel(auction.deadline)
+        auction.deadline = None
+        auction.status = 2
+        auction.bids = [None] * len(auction.buyers)
+        auction.top, auction.second = None, None
+        auction.cur_num_bids_left = auction.cur_num_of_bids
+        frames = [pack_msg(MSG_PROMPT, b'The bidding has started!\nPlease submit your bid:')]
+        if self.bid_timeout:
+            frames.insert(0, pack_msg(MSG_INFO, f'Server: Bids close in {self.bid_timeout:g} seconds.'))
+        self.broadcast({con[0]: frames for con in auction.buyers if con[0] is not None})
+        self.armDeadline(auction)
+
+    def armDeadline(self, auction):
+        if self.bid_timeout:
+            auction.deadline = self.schedule(self.bid_timeout, lambda: self.closeRound(auction))
+
+    def armExpiry(self, auction):
+        if self.open_timeout:
+            auction.deadline = self.schedule(self.open_timeout, lambda: self.expireAuction(auction))
+
+    def expireAuction(self, auction):
+        ###########################
+        # open timeout: an auction still waiting for buyers is cancelled (abandoned by its seller,
+        # or too few buyers), so it does not stay in the registry forever
+        ###########################
+        with self.lock:
+            if auction.status != 1:
+                return
+            auction.status = 3
+            auction.deadline = None
+            print(f'Auction {auction.id}: {auction.cur_num_of_bids} of {auction.num_of_bids} buyers joined in {self.open_timeout:g} s, cancelled')
+        self.cancelAuction(auction)
+
+    def cancelAuction(self, auction):
+        ###########################
+        # tell the seller and the buyers that joined that the auction is cancelled, then close it like a finished one
+        ###########################
+        text = [pack_msg(MSG_INFO, f'Server: Not enough buyers joined within {self.open_timeout:g} seconds, the auction is cancelled.')]
+        self.broadcast({con[0]: text for con in [auction.seller] + auction.buyers if con[0] is not None})
+        if self.journal is not None:
+            self.journal.append({"ev": "result", "id": auction.id, "item": auction.item_name, "time": time.time(),
+                                 "seller": list(auction.seller[1]), "sold": False, "final_price": None, "winner": None,
+                                 "bids": [], "cancelled": True})
+        self.teardown(auction)
+
+    def closeRound(self, auction):
+        ###########################
+        # bidding deadline: finish the auction with the bids received so far,
+        # buyers that did not bid take no part in the result
         ###########################
-        self.bids = [0] * len(self.buyers)
-        self.cur_num_bids_left = self.cur_num_of_bids
-        for i,con in enumerate(self.buyers):
-            send_text = b'The bidding has started!\nPlease submit your bid:'
-            con[0].send(send_text)
+        with self.lock:
+            if auction.status != 2:
+                return
+            auction.status = 3
+            auction.deadline = None
+            print(f'Auction {auction.id}: bidding closed after {self.bid_timeout:g} s, {auction.cur_num_bids_left} buyers did not bid')
+        self.manifestWinner(auction)
 
-    def manifestWinner(self):
+    def manifestWinner(self, auction):
         ###########################
         # prompy result to seller and buyer
-        # if lowest price > all bid price: 
+        # if lowest price > all bid price:
         #   auction failed
         # else if type == 1:
         #   winner == highest bid, bid price == highest bid
         # else if type == 2:
         #   winner == highest bid, bid price == second highest bid
+        # the top two bids are kept by Auction.rank as they arrive, so nothing is sorted here
+        # every participant's messages are framed into one buffer and sent to all of them at once (broadcast)
         ###########################
-        self.seller[0].send(b'Auction Finished!')
-        for conn in self.buyers:
-            conn[0].send(b'Auction Finished!')
-        # bids' value smaller than lowest price
-        sort_index = self.argsort(self.bids)
-        if self.lowest_price > self.bids[sort_index[0]]:
-            self.seller[0].send(b'Unfortunately your item was not sold in the action')
-            for con in self.buyers:
-                con[0].send(b'Unfortunately you did not win in the last round')
-            print('Unfortunately the Item is not sold')
+        self.timers.cancel(auction.deadline)
+        auction.deadline = None
+        out = {}
+        def post(conn, text, type = MSG_INFO):
+            if conn is not None:
+                out.setdefault(conn, []).append(pack_msg(type, text))
+        for con, bid in zip(auction.buyers, auction.bids):
+            if bid is None:
+                post(con[0], b'Server: Bidding time is over, your bid was not received.')
+        post(auction.seller[0], b'Auction Finished!')
+        for conn in auction.buyers:
+            post(conn[0], b'Auction Finished!')
+        # bids' value smaller than lowest price, or no bid before the deadline
+        winner = auction.top
+        sold = winner is not None and auction.lowest_price <= auction.bids[winner]
+        relayed = False
+        if not sold:
+            post(auction.seller[0], b'Unfortunately your item was not sold in the action')
+            for con in auction.buyers:
+                post(con[0], b'Unfortunately you did not win in the last round')
+            print(f'Auction {auction.id}: Unfortunately the Item is not sold')
         else:
             # auction type 1 and 2 output different price
-            if self.type == 1:
-                self.final_price = self.bids[sort_index[0]]
-            elif self.type == 2:
-                self.final_price = self.bids[sort_index[1]]
+            if auction.type == 1 or auction.second is None:
+                auction.final_price = auction.bids[winner]
+            elif auction.type == 2:
+                auction.final_price = auction.bids[auction.second]
             # prompt seller and buyers the result
-            send_text = f'Success! Your item {self.item_name} has been sold for ${self.final_price}. '
-            # self.seller.send(send_text.encode())
-            for i, con in enumerate(self.buyers):
-                if i == sort_index[0]:
-                    text = f'You won this item {self.item_name}! Your payment due is ${self.final_price}. '
-                    text += f'Seller IP: {self.seller[1][0]}'
-                    send_text += f'Buyer IP: {con[1][0]}'
-                    con[0].send(text.encode())
+            # relay mode: the winner gets the item from the Auctioneer (its address on the winner's connection)
+            seller_ip, winner_ip = auction.seller[1][0], auction.buyers[winner][1][0]
+            winner_conn = auction.buyers[winner][0]
+            relayed = self.relay is not None and auction.item is not None and auction.item in self.relay.cache \
+                      and winner_conn is not None and winner_conn.fileno() != -1
+            for i, con in enumerate(auction.buyers):
+                if i == winner:
+                    post(con[0], f'You won this item {auction.item_name}! Your payment due is ${auction.final_price}. Seller IP: {seller_ip}')
+                    post(con[0], f'seller {winner_conn.getsockname()[0] if relayed else seller_ip}', MSG_PEER)
                 else:
-                    con[0].send(b'Unfortunately you did not win in the last round.')
-            print(f'Item sold! The highest bid is ${self.bids[sort_index[0]]}. The actual payment is ${self.final_price}')
-            self.seller[0].send(send_text.encode())
-        time.sleep(1)
-        # close connection
-        self.closeConnection(self.seller[0])
-        for con in self.buyers:
-            self.closeConnection(con[0])
-        # clear variabels
-        self.clear()
-
-    def closeConnection(self, conn):
-        ###########################
-        # close connection         
-        # #########################       
-        conn.send(b'Disconnecting from the Auctioneer server. Auction is over!')
-        conn.close()
-
-    def clear(self):
-        ###########################
-        # clear all variabels and wait to srtart a new auction        
-        # ######################### 
-        self.status = -1
-        self.type = 0
-        self.lowest_price = 0
-        self.num_of_bids = 0
-        self.cur_num_of_bids = 0
-        self.item_name = ''
-        self.seller = None
-        self.buyers = []
-        self.bids = []
-        self.cur_num_bids_left = 0
-        self.final_price = 0
+                    post(con[0], b'Unfortunately you did not win in the last round.')
+            print(f'Auction {auction.id}: Item sold! The highest bid is ${auction.bids[winner]}. The actual payment is ${auction.final_price}')
+            post(auction.seller[0], f'Success! Your item {auction.item_name} has been sold for ${auction.final_price}. Buyer IP: {winner_ip}')
+            if relayed:
+                post(auction.seller[0], b'Server: The Auctioneer sends your item to the buyer.')
+            else:
+                post(auction.seller[0], f'buyer {winner_ip}', MSG_PEER)
+        self.broadcast(out)
+        if sold and relayed:
+            self.relay.deliver(auction.item, winner_ip)
+        if self.journal is not None:
+            self.journal.append({"ev": "result", "id": auction.id, "item": auction.item_name, "time": time.time(),
+                                 "seller": list(auction.seller[1]), "sold": sold, "final_price": auction.final_price if sold else None,
+                                 "winner": list(auction.buyers[winner][1]) if sold else None, "bids": auction.bids})
+        self.teardown(auction)
+
+    def broadcast(self, out, close = False):
+        ###########################
+        # send the framed messages of every connection (conn -> list of frames) without waiting for any client:
+        # each connection gets its frames in one send, the Outbox of a connection that is not writable
+        # right now (client not reading) sends them from its writer thread, so it does not hold up the others
+        # close: close every connection once its frames are sent
+        ###########################
+        for conn, frames in out.items():
+            self.deliver(conn, b''.join(frames), close)
+
+    def deliver(self, conn, data, close):
+        ###########################
+        # queue already framed data on the connection's Outbox, then close the connection if asked to
+        ###########################
+        outbox = self.outboxes.get(conn)
+        if outbox is not None:
+            outbox.put(data, close)
+
+    def sendTicket(self, conn, auction, serial):
+        ###########################
+        # tell a participant (serial -1: the seller) how to get back into the auction after a disconnect
+        ###########################
+        if self.journal is not None:
+            self.send(conn, f"Server: If the connection is lost, reconnect with: resume {auction.id} {auction.tickets[serial + 1]}".encode())
+
+    def resumeAuction(self, conn, addr, data):
+        ###########################
+        # "resume <id> <ticket>": a seller or buyer of auction id gets their place back on this connection
+        # (after losing the connection, or after the server restarted and restored the auction from the journal)
+        # return (auction, buyer serial or -1), or None if the ticket does not match
+        ###########################
+        splt = data.split(' ')
+        auction = self.auctions.get(int(splt[1])) if len(splt) == 3 and splt[1].isdigit() else None
+        if auction is None or splt[2] not in auction.tickets or auction.status == 3:
+            self.send(conn, b'Server: No such auction to resume.\n' + self.greeting(), MSG_PROMPT)
+            return None
+        serial = auction.tickets.index(splt[2]) - 1
+        self.journal.append({"ev": "resume", "id": auction.id, "serial": serial, "addr": list(addr)})
+        if serial < 0:
+            auction.seller = (conn, addr)
+            self.send(conn, f'Your Role is: [Seller]\nServer: Auction resumed. Auction id: {auction.id}'.encode())
+        else:
+            auction.buyers[serial] = (conn, addr)
+            self.send(conn, f'Your Role is: [Buyer] in auction {auction.id} ({auction.item_name}), resumed'.encode())
+            if auction.status == 2 and auction.bids[serial] is None:
+                self.send(conn, b'The bidding has started!\nPlease submit your bid:', MSG_PROMPT)
+        print(f'Auction {auction.id}: {"Seller" if serial < 0 else f"Buyer {serial + 1}"} resumed from {addr[0]}:{addr[1]}')
+        return auction, serial
+
+    def restore(self):
+        ###########################
+        # rebuild the auctions of the journal, their participants are disconnected until they resume
+        # an auction whose bids were all in when the server stopped is finished right away
+        ###########################
+        if self.journal is None:
+            return
+        finished = []
+        for state in self.journal.live.values():
+            auction = Auction(state["id"], state["type"], state["lowest_price"], state["num_of_bids"], state["item"],
+                              (None, tuple(state["seller"])))
+            auction.buyers = [(None, tuple(addr)) for addr in state["buyers"]]
+            auction.cur_num_of_bids = len(auction.buyers)
+            auction.tickets = list(state["tickets"])
+            if auction.cur_num_of_bids == auction.num_of_bids:
+                auction.status = 2
+                auction.bids = [state["bids"].get(str(i)) for i in range(auction.cur_num_of_bids)]
+                auction.cur_num_bids_left = auction.bids.count(None)
+                for serial, bid in enumerate(auction.bids):
+                    if bid is not None:
+                        auction.rank(serial)
+                if auction.cur_num_bids_left == 0:
+                    auction.status = 3
+                    finished.append(auction)
+                else:
+                    # the buyers get a whole round again, they have to resume first
+                    self.armDeadline(auction)
+            else:
+                self.armExpiry(auction)
+            self.auctions[auction.id] = auction
+            self.next_id = max(self.next_id, auction.id + self.id_step)
+        print(f'Restored {len(self.auctions)} auctions from {self.journal.path}')
+        for auction in finished:
+            self.manifestWinner(auction)
+
+    def teardown(self, auction):
+        ###########################
+        # give clients a second to read the result, then close all connections
+        # of the auction and remove it from the registry
+        # a timer does it, the bidding thread (or event loop) goes on right away
+        ###########################
+        def close_auction():
+            # close connection
+            bye = [pack_msg(MSG_BYE, b'Disconnecting from the Auctioneer server. Auction is over!')]
+            self.broadcast({con[0]: bye for con in [auction.seller] + auction.buyers if con[0] is not None}, close = True)
+            # remove auction
+            self.clear(auction)
+        self.schedule(1, close_auction)
+
+    def send(self, conn, data, type = MSG_INFO):
+        ###########################
+        # send a framed message to a client without waiting for it (see Outbox)
+        # conn is None while a restored participant has not resumed, type None sends data as is (already framed)
+        ###########################
+        if conn is None:
+            return
+        self.deliver(conn, pack_msg(type, data) if type is not None else data, False)
+
+    def register(self, auction):
+        ###########################
+        # add a new auction to the registry (called holding self.lock, before the seller is answered)
+        ###########################
+        self.auctions[auction.id] = auction
+
+    def clear(self, auction):
+        ###########################
+        # remove a finished auction from the registry
+        # #########################
+        with self.lock:
+            self.auctions.pop(auction.id, None)
 
     def sellerInputValid(self, data) -> bool:
         ###########################
         # check seller input
-        # type of auction == 1 or 
+        # type of auction == 1 or
         # lowest price >= 0
         # numbers of bids between [1-10]
-        # item name is string and characther lenght > 255         
-        # ######################### 
+        # item name is string and characther lenght > 255
+        # #########################
         splt = data.split(' ')
         if len(splt) != 4:
             return False
@@ -241,56 +1185,492 @@ class ThreadedServer():
         elif splt[3].isdigit() or len(splt[3]) > 255: # item name
             return False
         else:
-            self.type = int(splt[0])
-            self.lowest_price = int(splt[1])
-            self.num_of_bids = int(splt[2])
-            self.item_name = splt[3]
             return True
 
-    def buyerInputValid(self, data, serial) -> bool:
+    def buyerInputValid(self, data, auction, serial) -> bool:
         ###########################
         # check buyer input
-        # input >= 0     
-        # ######################### 
+        # input >= 0
+        # #########################
         if not data.isdigit() or int(data) < 0:
             return False
         else:
-            self.bids[serial] = int(data)
+            auction.bids[serial] = int(data)
             return True
-    
-    def argsort(self, lst) -> list:
-        ###########################
-        # retrun sorted list in index        
-        ########################### 
-        temp = []
-        sort_index = []
-        for i, bid in enumerate(lst):
-            temp.append([bid,i])
-        temp.sort(reverse = True)
-        for t in temp:
-            sort_index.append(t[1])
-        return sort_index
+
+class EventLoopServer(ThreadedServer):
+    def __init__(self, host, port, sock=None, journal=None, idle_timeout=60, bid_timeout=60, open_timeout=600, relay=None):
+        ###########################
+        # single-threaded server: one selector serves the listening socket and
+        # every connection, sockets are non-blocking, the event loop runs the timers
+        # variables (besides ThreadedServer's)
+        # sel:                  selector of the listening socket and all connections
+        ############################
+        super().__init__(host, port, sock, journal, idle_timeout, bid_timeout, open_timeout, relay)
+        self.sel = selectors.DefaultSelector()
+
+    def listen(self):
+        ###########################
+        # event loop, same requests as ThreadedServer.listen
+        # wait until a socket is ready or the next tick of the timer wheel (if any timer is pending)
+        ###########################
+        self.restore()
+        self.sock.listen(1024)
+        self.sock.setblocking(False)
+        self.sel.register(self.sock, selectors.EVENT_READ, data = None)
+        try:
+            while True:
+                for key, mask in self.sel.select(timeout = self.timers.timeout(time.time())):
+                    if key.data is None:
+                        self.accept()
+                    else:
+                        self.service_connection(key, mask)
+                self.timers.advance(time.time())
+        except KeyboardInterrupt:
+            print("Caught keyboard interrupt, exiting")
+        finally:
+            self.sel.close()
+            if self.journal is not None:
+                self.journal.close()
+
+    def accept(self):
+        ###########################
+        # accept every pending connection and ask for its request
+        ###########################
+        while True:
+            try:
+                conn, addr = self.sock.accept()
+            except BlockingIOError:
+                return
+            conn.setblocking(False)
+            data = types.SimpleNamespace(addr = addr, auction = None, serial = -1, inb = MessageBuffer(), outb = b"", closing = False,
+                                         last = time.time())
+            self.sel.register(conn, selectors.EVENT_READ, data = data)
+            self.send(conn, b'Connected to the Auctioneer server.')
+            self.send(conn, self.greeting(), MSG_PROMPT)
+            self.watch(conn, data)
+            print(f"Client is connected from {addr[0]}:{addr[1]}")
+
+    def service_connection(self, key, mask):
+        ###########################
+        # read a request or bid of a client, or flush pending output
+        ###########################
+        conn, data = key.fileobj, key.data
+        if mask & selectors.EVENT_READ:
+            try:
+                recv_data = conn.recv(1024)
+            except BlockingIOError:
+                recv_data = None
+            except OSError:
+                recv_data = b""
+            if recv_data == b"":
+                # client closed the connection
+                self.drop(conn)
+                return
+            data.last = time.time()
+            try:
+                msgs = data.inb.feed(recv_data) if recv_data else []
+            except FrameError:
+                self.drop(conn)
+                return
+            for type, text in msgs:
+                if type == MSG_REQUEST and conn.fileno() != -1:
+                    finished = self.onRequest(conn, data, text)
+                    if finished is not None:
+                        self.manifestWinner(finished)
+        if mask & selectors.EVENT_WRITE:
+            self.flush(conn, data)
+
+    def send(self, conn, data, type = MSG_INFO):
+        ###########################
+        # append a framed message to the connection's output buffer and send as much as possible
+        # the rest is sent when the socket becomes writable
+        ###########################
+        if conn is None or conn.fileno() == -1:
+            # client already gone, or a restored participant that has not resumed
+            return
+        state = self.sel.get_key(conn).data
+        state.outb += pack_msg(type, data)
+        self.flush(conn, state)
+
+    def broadcast(self, out, close = False):
+        ###########################
+        # queue the frames of every connection (conn -> list of frames) and flush each connection once
+        # close: close every connection once its frames are sent
+        ###########################
+        for conn, frames in out.items():
+            if conn.fileno() != -1:
+                state = self.sel.get_key(conn).data
+                state.outb += b''.join(frames)
+                state.closing = state.closing or close
+                self.flush(conn, state)
+
+    def flush(self, conn, state):
+        ###########################
+        # send pending output, watch for writability while some is left
+        # close the connection once everything is sent if it is closing
+        ###########################
+        try:
+            sent = conn.send(state.outb) if state.outb else 0
+        except BlockingIOError:
+            sent = 0
+        except OSError:
+            self.drop(conn)
+            return
+        state.outb = state.outb[sent:]
+        if state.outb:
+            self.sel.modify(conn, selectors.EVENT_READ | selectors.EVENT_WRITE, data = state)
+        elif state.closing:
+            self.drop(conn)
+        else:
+            self.sel.modify(conn, selectors.EVENT_READ, data = state)
+
+    def drop(self, conn):
+        ###########################
+        # unregister and close a connection
+        ###########################
+        if conn.fileno() != -1:
+            self.sel.unregister(conn)
+            conn.close()
+
+class ShardWorker(EventLoopServer):
+    def __init__(self, host, port, index, listeners, channels, journal=None, commit_interval=0.005, idle_timeout=60, bid_timeout=60,
+                 open_timeout=600, relay=None):
+        ###########################
+        # one worker process of a ShardedServer, an event loop server owning every
+        # auction whose id is index + 1 (mod number of workers)
+        # a buyer that joins an auction of another worker is handed over to it
+        # (connection fd, pending input and output, and the join request) on the owner's channel,
+        # so a seller and their buyers are always served by the same worker
+        # variables (besides EventLoopServer's)
+        # index:                worker number
+        # workers:              number of workers
+        # inbox:                unix datagram socket receiving handoffs and directory updates
+        # peer_inboxes:         sending end of every worker's inbox (unix datagram socket), by worker number (non-blocking)
+        # backlog:              messages (and fds of connections to pass) waiting for a peer inbox to become writable,
+        #                       by worker number (a unix datagram queue only holds a few messages)
+        # directory:            auctions of the other workers waiting for buyers, id -> (item, buyers joined, buyers wanted)
+        # master:               pid of the ShardedServer process, the worker exits once it is gone
+        # journal:              path of the journals, every worker keeps its own (<journal>.<index>)
+        # relay:                ItemRelay options (dict), every worker keeps its own item cache (<directory>.<index>)
+        ############################
+        super().__init__(host, port, listeners[index],
+                         AuctionJournal(f"{journal}.{index}", commit_interval) if journal else None, idle_timeout, bid_timeout,
+                         open_timeout, ItemRelay(host, **dict(relay, directory = f"{relay['directory']}.{index}")) if relay else None)
+        for sock in listeners:
+            if sock is not self.sock:
+                sock.close()
+        self.index = index
+        self.workers = len(channels)
+        self.next_id = index + 1
+        self.id_step = self.workers
+        self.inbox = channels[index][0]
+        self.peer_inboxes = [peer for inbox, peer in channels]
+        for i, (inbox, peer) in enumerate(channels):
+            peer.setblocking(False)
+            if i != index:
+                inbox.close()
+        self.inbox.setblocking(False)
+        self.backlog = [deque() for peer in self.peer_inboxes]
+        self.directory = {}
+        self.master = os.getppid()
+
+    def listen(self):
+        self.sel.register(self.inbox, selectors.EVENT_READ, data = types.SimpleNamespace())
+        self.watchMaster()
+        super().listen()
+
+    def watchMaster(self):
+        ###########################
+        # every second: exit (closing the listener and the journal) once the master process is gone,
+        # e.g. killed without the chance to stop its workers
+        ###########################
+        if os.getppid() != self.master:
+            print(f"Worker {self.index}: master process is gone, exiting")
+            sys.exit(0)
+        self.schedule(1, self.watchMaster)
+
+    def owner(self, id) -> int:
+        return (id - 1) % self.workers
+
+    def restore(self):
+        super().restore()
+        for auction in self.auctions.values():
+            if auction.status == 1:
+                self.publish(auction)
+
+    def service_connection(self, key, mask):
+        if key.fileobj is self.inbox:
+            self.receive()
+        elif key.fileobj in self.peer_inboxes:
+            self.forward(self.peer_inboxes.index(key.fileobj))
+        else:
+            # directory updates are posted before the owner answers its seller, reading them first
+            # lets a buyer joining right after the auction opened find it here
+            self.receive()
+            super().service_connection(key, mask)
+
+    def onRequest(self, conn, data, text):
+        ###########################
+        # a join or resume request for an auction of another worker hands the client over to it
+        ###########################
+        if data.auction is None and text.split(' ')[0] in ('join', 'resume'):
+            owner = self.route(text)
+            if owner != self.index:
+                self.handoff(conn, data, owner, text)
+                return None
+        return super().onRequest(conn, data, text)
+
+    def route(self, text) -> int:
+        ###########################
+        # worker owning the auction of a join request
+        # "join <id>" goes to the owner of id, "join <item>" and "join" (oldest) to the owner of
+        # the first match here or in the directory; unknown auctions are answered here
+        # the owner handles the request as is, so a "join" racing for a full auction gets another one of the owner
+        ###########################
+        splt = text.split(' ')
+        if len(splt) > 1 and splt[1].isdigit():
+            return self.owner(int(splt[1]))
+        candidates = [id for id, item, cur, num in self.openAuctions() if len(splt) == 1 or item == splt[1]]
+        return self.owner(min(candidates)) if candidates else self.index
+
+    def openAuctions(self) -> list:
+        ###########################
+        # open auctions of this worker and of the others (directory)
+        ###########################
+        return super().openAuctions() + [(id, item, cur, num) for id, (item, cur, num) in self.directory.items()]
+
+    def register(self, auction):
+        # published before the seller learns the auction id, so a buyer it tells finds the auction on every worker
+        super().register(auction)
+        self.publish(auction)
+
+    def joinAuction(self, conn, addr, data):
+        joined = super().joinAuction(conn, addr, data)
+        if joined is not None:
+            self.publish(joined[0])
+        return joined
+
+    def cancelAuction(self, auction):
+        # the other workers drop it from their directory
+        self.publish(auction)
+        super().cancelAuction(auction)
+
+    def publish(self, auction):
+        ###########################
+        # tell the other workers whether auction is waiting for buyers (listed in their greetings)
+        ###########################
+        msg = json.dumps({"op": "auction", "id": auction.id, "item": auction.item_name, "cur": auction.cur_num_of_bids,
+                          "num": auction.num_of_bids, "open": auction.status == 1}).encode()
+        for i in range(self.workers):
+            if i != self.index:
+                self.post(i, msg)
+
+    def handoff(self, conn, data, owner, text):
+        ###########################
+        # pass the connection to the worker owner, with its unread input, unsent output and join request
+        ###########################
+        msg = json.dumps({"op": "handoff", "addr": list(data.addr), "request": text,
+                          "inb": bytes(data.inb.buf).decode("latin-1"), "outb": data.outb.decode("latin-1")}).encode()
+        self.sel.unregister(conn)
+        self.post(owner, msg, conn.detach())
+
+    def post(self, worker, msg, fd=None):
+        ###########################
+        # send msg (and fd) to a worker's inbox, queue it while the inbox is full
+        # fd is closed here once it has been passed on
+        ###########################
+        self.backlog[worker].append((msg, fd))
+        if len(self.backlog[worker]) == 1:
+            self.forward(worker)
+
+    def forward(self, worker):
+        ###########################
+        # send the backlog of a worker until its inbox is full, watch for writability while some is left
+        ###########################
+        peer, backlog = self.peer_inboxes[worker], self.backlog[worker]
+        while backlog:
+            msg, fd = backlog[0]
+            try:
+                socket.send_fds(peer, [msg], [fd] if fd is not None else [])
+            except BlockingIOError:
+                break
+            backlog.popleft()
+            if fd is not None:
+                os.close(fd)
+        watched = peer in self.sel.get_map()
+        if backlog and not watched:
+            self.sel.register(peer, selectors.EVENT_WRITE, data = types.SimpleNamespace())
+        elif not backlog and watched:
+            self.sel.unregister(peer)
+
+    def receive(self):
+        ###########################
+        # every directory update and handed over connection queued by the other workers
+        ###########################
+        while True:
+            try:
+                msg, fds, _, _ = socket.recv_fds(self.inbox, 1 << 16, 1)
+            except (BlockingIOError, InterruptedError):
+                return
+            msg = json.loads(msg)
+            if msg["op"] == "handoff":
+                self.adopt(msg, fds[0])
+            elif msg["open"]:
+                self.directory[msg["id"]] = (msg["item"], msg["cur"], msg["num"])
+            else:
+                self.directory.pop(msg["id"], None)
+
+    def adopt(self, msg, fd):
+        ###########################
+        # serve a connection handed over by another worker and handle its join request
+        ###########################
+        conn = socket.socket(fileno = fd)
+        conn.setblocking(False)
+        data = types.SimpleNamespace(addr = tuple(msg["addr"]), auction = None, serial = -1, inb = MessageBuffer(),
+                                     outb = msg["outb"].encode("latin-1"), closing = False, last = time.time())
+        data.inb.buf += msg["inb"].encode("latin-1")
+        self.sel.register(conn, selectors.EVENT_READ, data = data)
+        self.flush(conn, data)
+        self.watch(conn, data)
+        requests = [msg["request"]] + [text for type, text in data.inb.feed(b"") if type == MSG_REQUEST]
+        for text in requests:
+            if conn.fileno() != -1:
+                finished = self.onRequest(conn, data, text)
+                if finished is not None:
+                    self.manifestWinner(finished)
+
+class ShardedServer():
+    def __init__(self, host, port, workers, journal=None, commit_interval=0.005, idle_timeout=60, bid_timeout=60, open_timeout=600,
+                 relay=None):
+        ###########################
+        # pre-fork server: workers processes (ShardWorker) serve the port on every core
+        # with SO_REUSEPORT every worker has its own welcoming socket and the kernel spreads
+        # the connections over them, otherwise they accept on one shared socket
+        # variables
+        # listeners:            welcoming socket of every worker (the same one without SO_REUSEPORT)
+        # channels:             (inbox, outbox) unix datagram socket pair of every worker
+        # procs:                worker processes
+        # journal:              journal path of the workers (None: no journal)
+        # commit_interval:      group commit interval of their journals
+        # idle_timeout/bid_timeout/open_timeout: timeouts of the workers (see ThreadedServer)
+        # relay:                ItemRelay options of the workers (dict, see ShardWorker), None: no relay
+        ############################
+        self.host = host
+        self.port = port
+        self.journal = journal
+        self.commit_interval = commit_interval
+        self.idle_timeout = idle_timeout
+        self.bid_timeout = bid_timeout
+        self.open_timeout = open_timeout
+        self.relay = relay
+        if hasattr(socket, "SO_REUSEPORT"):
+            self.listeners = [listener(host, port, reuse_port = True) for i in range(workers)]
+        else:
+            self.listeners = [listener(host, port)] * workers
+        self.channels = [socket.socketpair(socket.AF_UNIX, socket.SOCK_DGRAM) for i in range(workers)]
+        self.procs = []
+        print(f'Auctioneer is ready for hosting acutions! ({workers} worker processes)')
+
+    def listen(self):
+        ###########################
+        # fork the workers (they inherit the sockets) and wait for them
+        # SIGTERM and SIGHUP stop the workers like a keyboard interrupt does (see stop)
+        ###########################
+        ctx = multiprocessing.get_context("fork")
+        for i in range(len(self.channels)):
+            self.procs.append(ctx.Process(target = self.work, args = (i,)))
+            self.procs[-1].start()
+        for sock in set(self.listeners):
+            sock.close()
+        for signum in (signal.SIGTERM, signal.SIGHUP):
+            signal.signal(signum, self.stop)
+        try:
+            for proc in self.procs:
+                proc.join()
+        except KeyboardInterrupt:
+            print("Caught keyboard interrupt, exiting")
+            self.stop()
+
+    def stop(self, signum=None, frame=None):
+        ###########################
+        # terminate the workers and wait for them, then exit (also the SIGTERM / SIGHUP handler)
+        ###########################
+        for proc in self.procs:
+            proc.terminate()
+            proc.join()
+        sys.exit(0)
+
+    def work(self, index):
+        ShardWorker(self.host, self.port, index, self.listeners, self.channels, self.journal,
+                    self.commit_interval, self.idle_timeout, self.bid_timeout, self.open_timeout, self.relay).listen()
+
+def parse_options(argv) -> tuple:
+    ###########################
+    # split command line into positional arguments and --key=value options
+    # options:
+    #   --engine=threaded|selectors     thread per connection or single-threaded event loop
+    #   --workers=N                     N event loop worker processes sharing the port (N > 1 implies selectors)
+    #   --journal=PATH                  journal the auctions to PATH (PATH.<worker> with workers) and restore them on startup
+    #   --commit-ms=MS                  group commit interval of the journal
+    #   --idle=SEC                      disconnect clients that are not in an auction after SEC silent seconds (0: never)
+    #   --bid-timeout=SEC               close a bidding round after SEC seconds with the bids received (0: never)
+    #   --open-timeout=SEC              cancel an auction that is still waiting for buyers after SEC seconds (0: never)
+    #   --relay=PORT                    relay mode: sellers upload their item to the Auctioneer, which sends it to the winner's UDP PORT
+    #   --cache-dir=PATH                item cache of the relay (PATH.<worker> with workers)
+    #   --cache-mem=MB                  items kept in memory, the least recently used ones are spilled to the cache directory
+    #   --cache-disk=MB                 items kept on disk, the least recently used ones are removed
+    ###########################
+    args, opts = [], {"engine": "threaded", "workers": "1", "journal": "", "commit_ms": "5", "idle": "60", "bid_timeout": "60",
+                      "open_timeout": "600", "relay": "", "cache_dir": "item_cache", "cache_mem": "64", "cache_disk": "1024"}
+    for arg in argv:
+        if arg.startswith("--") and "=" in arg:
+            key, value = arg[2:].split("=", 1)
+            opts[key.replace("-", "_")] = value
+        else:
+            args.append(arg)
+    return args, opts
 
 if __name__ == "__main__":
     # regex pattern of valid IP address
     host = '127.0.0.1'
     port = 0
+    args, opts = parse_options(sys.argv[1:])
     # check input format
-    if len(sys.argv) == 3:
-        host = sys.argv[1]
-        port = sys.argv[2]
-    elif len(sys.argv) == 2:
-        port = sys.argv[1]
+    valid = opts["engine"] in ("threaded", "selectors") and opts["workers"].isdigit() and int(opts["workers"]) >= 1 \
+            and opts["idle"].replace(".", "", 1).isdigit() and opts["bid_timeout"].replace(".", "", 1).isdigit() \
+            and opts["open_timeout"].replace(".", "", 1).isdigit() \
+            and (opts["relay"] == "" or opts["relay"].isdigit()) and opts["cache_mem"].isdigit() and opts["cache_disk"].isdigit()
+    if len(args) == 2 and valid:
+        host = args[0]
+        port = args[1]
+    elif len(args) == 1 and valid:
+        port = args[0]
     else:
         print(f"Usage: {sys.argv[0]} <port>")
         print(f"Usage: {sys.argv[0]} <host> <port>")
+        print("Options: --engine=threaded|selectors --workers=<N> --journal=<path> --commit-ms=<ms> --idle=<sec> --bid-timeout=<sec> --open-timeout=<sec>")
+        print("Relay: --relay=<rdt port> --cache-dir=<path> --cache-mem=<MB> --cache-disk=<MB>")
         print('port should be in range 3000-5000')
         sys.exit(1)
     # port should be in range 3000 - 5000
     if not port.isdigit() or int(port) < 3000 or int(port) > 5000:
         print('Please enter port number between 3000 - 5000')
         sys.exit(1)
-    # run multithread server
-    auc_server = ThreadedServer(host, int(port))
+    # run multithread, event loop or multi-process server
+    idle, bid_timeout, open_timeout = float(opts["idle"]), float(opts["bid_timeout"]), float(opts["open_timeout"])
+    relay = {"port": int(opts["relay"]), "directory": opts["cache_dir"], "memory_bytes": int(opts["cache_mem"]) << 20,
+             "disk_bytes": int(opts["cache_disk"]) << 20} if opts["relay"] else None
+    if int(opts["workers"]) > 1:
+        auc_server = ShardedServer(host, int(port), int(opts["workers"]), opts["journal"] or None, float(opts["commit_ms"]) / 1000,
+                                   idle, bid_timeout, open_timeout, relay)
+    else:
+        journal = AuctionJournal(opts["journal"], float(opts["commit_ms"]) / 1000) if opts["journal"] else None
+        relay = ItemRelay(host, **relay) if relay else None
+        if opts["engine"] == "selectors":
+            auc_server = EventLoopServer(host, int(port), journal = journal, idle_timeout = idle, bid_timeout = bid_timeout,
+                                         open_timeout = open_timeout, relay = relay)
+        else:
+            auc_server = ThreadedServer(host, int(port), journal = journal, idle_timeout = idle, bid_timeout = bid_timeout,
+                                        open_timeout = open_timeout, relay = relay)
     auc_server.listen()
-
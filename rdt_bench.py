@@ -0,0 +1,317 @@
+#################################
+# Author: Po-Hsun Lin
+#################################
+import sys
+import os
+import csv
+import json
+import queue
+import random
+import shutil
+import tempfile
+import itertools
+import multiprocessing
+import time
+from auc_client_rdt import *
+
+###########################
+# result columns, in csv order
+###########################
+FIELDS = ["mode", "loss", "chunk_size", "window", "codec", "file_size", "run", "ok", "verified", "elapsed_s",
+          "throughput_bytes_per_s", "compression_ratio", "payload_bytes", "data_packets", "retransmits", "retransmits_timeout", "retransmits_drop", "retransmits_mismatch", "retransmits_corrupt",
+          "retransmits_dup_ack", "duplicates", "timeouts", "rtt_samples", "srtt_ms", "rttvar_ms", "min_rtt_ms", "max_rtt_ms",
+          "rto_ms", "error"]
+# trial parameters that identify a row when comparing against a baseline
+KEY = ("mode", "loss", "chunk_size", "window", "codec", "file_size")
+# words of the compressible (text) test file
+WORDS = ("lorem ipsum dolor sit amet consectetur adipiscing elit sed do eiusmod tempor incididunt ut labore et dolore "
+         "magna aliqua velit scelerisque in dictum non erat justo donec enim diam vulputate").split()
+
+def parse_size(text) -> int:
+    ###########################
+    # "2167739", "64k" or "2m" to bytes
+    ###########################
+    units = {"k": 1 << 10, "m": 1 << 20, "g": 1 << 30}
+    text = text.strip().lower()
+    if text and text[-1] in units:
+        return int(float(text[:-1]) * units[text[-1]])
+    return int(text)
+
+def silence():
+    ###########################
+    # send the remaining output (final result lines) of a worker process to /dev/null
+    ###########################
+    sys.stdout.flush()
+    devnull = os.open(os.devnull, os.O_WRONLY)
+    os.dup2(devnull, sys.stdout.fileno())
+    os.close(devnull)
+
+def run_receiver(results, workdir, port, prob, seed, kwargs):
+    ###########################
+    # worker process: winner buyer side of a trial, receives workdir/recved.file
+    ###########################
+    os.chdir(workdir)
+    silence()
+    server = UDPServer("127.0.0.1", port, prob, seed=seed, **kwargs)
+    server.recv()
+    results.put(("recv", {"file_length": server.file_length, "start_time": server.start_time, "end_time": server.end_time,
+                          "verified": server.verified, "duplicates": server.metrics.duplicates,
+                          "compression_ratio": round(server.codec.ratio(), 3) if server.codec is not None else None,
+                          "payload_bytes": server.metrics.useful_bytes}))
+
+def run_sender(results, workdir, port, prob, seed, kwargs):
+    ###########################
+    # worker process: seller side of a trial, sends workdir/tosend.file
+    ###########################
+    os.chdir(workdir)
+    silence()
+    client = UDPClient("127.0.0.1", port, prob, cc=RenoControl(), seed=seed, **kwargs)
+    client.send()
+    metrics = client.metrics.to_dict()
+    stats = {"data_packets": metrics["data_packets"], "retransmits": metrics["retransmits"]}
+    stats.update(("retransmits_" + cause, count) for cause, count in metrics["retransmits_by_cause"].items())
+    stats.update(("rtt_" + key if key == "samples" else key.replace("min_", "min_rtt_").replace("max_", "max_rtt_"), value)
+                 for key, value in metrics["rtt"].items())
+    results.put(("send", stats))
+
+class RDTBenchmark():
+
+    def __init__(self, port, modes=("sw",), losses=(0.1,), chunk_sizes=(2000,), windows=(32,), file_sizes=(2167739,), runs=1,
+                 seed=1, timeout=120, batch=64, impairment=None, codecs=("none",), content="random"):
+        ###########################
+        # run UDPClient/UDPServer pairs as local processes on loopback, one trial per parameter combination
+        # both sides drop packets with probability loss, as in the auction client
+        # variables
+        # port:                 UDP port of the receiver
+        # modes/losses/chunk_sizes/windows/codecs/file_sizes:
+        #                       values swept (window is only used by gbn/sr, sw runs once per combination),
+        #                       codecs are ChunkCodec specs ("none", "zlib:6", "lzma:1", ...)
+        # runs:                 trials per combination
+        # seed:                 seed of the file content and the packet loss, same drops for the same seed
+        # timeout:              seconds allowed per trial, a trial still running afterwards is killed and reported as failed
+        # impairment:           Impairment applied by both sides to the packets they send (None: loopback as is),
+        #                       reseeded for every trial
+        # content:              "random" bytes (incompressible) or "text" (seeded random words) in tosend.file
+        # workdir:              temporary directory holding tosend.file and recved.file
+        # file_seed:            seed tosend.file was written with (rewritten only when size or seed change)
+        # rows:                 one result dict per trial (FIELDS)
+        ############################
+        self.port = port
+        self.modes = modes
+        self.losses = losses
+        self.chunk_sizes = chunk_sizes
+        self.windows = windows
+        self.file_sizes = file_sizes
+        self.runs = runs
+        self.seed = seed
+        self.timeout = timeout
+        self.batch = batch
+        self.impairment = impairment
+        self.codecs = codecs
+        self.content = content
+        self.workdir = None
+        self.file_seed = None
+        self.rows = []
+
+    def trials(self) -> list:
+        ###########################
+        # every (mode, loss, chunk_size, window, codec, file_size, run) to measure
+        ###########################
+        trials = []
+        for mode, loss, chunk_size, window, codec, file_size in itertools.product(self.modes, self.losses, self.chunk_sizes,
+                                                                                self.windows, self.codecs, self.file_sizes):
+            if mode == "sw" and window != self.windows[0]:
+                continue
+            for run in range(self.runs):
+                trials.append({"mode": mode, "loss": loss, "chunk_size": chunk_size, "window": window if mode != "sw" else 1,
+                               "codec": codec, "file_size": file_size, "run": run})
+        return trials
+
+    def run(self, progress=None) -> list:
+        ###########################
+        # run every trial, progress(row) is called after each one
+        # return the result rows
+        ###########################
+        self.workdir = tempfile.mkdtemp(prefix = "rdt_bench_")
+        try:
+            for trial in self.trials():
+                self.write_file(trial["file_size"], self.seed + trial["run"])
+                row = self.run_trial(trial)
+                self.rows.append(row)
+                if progress is not None:
+                    progress(row)
+        finally:
+            shutil.rmtree(self.workdir, ignore_errors = True)
+        return self.rows
+
+    def write_file(self, size, seed):
+        ###########################
+        # (re)create tosend.file with size seeded random bytes, or seeded random words (text content)
+        ###########################
+        path = os.path.join(self.workdir, "tosend.file")
+        if os.path.exists(path) and os.path.getsize(path) == size and self.file_seed == seed:
+            return
+        rand = random.Random(seed)
+        with open(path, "wb") as f:
+            if self.content == "text":
+                f.write(" ".join(rand.choices(WORDS, k = size // 3 + 1)).encode()[:size])
+            else:
+                f.write(rand.randbytes(size))
+        self.file_seed = seed
+
+    def run_trial(self, trial) -> dict:
+        ###########################
+        # transfer tosend.file once with the trial parameters
+        # the received file and its progress file are removed first, so nothing is resumed
+        ###########################
+        for name in ("recved.file", "recved.file.part"):
+            if os.path.exists(os.path.join(self.workdir, name)):
+                os.remove(os.path.join(self.workdir, name))
+        kwargs = {"mode": trial["mode"], "window": trial["window"], "batch": self.batch, "verbosity": QUIET}
+        seed = self.seed * 1000 + len(self.rows) * 2
+        results = multiprocessing.Queue()
+        recv_kwargs = dict(kwargs)
+        send_kwargs = dict(kwargs, chunk_size = trial["chunk_size"], codec = ChunkCodec.from_spec(trial["codec"]))
+        if self.impairment is not None:
+            recv_kwargs["impairment"] = self.impairment.fork(seed)
+            send_kwargs["impairment"] = self.impairment.fork(seed + 1)
+        receiver = multiprocessing.Process(target = run_receiver,
+                                           args = (results, self.workdir, self.port, trial["loss"], seed, recv_kwargs))
+        sender = multiprocessing.Process(target = run_sender,
+                                         args = (results, self.workdir, self.port, trial["loss"], seed + 1, send_kwargs))
+        receiver.start()
+        time.sleep(0.1)
+        sender.start()
+        row = dict(trial, ok = False, error = "")
+        stats = {}
+        deadline = time.time() + self.timeout
+        try:
+            while len(stats) < 2:
+                role, values = results.get(timeout = max(deadline - time.time(), 0.001))
+                stats[role] = values
+        except queue.Empty:
+            row["error"] = "timeout" if receiver.is_alive() or sender.is_alive() else "worker failed"
+        finally:
+            for worker in (sender, receiver):
+                worker.join(0.5)
+                if worker.is_alive():
+                    worker.terminate()
+                    worker.join()
+        if "send" in stats:
+            row.update(stats["send"])
+        if "recv" in stats:
+            recv = stats["recv"]
+            elapsed = recv["end_time"] - recv["start_time"]
+            row.update({"ok": recv["file_length"] == trial["file_size"] and "send" in stats, "verified": recv["verified"],
+                        "duplicates": recv["duplicates"], "compression_ratio": recv["compression_ratio"],
+                        "payload_bytes": recv["payload_bytes"],
+                        "elapsed_s": round(elapsed, 6), "throughput_bytes_per_s": round(recv["file_length"] / elapsed, 1)})
+            if "send" not in stats and not row["error"]:
+                row["error"] = "sender did not finish"
+        return row
+
+def compare(rows, baseline) -> list:
+    ###########################
+    # throughput of every row against the baseline row with the same parameters
+    # return list of (row, baseline throughput, ratio), runs of a combination are averaged
+    ###########################
+    def average(rows):
+        sums = {}
+        for row in rows:
+            if row.get("throughput_bytes_per_s"):
+                # results recorded before codecs were swept have no codec (raw chunks)
+                sums.setdefault(tuple(row.get(k, "none") for k in KEY), []).append(row["throughput_bytes_per_s"])
+        return {key: sum(values) / len(values) for key, values in sums.items()}
+    current, previous = average(rows), average(baseline)
+    return [(dict(zip(KEY, key)), previous[key], value / previous[key]) for key, value in current.items() if key in previous]
+
+def parse_options(argv) -> tuple:
+    ###########################
+    # split command line into positional arguments and --key=value options
+    # list options take comma separated values
+    # options:
+    #   --mode=sw,gbn,sr        rdt modes
+    #   --loss=P,...            packet loss probabilities
+    #   --chunk=BYTES,...       chunk sizes
+    #   --window=N,...          window sizes (gbn/sr)
+    #   --codec=SPEC,...        chunk compression: none, zlib[:LEVEL], lzma[:LEVEL]
+    #   --size=BYTES,...        file sizes, k/m/g suffixes allowed
+    #   --content=random|text   tosend.file content: random bytes or (compressible) random words
+    #   --runs=N                trials per combination
+    #   --seed=N                seed of the file content and the packet loss
+    #   --timeout=SEC           time allowed per trial
+    #   --batch=N               datagrams per batched send/receive (gbn/sr)
+    #   --json=PATH             write the results as json
+    #   --csv=PATH              write the results as csv
+    #   --baseline=PATH         json results of an earlier run to compare throughput against
+    #   --drop/--burst/--delay/--jitter/--reorder/--duplicate/--corrupt
+    #                           impairments applied by both sides, as in auc_client_rdt.py
+    ###########################
+    args, opts = [], {"mode": "sw", "loss": "0.1,0.2,0.3,0.4,0.5", "chunk": "2000", "window": "32", "codec": "none", "size": "2167739",
+                      "content": "random",
+                      "runs": "1", "seed": "1", "timeout": "120", "batch": "64", "json": "", "csv": "", "baseline": "",
+                      "drop": "0", "burst": "", "delay": "0", "jitter": "0", "reorder": "", "duplicate": "0", "corrupt": "0"}
+    for arg in argv:
+        if arg.startswith("--") and "=" in arg:
+            key, value = arg[2:].split("=", 1)
+            opts[key.replace("-", "_")] = value
+        else:
+            args.append(arg)
+    return args, opts
+
+if __name__ == "__main__":
+    args, opts = parse_options(sys.argv[1:])
+    try:
+        modes = opts["mode"].split(",")
+        losses = [float(x) for x in opts["loss"].split(",")]
+        chunk_sizes = [int(x) for x in opts["chunk"].split(",")]
+        windows = [int(x) for x in opts["window"].split(",")]
+        file_sizes = [parse_size(x) for x in opts["size"].split(",")]
+        codecs = opts["codec"].split(",")
+        for spec in codecs:
+            ChunkCodec.from_spec(spec)
+        valid = all(m in ("sw", "gbn", "sr") for m in modes) and all(0 <= p < 1 for p in losses) \
+            and all(1 <= c <= 65507 - HEADER.size - 1 for c in chunk_sizes) and all(w >= 1 for w in windows) \
+            and opts["content"] in ("random", "text")
+        impairment = parse_impairment(opts)
+    except ValueError:
+        valid = False
+    # check input format
+    if len(args) != 1 or not args[0].isdigit() or not valid:
+        print(f"Usage: {sys.argv[0]} <rdt_port>")
+        print("Options: --mode=sw,gbn,sr --loss=<p,...> --chunk=<bytes,...> --window=<packets,...> --codec=<none|zlib|lzma[:level],...> --size=<bytes,...> --content=random|text --runs=<N> --seed=<N> --timeout=<sec> --batch=<datagrams> --json=<path> --csv=<path> --baseline=<path>")
+        print("Impairments: --drop=<p> --burst=<p,r[,loss]> --delay=<ms> --jitter=<ms> --reorder=<p[,ms]> --duplicate=<p> --corrupt=<p>")
+        sys.exit(1)
+    bench = RDTBenchmark(int(args[0]), modes, losses, chunk_sizes, windows, file_sizes, int(opts["runs"]), int(opts["seed"]),
+                         float(opts["timeout"]), int(opts["batch"]), impairment, codecs, opts["content"])
+    print("{:<4} {:>5} {:>6} {:>6} {:>7} {:>10} {:>4} {:>14} {:>10} {:>6} {:>11} {:>9}".format(
+        "mode", "loss", "chunk", "window", "codec", "size", "run", "bytes/s", "seconds", "ratio", "retransmits", "srtt ms"))
+    def progress(row):
+        if not row["ok"]:
+            print("{:<4} {:>5} {:>6} {:>6} {:>7} {:>10} {:>4} failed: {}".format(row["mode"], row["loss"], row["chunk_size"],
+                                                                                row["window"], row["codec"], row["file_size"],
+                                                                                row["run"], row["error"] or "incomplete file"))
+            return
+        print("{:<4} {:>5} {:>6} {:>6} {:>7} {:>10} {:>4} {:>14.1f} {:>10.6f} {:>6} {:>11} {:>9}".format(
+            row["mode"], row["loss"], row["chunk_size"], row["window"], row["codec"], row["file_size"], row["run"],
+            row["throughput_bytes_per_s"], row["elapsed_s"], row["compression_ratio"] or "-", row["retransmits"], row["srtt_ms"]))
+    rows = bench.run(progress)
+    if opts["json"]:
+        with open(opts["json"], "w") as f:
+            json.dump({"seed": bench.seed, "content": bench.content, "impairment": {key: opts[key] for key in ("drop", "burst", "delay", "jitter", "reorder",
+                                                                               "duplicate", "corrupt")},
+                       "results": rows}, f, indent = 2)
+    if opts["csv"]:
+        with open(opts["csv"], "w", newline = "") as f:
+            writer = csv.DictWriter(f, fieldnames = FIELDS, extrasaction = "ignore")
+            writer.writeheader()
+            writer.writerows(rows)
+    if opts["baseline"]:
+        with open(opts["baseline"]) as f:
+            baseline = json.load(f)["results"]
+        print("Throughput against {}:".format(opts["baseline"]))
+        for params, previous, ratio in compare(rows, baseline):
+            print("  {}: {:.1f} -> {:.1f} bytes/s ({:+.1f}%)".format(" ".join("{}={}".format(k, v) for k, v in params.items()),
+                                                                  previous, previous * ratio, (ratio - 1) * 100))
+    if not all(row["ok"] for row in rows):
+        sys.exit(1)